@@ -3,7 +3,7 @@ AITI Assistant - Chat API
 Endpoints for chatbot functionality.
 """
 
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from fastapi import APIRouter, HTTPException, Request, Depends
 from pydantic import BaseModel, Field
 import structlog
@@ -12,6 +12,7 @@ from datetime import datetime
 
 from app.config import settings
 from app.rag.chain import RAGChain
+from app.tenants import TenantConfig
 
 logger = structlog.get_logger()
 router = APIRouter()
@@ -36,14 +37,36 @@ class ChatResponse(BaseModel):
     timestamp: str = Field(..., description="Response timestamp")
 
 
-# In-memory conversation store (replace with database in production)
-conversations: Dict[str, List[Dict[str, str]]] = {}
+# In-memory conversation store keyed by (tenant ID, conversation ID)
+# (replace with database in production)
+conversations: Dict[Tuple[str, str], List[Dict[str, str]]] = {}
 
 
-def get_rag_chain(request: Request) -> RAGChain:
+def get_tenant(request: Request) -> TenantConfig:
+    """Dependency to select the tenant from the API key or X-Tenant-ID header."""
+    api_key = request.headers.get("X-API-Key")
+    authorization = request.headers.get("Authorization", "")
+    if not api_key and authorization.startswith("Bearer "):
+        api_key = authorization[len("Bearer "):].strip()
+    
+    try:
+        return request.app.state.tenants.resolve(
+            tenant_id=request.headers.get("X-Tenant-ID"),
+            api_key=api_key
+        )
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Tenant not found")
+    except PermissionError:
+        raise HTTPException(status_code=401, detail="Invalid API key for tenant")
+
+
+def get_rag_chain(
+    request: Request,
+    tenant: TenantConfig = Depends(get_tenant)
+) -> RAGChain:
     """Dependency to get RAG chain instance."""
-    vectorstore = request.app.state.vectorstore
-    return RAGChain(vectorstore)
+    vectorstore = request.app.state.tenants.get_vectorstore(tenant)
+    return RAGChain(vectorstore, tenant=tenant)
 
 
 @router.post("/chat", response_model=ChatResponse)
@@ -64,7 +87,9 @@ async def chat(
     try:
         # Get or create conversation
         conversation_id = request.conversation_id or str(uuid.uuid4())
-        history = request.conversation_history or conversations.get(conversation_id, [])
+        # Keyed by tenant too, so one tenant can never read another's history
+        key = (rag_chain.tenant.id, conversation_id)
+        history = request.conversation_history or conversations.get(key, [])
         
         logger.info(
             "Chat request received",
@@ -83,7 +108,7 @@ async def chat(
         # Update conversation history
         history.append({"role": "user", "content": request.query})
         history.append({"role": "assistant", "content": result["response"]})
-        conversations[conversation_id] = history[-10:]  # Keep last 10 messages
+        conversations[key] = history[-10:]  # Keep last 10 messages
         
         logger.info(
             "Chat response generated",
@@ -107,22 +132,22 @@ async def chat(
 
 
 @router.get("/chat/{conversation_id}")
-async def get_conversation(conversation_id: str):
-    """Get conversation history by ID."""
-    if conversation_id not in conversations:
+async def get_conversation(conversation_id: str, tenant: TenantConfig = Depends(get_tenant)):
+    """Get conversation history by ID (within the caller's tenant)."""
+    key = (tenant.id, conversation_id)
+    if key not in conversations:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
     return {
         "conversation_id": conversation_id,
-        "messages": conversations[conversation_id]
+        "messages": conversations[key]
     }
 
 
 @router.delete("/chat/{conversation_id}")
-async def delete_conversation(conversation_id: str):
-    """Delete a conversation."""
-    if conversation_id in conversations:
-        del conversations[conversation_id]
+async def delete_conversation(conversation_id: str, tenant: TenantConfig = Depends(get_tenant)):
+    """Delete a conversation (within the caller's tenant)."""
+    conversations.pop((tenant.id, conversation_id), None)
     
     return {"status": "deleted", "conversation_id": conversation_id}
 
@@ -4,13 +4,22 @@ Endpoints for document management.
 """
 
 import os
+import re
+import json
+import time
 import uuid
-from typing import List, Optional
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import aiofiles
 from fastapi import APIRouter, HTTPException, Request, UploadFile, File, Form
 from pydantic import BaseModel, Field
 import structlog
 
 from app.config import settings
+from app.ingest import DEFAULT_CATEGORY, get_file_key, get_manifest_path, load_manifest
 
 logger = structlog.get_logger()
 router = APIRouter()
@@ -32,11 +41,53 @@ class DocumentsStats(BaseModel):
     """Documents statistics."""
     total_documents: int
     total_chunks: int
+    upload_chunks: int
     file_types: dict
+    persist_directory: str
 
 
-# In-memory document registry (replace with database in production)
-documents_registry: dict = {}
+# Uploaded files are stored here, in category subdirectories
+DOCUMENTS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "data", "documents"))
+
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+# Longest NDJSON record accepted by the bulk endpoint
+MAX_BULK_LINE_BYTES = 1024 * 1024
+
+# Errors listed in a bulk response (the count is always complete)
+MAX_BULK_ERRORS = 20
+
+# Bulk batches are embedded and written here, never on the threads serving chat
+bulk_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="bulk")
+
+# Content hashes of the files indexed by app.ingest, reloaded when the manifest changes
+_ingested_hashes: Dict[str, Any] = {"manifest": None, "hashes": {}}
+
+
+def find_ingested_file(vectorstore, sha256: str) -> Optional[str]:
+    """
+    Key of a file already indexed from the documents directory with these contents.
+    
+    Args:
+        vectorstore: Live vector store, whose ingest manifest is checked
+        sha256: Content hash of the upload
+    """
+    vectorstore.refresh()
+    path = get_manifest_path(vectorstore)
+    if not os.path.exists(path):
+        return None
+    manifest = (path, os.path.getmtime(path))
+    if _ingested_hashes["manifest"] != manifest:
+        _ingested_hashes["hashes"] = {
+            entry["sha256"]: key for key, entry in load_manifest(vectorstore).items() if entry.get("sha256")
+        }
+        _ingested_hashes["manifest"] = manifest
+    key = _ingested_hashes["hashes"].get(sha256)
+    # Files deleted since the last ingest run are still in the manifest
+    if key and os.path.exists(os.path.join(DOCUMENTS_DIR, key)):
+        return key
+    return None
 
 
 @router.post("/documents/upload")
@@ -51,6 +102,11 @@ async def upload_document(
     Supported formats: PDF, DOCX, TXT, MD, CSV
     Maximum size: 10MB
     """
+    # Dedupe and indexing both need the live store
+    vectorstore = request.app.state.vectorstore
+    if vectorstore is None:
+        raise HTTPException(status_code=503, detail="Vector store not available")
+    
     # Validate file type
     allowed_extensions = {".pdf", ".docx", ".txt", ".md", ".csv"}
     file_ext = os.path.splitext(file.filename)[1].lower()
@@ -61,100 +117,318 @@ async def upload_document(
             detail=f"Unsupported file type. Allowed: {', '.join(allowed_extensions)}"
         )
     
-    # Validate file size (10MB max)
-    content = await file.read()
-    if len(content) > 10 * 1024 * 1024:
+    # Reject early when the declared body is already too large
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES + 64 * 1024:
         raise HTTPException(status_code=400, detail="File too large. Maximum size: 10MB")
     
-    # Save file
-    documents_dir = os.path.join(os.path.dirname(__file__), "..", "..", "data", "documents")
+    # Category subdirectory, which ingestion uses as the shard
+    documents_dir = DOCUMENTS_DIR
+    if category:
+        category = re.sub(r"[^a-z0-9_-]+", "-", category.strip().lower()).strip("-") or None
+    if category:
+        documents_dir = os.path.join(documents_dir, category)
     os.makedirs(documents_dir, exist_ok=True)
     
+    # Stream to a temp file, hashing and size-checking on the fly (10MB max)
     doc_id = str(uuid.uuid4())
-    safe_filename = f"{doc_id}_{file.filename}"
-    file_path = os.path.join(documents_dir, safe_filename)
+    tmp_path = os.path.join(documents_dir, f".{doc_id}.part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp_path, "wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=400, detail="File too large. Maximum size: 10MB")
+                digest.update(chunk)
+                await f.write(chunk)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    sha256 = digest.hexdigest()
+    
+    # Byte-identical file already indexed (or queued): never parse or embed it twice
+    registry = request.app.state.documents
+    existing = registry.find_by_sha256(sha256)
+    if existing:
+        os.remove(tmp_path)
+        logger.info("Duplicate upload skipped", doc_id=existing["id"], filename=file.filename)
+        return {
+            "status": "duplicate",
+            "document": existing,
+            "message": "An identical document was already uploaded."
+        }
+    ingested = await asyncio.to_thread(find_ingested_file, vectorstore, sha256)
+    if ingested:
+        os.remove(tmp_path)
+        logger.info("Upload already indexed from the documents directory", file=ingested, filename=file.filename)
+        return {
+            "status": "duplicate",
+            "document": None,
+            "file": ingested,
+            "message": "An identical document is already indexed from the documents directory."
+        }
     
-    with open(file_path, "wb") as f:
-        f.write(content)
+    filename = os.path.basename(file.filename)
+    safe_filename = f"{doc_id}_{filename}"
+    file_path = os.path.join(documents_dir, safe_filename)
+    os.replace(tmp_path, file_path)
     
     logger.info(
         "Document uploaded",
         doc_id=doc_id,
-        filename=file.filename,
-        size=len(content)
+        filename=filename,
+        size=size
     )
     
-    # Register document (in production, would trigger async indexing)
-    documents_registry[doc_id] = {
+    # Register document and queue it for background indexing
+    document = registry.add({
         "id": doc_id,
-        "filename": file.filename,
+        "filename": filename,
         "file_type": file_ext,
-        "size_bytes": len(content),
+        "size_bytes": size,
+        "sha256": sha256,
         "file_path": file_path,
         "category": category,
-        "status": "uploaded",  # pending_indexing, indexed, error
+        "status": "uploaded",  # pending_indexing, indexing, indexed, error
+        "progress": 0.0,
+        "chunks_count": 0,
         "created_at": __import__("datetime").datetime.utcnow().isoformat()
-    }
-    
-    # TODO: Trigger async indexing via background task or queue
-    # For demo, we'll return immediately
+    })
+    job = request.app.state.indexer.submit_document(doc_id)
+    document.update(status=job["status"], job_id=job["id"])
     
     return {
         "status": "success",
-        "document": documents_registry[doc_id],
-        "message": "Document uploaded. Run 'python -m app.ingest' to index."
+        "document": document,
+        "message": "Document uploaded and queued for indexing. Check GET /documents/{id} for progress."
     }
 
 
-@router.get("/documents", response_model=List[DocumentInfo])
-async def list_documents(request: Request):
-    """List all indexed documents."""
+def parse_bulk_record(line: bytes) -> Dict[str, Any]:
+    """
+    Parse and validate one NDJSON record of a bulk upsert.
+    
+    Raises:
+        ValueError: If the record is malformed
+    """
+    record = json.loads(line)
+    if not isinstance(record, dict):
+        raise ValueError("record must be a JSON object")
+    
+    chunk_id, text = record.get("id"), record.get("text")
+    if not isinstance(chunk_id, str) or not chunk_id:
+        raise ValueError("'id' must be a non-empty string")
+    if not isinstance(text, str) or not text.strip():
+        raise ValueError("'text' must be a non-empty string")
+    
+    metadata = record.get("metadata") or {}
+    if not isinstance(metadata, dict) or not all(
+        isinstance(v, (str, int, float, bool)) for v in metadata.values()
+    ):
+        raise ValueError("'metadata' must be an object of strings, numbers or booleans")
+    # Every chunk has a category, so bulk records are routed and counted in the centroids
+    category = str(metadata.get("category") or DEFAULT_CATEGORY).strip().lower() or DEFAULT_CATEGORY
+    metadata = {"type": "bulk", **metadata, "category": category}
+    
+    embedding = record.get("embedding")
+    if embedding is not None and (
+        not isinstance(embedding, list) or not embedding
+        or not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in embedding)
+    ):
+        raise ValueError("'embedding' must be a non-empty list of numbers")
+    
+    return {"id": chunk_id, "text": text, "metadata": metadata, "embedding": embedding}
+
+
+def write_bulk_batch(vectorstore, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Upsert a batch of bulk records (run in the bulk executor).
+    
+    Records with an embedding are stored as given; the others are embedded
+    through the vector store (and its embedding cache) first. Stored records
+    are also kept in the bulk store, so re-indexes and snapshot imports
+    rebuild them.
+    """
+    result = {"upserted": 0, "embedded": 0, "failed": [], "error": None}
+    provided = [r for r in records if r["embedding"] is not None]
+    missing = [r for r in records if r["embedding"] is None]
+    try:
+        if provided:
+            vectorstore.add_embeddings(
+                [r["text"] for r in provided],
+                [r["metadata"] for r in provided],
+                [r["id"] for r in provided],
+                [r["embedding"] for r in provided]
+            )
+            result["upserted"] += len(provided)
+            vectorstore.bulk.put_many(provided)
+        if missing:
+            stored = set(vectorstore.add_documents(
+                [r["text"] for r in missing],
+                [r["metadata"] for r in missing],
+                [r["id"] for r in missing]
+            ))
+            result["upserted"] += len(stored)
+            result["embedded"] += len(stored)
+            result["failed"] = [r["id"] for r in missing if r["id"] not in stored]
+            vectorstore.bulk.put_many(
+                {**r, "embedding": None} for r in missing if r["id"] in stored
+            )
+    except Exception as e:
+        logger.error("Bulk batch failed", records=len(records), error=str(e))
+        # Records with embeddings are written first: if they went in, only the rest failed
+        result["failed"] = [r["id"] for r in (missing if result["upserted"] else records)]
+        result["error"] = str(e)
+    return result
+
+
+@router.post("/documents/bulk")
+async def bulk_upsert(request: Request, model: Optional[str] = None):
+    """
+    Upsert pre-chunked documents from a streamed NDJSON body.
+    
+    Each line is a record {"id", "text", "metadata"?, "embedding"?}. Records
+    are upserted in batches of INGEST_BATCH_SIZE through the server's vector
+    store; only records without an embedding are embedded. The body is read
+    while the previous batch is being written, and no further, so a fast
+    client is slowed down to the indexing rate.
+    
+    Embeddings must have the collection's dimension (a record that does not
+    ends the request with 422); an empty collection takes the dimension of
+    the first embedding sent. `model`, when given, must be the server's
+    embedding model.
+    """
     vectorstore = request.app.state.vectorstore
-    stats = vectorstore.get_stats()
+    if vectorstore is None:
+        raise HTTPException(status_code=503, detail="Vector store not available")
+    vectorstore.refresh()
+    
+    model_name = vectorstore.embedding_service.model_name
+    if model and model != model_name:
+        raise HTTPException(status_code=422, detail=f"Embeddings are {model}, but the collection uses {model_name}")
     
-    # Get documents from registry
-    docs = []
-    for doc_id, doc in documents_registry.items():
-        docs.append(DocumentInfo(
+    loop = asyncio.get_running_loop()
+    dimension = await loop.run_in_executor(bulk_executor, vectorstore.get_dimension)
+    started = time.perf_counter()
+    stats = {"received": 0, "upserted": 0, "embedded": 0, "invalid": 0, "failed": 0}
+    errors: List[Dict[str, Any]] = []
+    batch: Dict[str, Dict[str, Any]] = {}
+    writing: Optional[asyncio.Future] = None
+    line_num = 0
+    
+    def add_error(error: Dict[str, Any]) -> None:
+        if len(errors) < MAX_BULK_ERRORS:
+            errors.append(error)
+    
+    async def finish_write() -> None:
+        nonlocal writing
+        if writing is None:
+            return
+        result = await writing
+        writing = None
+        stats["upserted"] += result["upserted"]
+        stats["embedded"] += result["embedded"]
+        stats["failed"] += len(result["failed"])
+        for chunk_id in result["failed"]:
+            add_error({"id": chunk_id, "error": result["error"] or "embedding failed"})
+    
+    async def flush() -> None:
+        nonlocal batch, writing
+        if not batch:
+            return
+        # One batch in flight per request: later upserts of an ID land last
+        await finish_write()
+        writing = loop.run_in_executor(bulk_executor, write_bulk_batch, vectorstore, list(batch.values()))
+        batch = {}
+    
+    async def handle(line: bytes) -> None:
+        nonlocal line_num, dimension
+        line_num += 1
+        if not line.strip():
+            return
+        stats["received"] += 1
+        try:
+            record = parse_bulk_record(line)
+        except ValueError as e:
+            stats["invalid"] += 1
+            add_error({"line": line_num, "error": str(e)})
+            return
+        if record["embedding"] is not None and dimension is None:
+            dimension = len(record["embedding"])
+        if record["embedding"] is not None and len(record["embedding"]) != dimension:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Record on line {line_num}: embedding has {len(record['embedding'])} dimensions, "
+                       f"the collection uses {dimension}"
+            )
+        # The same ID twice in a batch: the later record wins
+        batch.pop(record["id"], None)
+        batch[record["id"]] = record
+        if len(batch) >= settings.ingest_batch_size:
+            await flush()
+    
+    buffer = b""
+    try:
+        async for data in request.stream():
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            if len(buffer) > MAX_BULK_LINE_BYTES:
+                raise HTTPException(status_code=413, detail=f"Record on line {line_num + len(lines) + 1} is too large")
+            for line in lines:
+                await handle(line)
+        await handle(buffer)
+        await flush()
+    finally:
+        await finish_write()
+    
+    stats["seconds"] = round(time.perf_counter() - started, 2)
+    logger.info("Bulk upsert finished", **stats)
+    return {"status": "success" if not (stats["invalid"] or stats["failed"]) else "partial", **stats, "errors": errors}
+
+
+@router.get("/documents", response_model=List[DocumentInfo])
+async def list_documents(request: Request):
+    """List all uploaded documents."""
+    return [
+        DocumentInfo(
             id=doc["id"],
             filename=doc["filename"],
             file_type=doc["file_type"],
             size_bytes=doc["size_bytes"],
-            chunks_count=0,  # Would get from vectorstore metadata
+            chunks_count=doc["chunks_count"],
             status=doc["status"],
             created_at=doc["created_at"]
-        ))
-    
-    return docs
+        )
+        for doc in request.app.state.documents.list()
+    ]
 
 
-@router.get("/documents/stats")
+@router.get("/documents/stats", response_model=DocumentsStats)
 async def get_documents_stats(request: Request):
-    """Get statistics about indexed documents."""
+    """Get statistics about uploaded documents and the indexed collection."""
+    uploads = await asyncio.to_thread(request.app.state.documents.get_stats)
     vectorstore = request.app.state.vectorstore
-    stats = vectorstore.get_stats()
-    
-    # Count file types
-    file_types = {}
-    for doc in documents_registry.values():
-        ext = doc["file_type"]
-        file_types[ext] = file_types.get(ext, 0) + 1
-    
-    return {
-        "total_documents": len(documents_registry),
-        "total_chunks": stats["document_count"],
-        "file_types": file_types,
-        "persist_directory": stats["persist_directory"]
-    }
+    # Every chunk in the collection, including files ingested from the documents directory
+    collection = await asyncio.to_thread(vectorstore.get_stats) if vectorstore else {"document_count": 0}
+    return DocumentsStats(
+        total_documents=uploads["total_documents"],
+        total_chunks=collection["document_count"],
+        upload_chunks=uploads["upload_chunks"],
+        file_types=uploads["file_types"],
+        persist_directory=settings.chroma_persist_dir
+    )
 
 
 @router.get("/documents/{doc_id}")
-async def get_document(doc_id: str):
+async def get_document(request: Request, doc_id: str):
     """Get details of a specific document."""
-    if doc_id not in documents_registry:
+    doc = request.app.state.documents.get(doc_id)
+    if doc is None:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    return documents_registry[doc_id]
+    return doc
 
 
 @router.delete("/documents/{doc_id}")
@@ -162,22 +436,37 @@ async def delete_document(request: Request, doc_id: str):
     """
     Delete a document and its chunks from the index.
     """
-    if doc_id not in documents_registry:
+    registry = request.app.state.documents
+    doc = registry.get(doc_id)
+    if doc is None:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    doc = documents_registry[doc_id]
-    
-    # Delete file
-    if os.path.exists(doc["file_path"]):
-        os.remove(doc["file_path"])
+    vectorstore = request.app.state.vectorstore
     
-    # Delete from vectorstore (would need to track chunk IDs)
-    # vectorstore.delete_documents(chunk_ids)
+    def remove() -> None:
+        # Stop its indexing job first: the job removes any batch it stores from now on
+        registry.mark_deleted(doc_id)
+        
+        # Delete file
+        if os.path.exists(doc["file_path"]):
+            os.remove(doc["file_path"])
+        
+        # Delete chunks: tagged with doc_id, plus any stored before this upload
+        if vectorstore is not None:
+            if doc["file_type"] == ".csv":
+                vectorstore.tables.drop(get_file_key(Path(doc["file_path"]), Path(DOCUMENTS_DIR)))
+            vectorstore.delete_by_doc_id(doc_id)
+            chunk_ids = registry.get_chunk_ids(doc_id)
+            if chunk_ids:
+                vectorstore.delete_documents(chunk_ids)
+        
+        # Remove from registry
+        registry.delete(doc_id)
     
-    # Remove from registry
-    del documents_registry[doc_id]
+    # Chroma, table and registry writes block: keep them off the event loop
+    await asyncio.to_thread(remove)
     
-    logger.info("Document deleted", doc_id=doc_id)
+    logger.info("Document deleted", doc_id=doc_id, chunks=doc["chunks_count"])
     
     return {"status": "deleted", "doc_id": doc_id}
 
@@ -185,14 +474,26 @@ async def delete_document(request: Request, doc_id: str):
 @router.post("/documents/reindex")
 async def reindex_all(request: Request):
     """
-    Re-index all documents.
+    Re-index all documents in the background.
     
-    This clears the vectorstore and re-processes all documents.
+    Runs an incremental ingestion of the documents directory: only new or
+    changed files are embedded and chunks of removed files are deleted.
     """
-    # In production, this would be a background task
-    logger.info("Reindex requested")
+    job = request.app.state.indexer.submit_reindex()
+    logger.info("Reindex requested", job_id=job["id"])
     
     return {
         "status": "scheduled",
-        "message": "Run 'python -m app.ingest --reset' to reindex all documents."
+        "job": job,
+        "message": "Reindex queued. Check GET /documents/jobs/{job_id} for progress."
     }
+
+
+@router.get("/documents/jobs/{job_id}")
+async def get_indexing_job(request: Request, job_id: str):
+    """Get the status of a background indexing job."""
+    job = request.app.state.indexer.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return job
@@ -81,6 +81,9 @@ async def readiness_check(request: Request):
         # Verify LLM is configured
         settings.get_llm_provider()
         
+        if vectorstore.fallback is not None:
+            # Snapshot still being imported: searches are served from its memory map
+            return {"status": "ready", "index": "snapshot"}
         return {"status": "ready"}
     except Exception as e:
         logger.error("Readiness check failed", error=str(e))
@@ -106,15 +109,23 @@ async def metrics(request: Request):
     vectorstore = request.app.state.vectorstore
     stats = vectorstore.get_stats()
     
+    telegram = None
+    if getattr(request.app.state, "telegram", None) is not None:
+        from app.bot.telegram import get_stats as get_telegram_stats
+        telegram = get_telegram_stats(request.app.state.telegram)
+    
     return {
         "timestamp": datetime.utcnow().isoformat(),
         "vectorstore": {
             "document_count": stats["document_count"]
         },
+        "tenants": request.app.state.tenants.get_stats(),
+        "provider_scheduler": vectorstore.embedding_service.scheduler.get_stats(),
+        "telegram": telegram,
         "config": {
             "llm_model": settings.llm_model,
             "embedding_model": settings.embedding_model,
-            "chunk_size": settings.chunk_size,
+            "chunk_tokens": settings.chunk_tokens,
             "top_k_results": settings.top_k_results
         }
     }
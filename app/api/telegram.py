@@ -0,0 +1,92 @@
+"""
+AITI Assistant - Telegram Webhook API
+Receives Telegram updates and dispatches them to the bot running in the API server.
+"""
+
+import hmac
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Request
+import structlog
+
+from app.config import settings
+
+logger = structlog.get_logger()
+router = APIRouter()
+
+# Header Telegram sends with the secret token given to setWebhook
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+async def start_webhook_bot(rag_chain):
+    """
+    Start the bot in webhook mode and register the webhook with Telegram.
+
+    Args:
+        rag_chain: The API server's RAG chain
+
+    Returns:
+        Running bot application
+    """
+    from telegram import Update
+    from app.bot.telegram import build_application
+
+    application = build_application(rag_chain)
+    try:
+        await application.initialize()
+        await application.start()
+        await application.bot.set_webhook(
+            url=settings.telegram_webhook_url,
+            secret_token=settings.telegram_webhook_secret,
+            allowed_updates=Update.ALL_TYPES
+        )
+    except Exception:
+        await stop_webhook_bot(application)
+        raise
+    logger.info("Telegram webhook registered", url=settings.telegram_webhook_url)
+    return application
+
+
+async def stop_webhook_bot(application) -> None:
+    """
+    Stop the bot and release its components (the webhook stays registered,
+    Telegram retries while the server is down).
+
+    Application.shutdown() does not run the post-shutdown hook (only
+    run_polling/run_webhook do), so the user state is flushed here.
+    """
+    from app.bot.telegram import close_components
+
+    try:
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+    finally:
+        await close_components(application)
+
+
+@router.post("/telegram/webhook")
+async def telegram_webhook(request: Request):
+    """
+    Receive a Telegram update.
+
+    The update is queued for the bot and acknowledged at once; the answer is
+    sent by the bot, so Telegram never waits for the LLM.
+    """
+    application = getattr(request.app.state, "telegram", None)
+    if application is None:
+        raise HTTPException(status_code=404, detail="Telegram webhook not enabled")
+
+    secret: Optional[str] = request.headers.get(SECRET_TOKEN_HEADER)
+    if not secret or not hmac.compare_digest(secret.encode(), settings.telegram_webhook_secret.encode()):
+        logger.warning("Telegram webhook rejected, bad secret token", client=request.client.host if request.client else None)
+        raise HTTPException(status_code=401, detail="Invalid secret token")
+
+    from telegram import Update
+
+    try:
+        update = Update.de_json(await request.json(), application.bot)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid update: {e}")
+
+    await application.update_queue.put(update)
+    return {"ok": True}
@@ -0,0 +1,217 @@
+"""
+AITI Assistant - Bot User State
+Bounded in-memory conversation state with SQLite write-behind and lazy restore.
+"""
+
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+import structlog
+
+logger = structlog.get_logger()
+
+# Seconds between write-behind flushes
+FLUSH_INTERVAL = 2.0
+
+
+class UserStateStore:
+    """
+    Conversation history per user, bounded by size and idle time.
+
+    Recently active users are kept in memory in LRU order. Users idle for
+    longer than `ttl` seconds, or beyond `max_users`, are evicted and read
+    back from SQLite, in a worker thread, on their next message. Changes are
+    written by a background thread every FLUSH_INTERVAL seconds, outside the
+    lock the handlers take, so handlers never wait for the disk; rows idle
+    for longer than `retention_days` are purged.
+    """
+
+    def __init__(self, path: str, max_users: int, ttl: float, retention_days: int = 0):
+        """
+        Open (or create) the store.
+
+        Args:
+            path: SQLite file
+            max_users: Users kept in memory
+            ttl: Seconds of inactivity before a user is evicted from memory
+            retention_days: Days before an idle user's state is deleted (0 = keep)
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_users = max(1, max_users)
+        self.ttl = ttl
+        self.retention_days = retention_days
+        # Written by the flush thread only
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS user_states ("
+            " user_id INTEGER PRIMARY KEY, history TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS user_states_updated_at ON user_states (updated_at)")
+        self._conn.commit()
+        # Rows in SQLite, counted once here and then by each flush (never on the event loop)
+        self.stored = self._conn.execute("SELECT COUNT(*) FROM user_states").fetchone()[0]
+        # Restores read through their own connection (WAL readers don't block the writer)
+        self._read_conn = sqlite3.connect(path, check_same_thread=False)
+        self._read_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+        self._lock = threading.Lock()
+        # user_id -> (last access, history), least recently used first
+        self._memory: "OrderedDict[int, tuple]" = OrderedDict()
+        # user_id -> (updated_at, history or None to delete), waiting for the next flush
+        self._dirty: Dict[int, tuple] = {}
+        self.hits = 0
+        self.restores = 0
+        self.evictions = 0
+
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="user-state-flush", daemon=True)
+        self._flusher.start()
+
+    async def get(self, user_id: int, default: Optional[List[Dict[str, str]]] = None) -> Optional[List[Dict[str, str]]]:
+        """Conversation history of a user (a copy), restored from SQLite if evicted."""
+        with self._lock:
+            history = self._cached(user_id)
+            # Known in memory, or deleted and not yet flushed
+            known = history is not None or user_id in self._dirty
+        if known:
+            return default if history is None else list(history)
+
+        # Cold user: read off the event loop
+        row = await asyncio.to_thread(self._read, user_id)
+        with self._lock:
+            # A set() or delete() while reading wins over the stored row
+            history = self._cached(user_id)
+            if history is None and user_id not in self._dirty and row is not None:
+                history = json.loads(row)
+                self.restores += 1
+                self._remember(user_id, history)
+        if history is None:
+            return default
+        return list(history)
+
+    def _cached(self, user_id: int) -> Optional[List[Dict[str, str]]]:
+        """History from memory or pending writes, None if absent or deleted (lock held)."""
+        if user_id in self._memory:
+            self.hits += 1
+            history = self._memory[user_id][1]
+        elif user_id in self._dirty:
+            history = self._dirty[user_id][1]
+        else:
+            return None
+        if history is not None:
+            self._remember(user_id, history)
+        return history
+
+    def _remember(self, user_id: int, history: List[Dict[str, str]]) -> None:
+        """Mark a user as just used (lock held)."""
+        now = time.time()
+        self._memory[user_id] = (now, history)
+        self._memory.move_to_end(user_id)
+        self._evict(now)
+
+    def _read(self, user_id: int) -> Optional[str]:
+        """Stored history of a user as JSON, None if absent."""
+        with self._read_lock:
+            row = self._read_conn.execute(
+                "SELECT history FROM user_states WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, user_id: int, history: List[Dict[str, str]]) -> None:
+        """Replace a user's conversation history."""
+        now = time.time()
+        history = list(history)
+        with self._lock:
+            self._memory[user_id] = (now, history)
+            self._memory.move_to_end(user_id)
+            self._dirty[user_id] = (now, history)
+            self._evict(now)
+
+    def delete(self, user_id: int) -> None:
+        """Forget a user's conversation."""
+        with self._lock:
+            self._memory.pop(user_id, None)
+            self._dirty[user_id] = (time.time(), None)
+
+    def _evict(self, now: float) -> None:
+        """Drop idle and least recently used users from memory (lock held)."""
+        while self._memory:
+            user_id, (last_access, _) = next(iter(self._memory.items()))
+            if len(self._memory) <= self.max_users and now - last_access < self.ttl:
+                break
+            # Unflushed changes stay in _dirty until written
+            del self._memory[user_id]
+            self.evictions += 1
+
+    def flush(self) -> int:
+        """Write pending changes to SQLite; returns the number of users written."""
+        with self._flush_lock:
+            with self._lock:
+                # Idle users leave memory even without new messages
+                self._evict(time.time())
+                if not self._dirty:
+                    return 0
+                pending = dict(self._dirty)
+
+            # Outside the lock; entries stay in _dirty (and are served from there) until committed
+            upserts = [
+                (user_id, json.dumps(history, ensure_ascii=False), updated_at)
+                for user_id, (updated_at, history) in pending.items() if history is not None
+            ]
+            deletes = [(user_id,) for user_id, (_, history) in pending.items() if history is None]
+            try:
+                with self._conn:
+                    self._conn.executemany("INSERT OR REPLACE INTO user_states VALUES (?, ?, ?)", upserts)
+                    self._conn.executemany("DELETE FROM user_states WHERE user_id = ?", deletes)
+                    if self.retention_days:
+                        self._conn.execute(
+                            "DELETE FROM user_states WHERE updated_at < ?",
+                            (time.time() - self.retention_days * 86400,)
+                        )
+                    stored = self._conn.execute("SELECT COUNT(*) FROM user_states").fetchone()[0]
+            except sqlite3.Error as e:
+                # Kept in _dirty for the next flush
+                logger.error("User state flush failed", error=str(e), users=len(pending))
+                return 0
+
+            with self._lock:
+                self.stored = stored
+                # Changes made during the write are left for the next flush
+                for user_id, entry in pending.items():
+                    if self._dirty.get(user_id) is entry:
+                        del self._dirty[user_id]
+            return len(pending)
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(FLUSH_INTERVAL):
+            self.flush()
+
+    def close(self) -> None:
+        """Stop the flush thread and write what is pending."""
+        self._stop.set()
+        self._flusher.join()
+        self.flush()
+        self._conn.close()
+        self._read_conn.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Users in memory and stored (as of the last flush), pending writes, hits, restores and evictions."""
+        with self._lock:
+            return {
+                "in_memory": len(self._memory),
+                "max_users": self.max_users,
+                "pending_writes": len(self._dirty),
+                "stored": self.stored,
+                "hits": self.hits,
+                "restores": self.restores,
+                "evictions": self.evictions
+            }
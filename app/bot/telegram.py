@@ -6,8 +6,15 @@ Provides customer service via Telegram using RAG.
 
 import os
 import sys
+import time
 import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from functools import partial
 from pathlib import Path
+from typing import Any, Deque, Dict, Optional
 import structlog
 
 # Add parent directory to path
@@ -17,6 +24,7 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, RetryAfter, TelegramError
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -29,15 +37,216 @@ from telegram.ext import (
 from app.config import settings
 from app.rag.vectorstore import VectorStore
 from app.rag.chain import RAGChain
+from app.bot.state import UserStateStore
 
 logger = structlog.get_logger()
 
-# Initialize components
-vectorstore = VectorStore()
-rag_chain = RAGChain(vectorstore)
+# Processing times kept for percentiles
+TIMING_SAMPLES = 1000
 
-# User conversation state
-user_states = {}
+# Telegram message length limit
+MAX_MESSAGE_LENGTH = 4096
+
+# Shown until the first streamed text arrives, then appended while streaming
+PLACEHOLDER_TEXT = "💬 A preparar a resposta..."
+STREAM_CURSOR = " ▌"
+
+# Queue statistics are logged every this many processed messages
+STATS_LOG_INTERVAL = 100
+
+
+class UserQueueFull(Exception):
+    """Raised when a user already has the maximum number of pending messages."""
+
+
+class UserMessageQueue:
+    """
+    Per-user ordered processing of bot messages on a bounded thread pool.
+    
+    Each user's messages are handled one at a time, in arrival order, while
+    different users are served concurrently. RAG calls run on a pool of
+    `workers` threads, so the event loop keeps receiving updates.
+    """
+    
+    def __init__(self, workers: int, max_pending: int):
+        """
+        Initialize the queue.
+        
+        Args:
+            workers: Threads running RAG calls
+            max_pending: Messages a user may have waiting or in progress
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="telegram")
+        self.max_pending = max(1, max_pending)
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._pending: Dict[int, int] = {}
+        self.processed = 0
+        self.rejected = 0
+        self.max_depth = 0
+        self._wait_times: Deque[float] = deque(maxlen=TIMING_SAMPLES)
+        self._processing_times: Deque[float] = deque(maxlen=TIMING_SAMPLES)
+    
+    @property
+    def depth(self) -> int:
+        """Messages waiting or in progress, across users."""
+        return sum(self._pending.values())
+    
+    @asynccontextmanager
+    async def turn(self, user_id: int):
+        """
+        Wait for the user's earlier messages, then hold the user's turn.
+        
+        Raises:
+            UserQueueFull: If the user has max_pending messages already
+        """
+        if self._pending.get(user_id, 0) >= self.max_pending:
+            self.rejected += 1
+            raise UserQueueFull(user_id)
+        
+        self._pending[user_id] = self._pending.get(user_id, 0) + 1
+        self.max_depth = max(self.max_depth, self.depth)
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        queued = time.perf_counter()
+        try:
+            # asyncio.Lock is FIFO: messages keep their arrival order
+            async with lock:
+                started = time.perf_counter()
+                self._wait_times.append(started - queued)
+                yield
+                self._processing_times.append(time.perf_counter() - started)
+                self.processed += 1
+        finally:
+            self._pending[user_id] -= 1
+            if not self._pending[user_id]:
+                del self._pending[user_id]
+                del self._locks[user_id]
+    
+    async def run(self, func, *args, **kwargs) -> Any:
+        """Run a blocking call on the worker pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Queue depth, rejections and wait/processing time percentiles."""
+        def percentiles(samples: Deque[float]) -> Dict[str, float]:
+            ordered = sorted(samples)
+            if not ordered:
+                return {"avg_ms": 0.0, "p95_ms": 0.0}
+            return {
+                "avg_ms": round(sum(ordered) / len(ordered) * 1000, 1),
+                "p95_ms": round(ordered[int(len(ordered) * 0.95)] * 1000, 1)
+            }
+        
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "active_users": len(self._pending),
+            "processed": self.processed,
+            "rejected": self.rejected,
+            "wait": percentiles(self._wait_times),
+            "processing": percentiles(self._processing_times)
+        }
+
+
+
+class StreamedReply:
+    """
+    A bot message edited in place while the answer is generated.
+    
+    Edits are throttled to one per `interval` seconds (Telegram rate-limits
+    edits per chat); only the latest text is shown, so a slow edit never
+    builds a backlog. finish() writes the complete answer.
+    """
+    
+    def __init__(self, bot, chat_id: int, message_id: int, interval: float):
+        """
+        Initialize the reply.
+        
+        Args:
+            bot: Telegram bot
+            chat_id: Chat of the placeholder message
+            message_id: Placeholder message to edit
+            interval: Minimum seconds between edits
+        """
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.interval = interval
+        self.edits = 0
+        self.first_edit_at: Optional[float] = None
+        self._text = ""
+        self._shown = ""
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self) -> None:
+        """Start applying streamed text."""
+        self._task = asyncio.create_task(self._run())
+    
+    def update(self, text: str) -> None:
+        """Set the text generated so far (call from the event loop)."""
+        self._text = text
+        self._changed.set()
+    
+    async def _run(self) -> None:
+        while True:
+            await self._changed.wait()
+            self._changed.clear()
+            text = self._text
+            if text.strip() and text != self._shown:
+                await self._edit(text[:MAX_MESSAGE_LENGTH - len(STREAM_CURSOR)] + STREAM_CURSOR)
+                self._shown = text
+                if self.first_edit_at is None:
+                    self.first_edit_at = time.perf_counter()
+            await asyncio.sleep(self.interval)
+    
+    async def _edit(self, text: str, **kwargs) -> None:
+        """Edit the message, waiting out flood control once."""
+        for attempt in range(2):
+            try:
+                await self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=self.message_id, **kwargs)
+                self.edits += 1
+                return
+            except RetryAfter as e:
+                if attempt:
+                    raise
+                delay = e.retry_after
+                await asyncio.sleep(delay.total_seconds() if isinstance(delay, timedelta) else delay)
+            except BadRequest as e:
+                if "not modified" in str(e).lower():
+                    return
+                raise
+    
+    async def finish(self, text: str, reply_markup=None, parse_mode: Optional[str] = None) -> None:
+        """
+        Stop streaming and show the complete answer.
+        
+        Answers longer than a Telegram message continue in new messages;
+        the keyboard goes on the last one.
+        """
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, TelegramError):
+                pass
+        
+        parts = [text[i:i + MAX_MESSAGE_LENGTH] for i in range(0, len(text), MAX_MESSAGE_LENGTH)] or [text]
+        for i, part in enumerate(parts):
+            markup = reply_markup if i == len(parts) - 1 else None
+            try:
+                if i == 0:
+                    await self._edit(part, reply_markup=markup, parse_mode=parse_mode)
+                else:
+                    await self.bot.send_message(self.chat_id, part, reply_markup=markup, parse_mode=parse_mode)
+            except BadRequest:
+                if not parse_mode:
+                    raise
+                # Model output is not always valid Markdown
+                if i == 0:
+                    await self._edit(part, reply_markup=markup)
+                else:
+                    await self.bot.send_message(self.chat_id, part, reply_markup=markup)
 
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -91,9 +300,7 @@ Se eu não conseguir responder, posso encaminhar para um colega humano! 👨‍
 
 async def new_conversation(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /novo command - start new conversation."""
-    user_id = update.effective_user.id
-    if user_id in user_states:
-        del user_states[user_id]
+    context.bot_data["user_states"].delete(update.effective_user.id)
     
     await update.message.reply_text(
         "🔄 Nova conversa iniciada!\n\nComo posso ajudar?"
@@ -139,21 +346,45 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         message=message_text[:50]
     )
     
-    # Show typing indicator
-    await context.bot.send_chat_action(
-        chat_id=update.effective_chat.id,
-        action="typing"
-    )
+    message_queue: UserMessageQueue = context.bot_data["message_queue"]
+    try:
+        async with message_queue.turn(user_id):
+            await answer_message(update, context)
+        if message_queue.processed % STATS_LOG_INTERVAL == 0:
+            logger.info("Telegram queue stats", **message_queue.get_stats())
+    except UserQueueFull:
+        logger.warning("Message rejected, user queue full", user_id=user_id, pending=message_queue.max_pending)
+        await update.message.reply_text(
+            "⏳ Ainda estou a responder às suas mensagens anteriores. Aguarde um momento, por favor."
+        )
+
+
+async def answer_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Answer a text message (runs in the user's turn)."""
+    user_id = update.effective_user.id
+    message_text = update.message.text
+    started = time.perf_counter()
+    rag_chain: RAGChain = context.bot_data["rag_chain"]
+    user_states: UserStateStore = context.bot_data["user_states"]
+    message_queue: UserMessageQueue = context.bot_data["message_queue"]
+    
+    # Placeholder that is edited as the answer streams in
+    placeholder = await update.message.reply_text(PLACEHOLDER_TEXT)
+    reply = StreamedReply(context.bot, placeholder.chat_id, placeholder.message_id, settings.telegram_edit_interval)
+    reply.start()
+    loop = asyncio.get_running_loop()
     
     # Get conversation history
-    history = user_states.get(user_id, [])
+    history = await user_states.get(user_id, [])
     
     try:
-        # Process through RAG
-        result = rag_chain.query(
+        # Process through RAG, off the event loop
+        result = await message_queue.run(
+            rag_chain.query,
             query=message_text,
             mode="standard",
-            conversation_history=history
+            conversation_history=history,
+            on_text=lambda text: loop.call_soon_threadsafe(reply.update, text)
         )
         
         response_text = result["response"]
@@ -163,9 +394,9 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Update conversation history
         history.append({"role": "user", "content": message_text})
         history.append({"role": "assistant", "content": response_text})
-        user_states[user_id] = history[-10:]  # Keep last 10 messages
+        user_states.set(user_id, history[-10:])  # Keep last 10 messages
         
-        # Prepare response with optional escalation button
+        # Final edit, with optional escalation button
         if escalate or confidence < 0.5:
             keyboard = [[InlineKeyboardButton("👤 Falar com Humano", callback_data="human")]]
             reply_markup = InlineKeyboardMarkup(keyboard)
@@ -173,24 +404,24 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if confidence < 0.5:
                 response_text += "\n\n_Se esta resposta não for suficiente, posso encaminhar para um colega._"
             
-            await update.message.reply_text(
-                response_text,
-                reply_markup=reply_markup,
-                parse_mode="Markdown"
-            )
+            await reply.finish(response_text, reply_markup=reply_markup, parse_mode="Markdown")
         else:
-            await update.message.reply_text(response_text)
+            await reply.finish(response_text)
         
         logger.info(
             "Response sent",
             user_id=user_id,
             confidence=confidence,
-            escalate=escalate
+            escalate=escalate,
+            first_text_ms=round((reply.first_edit_at - started) * 1000) if reply.first_edit_at else None,
+            processing_ms=round((time.perf_counter() - started) * 1000),
+            edits=reply.edits,
+            queue_depth=message_queue.depth
         )
         
     except Exception as e:
         logger.error("Failed to process message", error=str(e))
-        await update.message.reply_text(
+        await reply.finish(
             "Peço desculpa, ocorreu um erro. Por favor, tente novamente ou use /humano para falar com um atendente."
         )
 
@@ -230,30 +461,84 @@ Tem outra questão? Escreva-me! 💬"""
         )
 
 
+async def close_components(application: Application) -> None:
+    """Release the bot's thread pool and flush its user state (post-shutdown hook)."""
+    application.bot_data["message_queue"].executor.shutdown(wait=False)
+    application.bot_data["user_states"].close()
+
+
+def build_application(rag_chain: RAGChain) -> Application:
+    """
+    Create the bot application around a RAG chain.
+    
+    The same application serves long polling (main) and the webhook route
+    of the API server, which passes in its own, already warmed, chain.
+    
+    Args:
+        rag_chain: RAG chain used to answer messages
+    
+    Returns:
+        Application with handlers registered (not yet initialized)
+    """
+    # Updates run concurrently; each user's stay ordered in the message queue
+    application = (
+        Application.builder()
+        .token(settings.telegram_bot_token)
+        .base_url(settings.telegram_api_url)
+        .concurrent_updates(True)
+        .post_shutdown(close_components)
+        .build()
+    )
+    
+    application.bot_data["rag_chain"] = rag_chain
+    application.bot_data["message_queue"] = UserMessageQueue(settings.telegram_workers, settings.telegram_max_pending)
+    # User conversation state (hot users in memory, all of them in SQLite)
+    application.bot_data["user_states"] = UserStateStore(
+        settings.telegram_state_path,
+        max_users=settings.telegram_state_max_users,
+        ttl=settings.telegram_state_ttl,
+        retention_days=settings.telegram_state_retention_days
+    )
+    
+    # Add handlers
+    application.add_handler(CommandHandler("start", start_command))
+    application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("ajuda", help_command))
+    application.add_handler(CommandHandler("novo", new_conversation))
+    application.add_handler(CommandHandler("humano", request_human))
+    application.add_handler(CallbackQueryHandler(handle_callback))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    return application
+
+
+def get_stats(application: Application) -> Dict[str, Any]:
+    """Message queue and user state statistics of a bot application."""
+    return {
+        "queue": application.bot_data["message_queue"].get_stats(),
+        "user_states": application.bot_data["user_states"].get_stats()
+    }
+
+
 def main():
-    """Start the Telegram bot."""
+    """Start the Telegram bot with long polling."""
     if not settings.telegram_bot_token:
         print("❌ TELEGRAM_BOT_TOKEN not configured")
         print("   Set it in .env file")
         sys.exit(1)
     
+    if settings.telegram_webhook_url:
+        print("⚠️  TELEGRAM_WEBHOOK_URL is set: the API server receives updates by webhook.")
+        print("   Polling removes the webhook; unset it to use this process instead.")
+    
     print("=" * 50)
     print("🤖 AITI Assistant - Telegram Bot")
     print(f"   Company: {settings.company_name}")
     print(f"   LLM: {settings.llm_model}")
     print("=" * 50)
     
-    # Create application
-    application = Application.builder().token(settings.telegram_bot_token).build()
-    
-    # Add handlers
-    application.add_handler(CommandHandler("start", start_command))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("ajuda", help_command))
-    application.add_handler(CommandHandler("novo", new_conversation))
-    application.add_handler(CommandHandler("humano", request_human))
-    application.add_handler(CallbackQueryHandler(handle_callback))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    # Initialize components
+    vectorstore = VectorStore()
+    application = build_application(RAGChain(vectorstore))
     
     # Start bot
     print("✅ Bot started! Press Ctrl+C to stop.")
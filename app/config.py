@@ -17,13 +17,33 @@ class Settings(BaseSettings):
     gemini_api_key: Optional[str] = Field(None, alias="GEMINI_API_KEY")
     llm_model: str = Field("gpt-4o-mini", alias="LLM_MODEL")
     embedding_model: str = Field("text-embedding-3-small", alias="EMBEDDING_MODEL")
+    embedding_workers: int = Field(4, alias="EMBEDDING_WORKERS")
+    embedding_max_retries: int = Field(5, alias="EMBEDDING_MAX_RETRIES")
+    embedding_cache_path: str = Field("./data/embedding_cache.db", alias="EMBEDDING_CACHE_PATH")
+    openai_embed_max_inputs: int = Field(2048, alias="OPENAI_EMBED_MAX_INPUTS")
+    openai_embed_max_tokens: int = Field(100000, alias="OPENAI_EMBED_MAX_TOKENS")
+    gemini_embed_batch_size: int = Field(100, alias="GEMINI_EMBED_BATCH_SIZE")
+    gemini_embed_rpm: int = Field(1500, alias="GEMINI_EMBED_RPM")
+    embedding_rpm: Optional[int] = Field(None, alias="EMBEDDING_RPM")
+    embedding_tpm: int = Field(0, alias="EMBEDDING_TPM")
     
     # Database
     database_url: str = Field("sqlite:///./data/aiti.db", alias="DATABASE_URL")
+    snapshot_path: Optional[str] = Field(None, alias="SNAPSHOT_PATH")
     chroma_persist_dir: str = Field("./data/vectorstore", alias="CHROMA_PERSIST_DIR")
     
     # Telegram
     telegram_bot_token: Optional[str] = Field(None, alias="TELEGRAM_BOT_TOKEN")
+    telegram_webhook_url: Optional[str] = Field(None, alias="TELEGRAM_WEBHOOK_URL")
+    telegram_webhook_secret: Optional[str] = Field(None, alias="TELEGRAM_WEBHOOK_SECRET")
+    telegram_api_url: str = Field("https://api.telegram.org/bot", alias="TELEGRAM_API_URL")
+    telegram_workers: int = Field(8, alias="TELEGRAM_WORKERS")
+    telegram_max_pending: int = Field(3, alias="TELEGRAM_MAX_PENDING")
+    telegram_edit_interval: float = Field(1.0, alias="TELEGRAM_EDIT_INTERVAL")
+    telegram_state_path: str = Field("./data/telegram_state.db", alias="TELEGRAM_STATE_PATH")
+    telegram_state_max_users: int = Field(10000, alias="TELEGRAM_STATE_MAX_USERS")
+    telegram_state_ttl: float = Field(3600.0, alias="TELEGRAM_STATE_TTL")
+    telegram_state_retention_days: int = Field(30, alias="TELEGRAM_STATE_RETENTION_DAYS")
     
     # Server
     host: str = Field("0.0.0.0", alias="HOST")
@@ -32,15 +52,34 @@ class Settings(BaseSettings):
     log_level: str = Field("INFO", alias="LOG_LEVEL")
     
     # RAG Configuration
-    chunk_size: int = Field(500, alias="CHUNK_SIZE")
-    chunk_overlap: int = Field(50, alias="CHUNK_OVERLAP")
+    chunk_tokens: int = Field(128, alias="CHUNK_TOKENS")
+    chunk_overlap_tokens: int = Field(16, alias="CHUNK_OVERLAP_TOKENS")
     top_k_results: int = Field(5, alias="TOP_K_RESULTS")
+    ingest_workers: int = Field(4, alias="INGEST_WORKERS")
+    ingest_batch_size: int = Field(256, alias="INGEST_BATCH_SIZE")
+    indexing_concurrency: int = Field(1, alias="INDEXING_CONCURRENCY")
+    indexing_job_ttl: float = Field(3600.0, alias="INDEXING_JOB_TTL")
+    ingest_stream_threshold_mb: int = Field(20, alias="INGEST_STREAM_THRESHOLD_MB")
+    pdf_workers: int = Field(4, alias="PDF_WORKERS")
+    pdf_pages_per_task: int = Field(16, alias="PDF_PAGES_PER_TASK")
+    pdf_page_timeout: float = Field(30.0, alias="PDF_PAGE_TIMEOUT")
+    dedupe_threshold: float = Field(0.9, alias="DEDUPE_THRESHOLD")
+    watch_interval: float = Field(2.0, alias="WATCH_INTERVAL")
+    watch_debounce: float = Field(3.0, alias="WATCH_DEBOUNCE")
     confidence_threshold: float = Field(0.7, alias="CONFIDENCE_THRESHOLD")
+    confidence_precheck: bool = Field(False, alias="CONFIDENCE_PRECHECK")
+    category_routing: bool = Field(True, alias="CATEGORY_ROUTING")
+    routing_top_categories: int = Field(2, alias="ROUTING_TOP_CATEGORIES")
+    routing_min_score: float = Field(0.3, alias="ROUTING_MIN_SCORE")
     
     # Security
     api_key: Optional[str] = Field(None, alias="API_KEY")
     cors_origins: str = Field("*", alias="CORS_ORIGINS")
     
+    # Multi-Tenant
+    tenants_file: Optional[str] = Field(None, alias="TENANTS_FILE")
+    tenant_memory_budget_mb: int = Field(0, alias="TENANT_MEMORY_BUDGET_MB")
+    
     # Company Configuration
     company_name: str = Field("Empresa", alias="COMPANY_NAME")
     company_language: str = Field("pt-PT", alias="COMPANY_LANGUAGE")
@@ -0,0 +1,161 @@
+"""
+AITI Assistant - Background Indexing
+In-process job queue that indexes uploaded documents without blocking the API.
+"""
+
+import asyncio
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+import structlog
+
+from app.config import settings
+from app.ingest import DEFAULT_CATEGORY, IndexingCancelled, index_file, process_documents
+from app.registry import DocumentRegistry
+
+logger = structlog.get_logger()
+
+# Finished jobs kept in memory for GET /documents/jobs/{id}; older ones are dropped
+# (the document registry keeps the durable status of uploads)
+MAX_FINISHED_JOBS = 1000
+
+
+class IndexingQueue:
+    """
+    Background indexing jobs processed by a fixed number of worker tasks.
+
+    Jobs run on a dedicated thread pool sized to the number of workers, so
+    at most `concurrency` indexing jobs run at once and the threads serving
+    chat requests are never used for indexing.
+    """
+
+    def __init__(
+        self,
+        vectorstore,
+        registry: DocumentRegistry,
+        documents_dir: str,
+        concurrency: Optional[int] = None
+    ):
+        """
+        Initialize the queue.
+
+        Args:
+            vectorstore: Vector store to index into
+            registry: Document registry whose entries get status updates
+            documents_dir: Root documents directory
+            concurrency: Maximum concurrent jobs (defaults to INDEXING_CONCURRENCY)
+        """
+        self.vectorstore = vectorstore
+        self.registry = registry
+        self.documents_dir = documents_dir
+        self.concurrency = max(1, concurrency or settings.indexing_concurrency)
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.job_ttl = settings.indexing_job_ttl
+
+        self._finished: "deque[Tuple[float, str]]" = deque()
+
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="indexing")
+        self._workers = []
+
+    async def start(self) -> None:
+        """Start the worker tasks."""
+        for _ in range(self.concurrency):
+            self._workers.append(asyncio.create_task(self._worker()))
+        logger.info("Indexing queue started", concurrency=self.concurrency)
+
+    async def stop(self) -> None:
+        """Cancel the workers and wait for running jobs to finish."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._executor.shutdown(wait=True)
+        logger.info("Indexing queue stopped", pending=self._queue.qsize())
+
+    def submit_document(self, doc_id: str) -> Dict[str, Any]:
+        """Queue a registered document for indexing."""
+        return self._submit("document", doc_id=doc_id)
+
+    def submit_reindex(self) -> Dict[str, Any]:
+        """Queue an incremental re-index of the whole documents directory."""
+        return self._submit("reindex")
+
+    def _submit(self, kind: str, doc_id: Optional[str] = None) -> Dict[str, Any]:
+        job_id = str(uuid.uuid4())
+        job = {
+            "id": job_id,
+            "kind": kind,
+            "doc_id": doc_id,
+            "status": "pending_indexing",
+            "progress": 0.0,
+            "created_at": datetime.utcnow().isoformat()
+        }
+        self.jobs[job_id] = job
+
+        if doc_id:
+            self.registry.update(doc_id, status="pending_indexing", progress=0.0, job_id=job_id)
+
+        self._queue.put_nowait(job_id)
+        logger.info("Indexing job queued", job_id=job_id, kind=kind, doc_id=doc_id)
+        return job
+
+    def _update(self, job: Dict[str, Any], **fields) -> None:
+        """Update a job and the document it indexes (blocking: never call it on the event loop)."""
+        job.update(fields)
+        if job["doc_id"]:
+            self.registry.update(job["doc_id"], **fields)
+
+    def _prune(self) -> None:
+        """Drop finished jobs older than the TTL, or beyond MAX_FINISHED_JOBS."""
+        now = time.monotonic()
+        while self._finished and (
+            len(self._finished) > MAX_FINISHED_JOBS or now - self._finished[0][0] > self.job_ttl
+        ):
+            _, job_id = self._finished.popleft()
+            self.jobs.pop(job_id, None)
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            job = self.jobs[await self._queue.get()]
+            try:
+                await asyncio.to_thread(self._update, job, status="indexing")
+                await loop.run_in_executor(self._executor, self._run, job)
+                await asyncio.to_thread(self._update, job, status="indexed", progress=1.0, error=None)
+                logger.info("Indexing job finished", job_id=job["id"], kind=job["kind"])
+            except IndexingCancelled:
+                job.update(status="cancelled")
+                logger.info("Indexing job cancelled, document deleted", job_id=job["id"], doc_id=job["doc_id"])
+            except Exception as e:
+                await asyncio.to_thread(self._update, job, status="error", error=str(e))
+                logger.error("Indexing job failed", job_id=job["id"], kind=job["kind"], error=str(e))
+            finally:
+                job["finished_at"] = datetime.utcnow().isoformat()
+                self._finished.append((time.monotonic(), job["id"]))
+                self._prune()
+                self._queue.task_done()
+
+    def _run(self, job: Dict[str, Any]) -> None:
+        """Run a job (in the indexing thread pool)."""
+        if job["kind"] == "reindex":
+            job["stats"] = process_documents(self.documents_dir, self.vectorstore, workers=self.concurrency)
+            return
+
+        doc = self.registry.get(job["doc_id"])
+        if doc is None:
+            raise RuntimeError("Document was deleted before indexing")
+        chunk_ids = index_file(
+            Path(doc["file_path"]),
+            self.vectorstore,
+            category=doc.get("category") or DEFAULT_CATEGORY,
+            documents_path=Path(self.documents_dir),
+            progress=lambda fraction: self._update(job, progress=round(fraction, 3)),
+            extra_metadata={"doc_id": doc["id"]},
+            cancelled=lambda: self.registry.is_deleted(doc["id"])
+        )
+        self.registry.set_chunks(doc["id"], chunk_ids)
+        job["chunks_count"] = len(chunk_ids)
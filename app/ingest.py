@@ -4,10 +4,28 @@ Processes documents and creates embeddings for the RAG pipeline.
 """
 
 import os
+import re
 import sys
+import json
+import time
+import zlib
+import signal
+import sqlite3
+import hashlib
 import argparse
+import threading
+import multiprocessing
+from bisect import bisect_left, bisect_right
+from collections import deque
+from contextlib import contextmanager
+from itertools import accumulate
+from multiprocessing.connection import wait as wait_connections
+from concurrent.futures import (
+    FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+)
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import TYPE_CHECKING, Callable, List, Dict, Any, Deque, Iterator, NamedTuple, Optional, Tuple
+import numpy as np
 import structlog
 
 # Add parent directory to path for imports
@@ -17,108 +35,407 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from app.config import settings
-from app.rag.vectorstore import VectorStore
+from app.tenants import load_tenants
+
+# Imported lazily so parser worker processes stay light
+if TYPE_CHECKING:
+    from app.rag.vectorstore import VectorStore
 
 logger = structlog.get_logger()
 
+# Category for documents not placed in a category subdirectory
+DEFAULT_CATEGORY = "geral"
+
+
+# Text sections are cut at the first paragraph break after this many characters
+TEXT_SECTION_SIZE = 20000
+
+# Without a paragraph break, sections are cut at the next line end (or the
+# last whitespace of a longer line) after this many characters
+TEXT_SECTION_MAX = 100000
+
+
+# Seconds a PDF worker process may take to start and open the file
+PDF_WORKER_START_TIMEOUT = 60
+
+# Workers that die (or never start) in a row before a PDF is given up
+PDF_MAX_WORKER_DEATHS = 3
+
+
+# Document processing functions (lazy: each yields one page/section/row at a time)
+def _pdf_page_worker(conn, file_path: str) -> None:
+    """Extract the page ranges received on a pipe (run in PDF worker processes)."""
+    from PyPDF2 import PdfReader
+    
+    reader = PdfReader(file_path)
+    conn.send("ready")
+    while True:
+        task = conn.recv()
+        if task is None:
+            return
+        start, end = task
+        for page_num in range(start, end):
+            try:
+                conn.send((page_num, reader.pages[page_num - 1].extract_text() or "", None))
+            except Exception as e:
+                conn.send((page_num, "", str(e)))
+
+
+def extract_pdf_pages(
+    file_path: str,
+    page_count: int,
+    workers: int = None,
+    pages_per_task: int = None,
+    page_timeout: float = None
+) -> Iterator[Tuple[int, str, Optional[str]]]:
+    """
+    Extract PDF pages in a pool of worker processes, one page range per task.
+    
+    Every worker must finish each page within the time limit. A worker that
+    exceeds it or dies is killed, its page is reported as failed and the rest
+    of its range goes back to the queue for a fresh worker, so one bad page
+    never affects the others. After PDF_MAX_WORKER_DEATHS workers in a row
+    die or fail to start, the file is given up.
+    
+    Args:
+        file_path: PDF file
+        page_count: Number of pages
+        workers: Worker processes (defaults to PDF_WORKERS)
+        pages_per_task: Pages per range (defaults to PDF_PAGES_PER_TASK)
+        page_timeout: Seconds allowed per page (defaults to PDF_PAGE_TIMEOUT)
+    
+    Yields:
+        Tuples of (page_num, text, error) in page order; error is None on success
+    
+    Raises:
+        RuntimeError: If PDF_MAX_WORKER_DEATHS workers in a row died
+    """
+    workers = max(1, workers or settings.pdf_workers)
+    pages_per_task = max(1, pages_per_task or settings.pdf_pages_per_task)
+    page_timeout = page_timeout or settings.pdf_page_timeout
+    
+    context = multiprocessing.get_context("spawn")
+    ranges: Deque[Tuple[int, int]] = deque(
+        (start, min(start + pages_per_task, page_count + 1))
+        for start in range(1, page_count + 1, pages_per_task)
+    )
+    active: Dict[Any, Dict[str, Any]] = {}
+    extracted: Dict[int, Tuple[str, Optional[str]]] = {}
+    deaths = 0
+    
+    def start_worker() -> None:
+        conn, child_conn = context.Pipe()
+        process = context.Process(target=_pdf_page_worker, args=(child_conn, file_path), daemon=True)
+        process.start()
+        child_conn.close()
+        # Start-up time does not count against the first page
+        worker = {"process": process, "conn": conn, "deadline": time.monotonic() + PDF_WORKER_START_TIMEOUT}
+        active[conn] = worker
+        assign(worker)
+    
+    def assign(worker: Dict[str, Any]) -> None:
+        if not ranges:
+            stop(worker)
+            return
+        worker["next"], worker["end"] = ranges.popleft()
+        if worker.get("ready"):
+            worker["deadline"] = time.monotonic() + page_timeout
+        worker["conn"].send((worker["next"], worker["end"]))
+    
+    def stop(worker: Dict[str, Any], kill: bool = False) -> None:
+        active.pop(worker["conn"])
+        if kill:
+            worker["process"].kill()
+        else:
+            try:
+                worker["conn"].send(None)
+            except OSError:
+                pass
+        worker["conn"].close()
+        worker["process"].join(timeout=5)
+    
+    def fail(worker: Dict[str, Any], error: str) -> None:
+        nonlocal deaths
+        if error == "worker process died" or not worker.get("ready"):
+            deaths += 1
+            if deaths >= PDF_MAX_WORKER_DEATHS:
+                raise RuntimeError(f"gave up after {deaths} PDF worker failures in a row ({error})")
+        page_num = worker["next"]
+        extracted[page_num] = ("", error)
+        if page_num + 1 < worker["end"]:
+            ranges.appendleft((page_num + 1, worker["end"]))
+        stop(worker, kill=True)
+        if ranges:
+            start_worker()
+    
+    next_page = 1
+    try:
+        for _ in range(min(workers, len(ranges))):
+            start_worker()
+        
+        while next_page <= page_count and active:
+            timeout = max(0.0, min(w["deadline"] for w in active.values()) - time.monotonic())
+            for conn in wait_connections(list(active), timeout):
+                worker = active[conn]
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    fail(worker, "worker process died")
+                    continue
+                if message == "ready":
+                    worker["ready"] = True
+                    worker["deadline"] = time.monotonic() + page_timeout
+                    continue
+                page_num, text, error = message
+                deaths = 0
+                extracted[page_num] = (text, error)
+                worker["next"] = page_num + 1
+                worker["deadline"] = time.monotonic() + page_timeout
+                if worker["next"] >= worker["end"]:
+                    assign(worker)
+            
+            now = time.monotonic()
+            for worker in [w for w in active.values() if w["deadline"] <= now]:
+                fail(worker, f"timed out after {page_timeout}s")
+            
+            while next_page in extracted:
+                text, error = extracted.pop(next_page)
+                yield next_page, text, error
+                next_page += 1
+    finally:
+        for worker in list(active.values()):
+            stop(worker, kill=True)
+
+
+def _can_time_limit() -> bool:
+    """Whether SIGALRM can interrupt work in the current thread."""
+    return hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+
+
+@contextmanager
+def _time_limit(seconds: float):
+    """Raise TimeoutError if the block runs longer than the given seconds (main thread only)."""
+    def on_timeout(signum, frame):
+        raise TimeoutError(f"timed out after {seconds}s")
+    
+    previous = signal.signal(signal.SIGALRM, on_timeout)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _extract_pages_inline(reader, page_timeout: float) -> Iterator[Tuple[int, str, Optional[str]]]:
+    """Extract PDF pages in the current process, one time limit per page."""
+    for page_num, page in enumerate(reader.pages, 1):
+        try:
+            with _time_limit(page_timeout):
+                text = page.extract_text() or ""
+            yield page_num, text, None
+        except Exception as e:
+            yield page_num, "", str(e) or type(e).__name__
 
-# Document processing functions
-def load_pdf(file_path: str) -> List[Dict[str, Any]]:
-    """Load and extract text from PDF file."""
+
+def load_pdf(file_path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the text of each PDF page, in page order.
+    
+    Each page has PDF_PAGE_TIMEOUT seconds; pages that fail or time out are
+    skipped and reported. PDFs longer than PDF_PAGES_PER_TASK pages (or read
+    outside the main thread, where the time limit needs a separate process)
+    are extracted by a pool of PDF_WORKERS processes. Parser worker processes
+    already run one file each in parallel, so they extract inline (with the
+    per-page time limit) instead of starting a pool per PDF.
+    """
     try:
         from PyPDF2 import PdfReader
         
         reader = PdfReader(file_path)
-        chunks = []
-        
-        for page_num, page in enumerate(reader.pages, 1):
-            text = page.extract_text()
-            if text and text.strip():
-                chunks.append({
-                    "text": text.strip(),
-                    "metadata": {
-                        "source": os.path.basename(file_path),
-                        "page": page_num,
-                        "type": "pdf"
-                    }
-                })
-        
-        return chunks
+        page_count = len(reader.pages)
     except Exception as e:
         logger.error("Failed to load PDF", file=file_path, error=str(e))
-        return []
+        raise
+    
+    in_parser_worker = multiprocessing.parent_process() is not None and _can_time_limit()
+    use_pool = settings.pdf_workers > 0 and not in_parser_worker and (
+        page_count > settings.pdf_pages_per_task or not _can_time_limit()
+    )
+    if use_pool:
+        pages = extract_pdf_pages(file_path, page_count)
+    else:
+        pages = _extract_pages_inline(reader, settings.pdf_page_timeout)
+    
+    started = time.perf_counter()
+    failed_pages = []
+    for page_num, text, error in pages:
+        if error:
+            failed_pages.append(page_num)
+            logger.warning("Failed to extract PDF page", file=file_path, page=page_num, error=error)
+            continue
+        if text.strip():
+            yield {
+                "text": text.strip(),
+                "metadata": {
+                    "source": os.path.basename(file_path),
+                    "page": page_num,
+                    "type": "pdf"
+                }
+            }
+    
+    elapsed = time.perf_counter() - started
+    logger.info(
+        "PDF extracted",
+        file=file_path,
+        pages=page_count,
+        failed_pages=failed_pages,
+        workers=min(settings.pdf_workers, -(-page_count // settings.pdf_pages_per_task)) if use_pool else 0,
+        seconds=round(elapsed, 2),
+        pages_per_second=round(page_count / elapsed, 1) if elapsed > 0 else None
+    )
 
 
-def load_docx(file_path: str) -> List[Dict[str, Any]]:
-    """Load and extract text from DOCX file."""
+def load_docx(file_path: str) -> Iterator[Dict[str, Any]]:
+    """Yield DOCX sections, split on headings."""
     try:
         from docx import Document
         
         doc = Document(file_path)
-        text = "\n".join([para.text for para in doc.paragraphs if para.text.strip()])
+        heading = None
+        section_num = 0
+        lines = []
         
-        if text:
-            return [{
-                "text": text,
-                "metadata": {
-                    "source": os.path.basename(file_path),
-                    "type": "docx"
-                }
-            }]
-        return []
+        def make_section():
+            metadata = {
+                "source": os.path.basename(file_path),
+                "section": section_num,
+                "type": "docx"
+            }
+            if heading:
+                metadata["heading"] = heading
+            return {"text": "\n".join(lines), "metadata": metadata}
+        
+        for para in doc.paragraphs:
+            text = para.text.strip()
+            if not text:
+                continue
+            
+            style = para.style.name if para.style is not None else ""
+            if style.startswith(("Heading", "Title", "Título")):
+                if lines:
+                    yield make_section()
+                section_num += 1
+                heading = text
+                lines = [text]
+            else:
+                lines.append(text)
+        
+        if lines:
+            yield make_section()
     except Exception as e:
         logger.error("Failed to load DOCX", file=file_path, error=str(e))
-        return []
+        raise
 
 
-def load_text(file_path: str) -> List[Dict[str, Any]]:
-    """Load text file."""
+def load_text(file_path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Yield a text file in paragraph-aligned sections.
+    
+    Files without blank lines (logs, exports, single-paragraph dumps) are
+    cut at line ends, or inside over-long lines at whitespace, once a
+    section reaches TEXT_SECTION_MAX characters, so memory stays bounded.
+    """
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            text = f.read().strip()
+        section_num = 0
+        lines = []
+        size = 0
         
-        if text:
-            return [{
-                "text": text,
+        def make_section():
+            return {
+                "text": "".join(lines).strip(),
                 "metadata": {
                     "source": os.path.basename(file_path),
+                    "section": section_num,
                     "type": "text"
                 }
-            }]
-        return []
+            }
+        
+        with open(file_path, "r", encoding="utf-8") as f:
+            # Lines are read in pieces of at most TEXT_SECTION_SIZE characters
+            for line in iter(lambda: f.readline(TEXT_SECTION_SIZE), ""):
+                lines.append(line)
+                size += len(line)
+                if size < TEXT_SECTION_SIZE or (line.strip() and size < TEXT_SECTION_MAX):
+                    continue
+                
+                carry = ""
+                if not line.endswith("\n") and line.strip():
+                    # Inside an over-long line: cut after its last whitespace
+                    cut = max(line.rfind(" "), line.rfind("\t")) + 1
+                    if cut:
+                        lines[-1], carry = line[:cut], line[cut:]
+                section = make_section()
+                if section["text"]:
+                    yield section
+                    section_num += 1
+                lines, size = ([carry], len(carry)) if carry else ([], 0)
+        
+        section = make_section()
+        if section["text"]:
+            yield section
     except Exception as e:
         logger.error("Failed to load text file", file=file_path, error=str(e))
-        return []
+        raise
 
 
-def load_csv(file_path: str) -> List[Dict[str, Any]]:
-    """Load CSV file - each row becomes a chunk."""
+# CSV rows per section: rows are then packed into chunks by chunk_text
+CSV_ROWS_PER_SECTION = 50
+
+
+def load_csv(file_path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Yield CSV rows in sections of CSV_ROWS_PER_SECTION rows.
+    
+    Each row is its own paragraph, so chunk_text packs several whole rows
+    into each chunk. Exact lookups are served by the CSV table instead.
+    """
     try:
         import csv
         
-        chunks = []
+        def make_section(rows: List[str], first_row: int) -> Dict[str, Any]:
+            return {
+                "text": "\n\n".join(rows),
+                "metadata": {
+                    "source": os.path.basename(file_path),
+                    "row": first_row,
+                    "rows": f"{first_row}-{first_row + len(rows) - 1}",
+                    "type": "csv"
+                }
+            }
+        
         with open(file_path, "r", encoding="utf-8") as f:
             reader = csv.DictReader(f)
+            rows, first_row = [], 1
             for row_num, row in enumerate(reader, 1):
                 # Convert row to text
                 text = " | ".join([f"{k}: {v}" for k, v in row.items() if v])
-                if text:
-                    chunks.append({
-                        "text": text,
-                        "metadata": {
-                            "source": os.path.basename(file_path),
-                            "row": row_num,
-                            "type": "csv"
-                        }
-                    })
-        
-        return chunks
+                if not text:
+                    continue
+                if not rows:
+                    first_row = row_num
+                rows.append(text)
+                if len(rows) >= CSV_ROWS_PER_SECTION:
+                    yield make_section(rows, first_row)
+                    rows = []
+            if rows:
+                yield make_section(rows, first_row)
     except Exception as e:
         logger.error("Failed to load CSV", file=file_path, error=str(e))
-        return []
+        raise
 
 
-def load_document(file_path: str) -> List[Dict[str, Any]]:
+def load_document(file_path: str) -> Iterator[Dict[str, Any]]:
     """Load document based on file extension."""
     ext = os.path.splitext(file_path)[1].lower()
     
@@ -135,116 +452,1198 @@ def load_document(file_path: str) -> List[Dict[str, Any]]:
         return loader(file_path)
     else:
         logger.warning("Unsupported file type", file=file_path, extension=ext)
-        return []
+        return iter([])
+
+
+# Abbreviations whose trailing period does not end a sentence (lowercase, without the period)
+PT_ABBREVIATIONS = {
+    "sr", "sra", "srs", "sras", "dr", "dra", "drs", "eng", "enga", "arq", "prof", "profa",
+    "exmo", "exma", "exmos", "exmas", "ilmo", "ilma", "sto", "sta", "d", "v", "v.exa",
+    "av", "r", "lg", "pç", "tv", "estr", "lda", "s.a", "cia", "dept", "dep",
+    "n", "nº", "n.º", "no", "núm", "art", "arts", "al", "cap", "caps", "pág", "págs", "p", "pp",
+    "fl", "fls", "vol", "ed", "séc", "tel", "telef", "fax", "ext", "ref", "proc",
+    "etc", "ex", "p.ex", "i.e", "e.g", "cf", "vs", "obs", "aprox", "máx", "mín", "min",
+    "jan", "fev", "mar", "abr", "mai", "jun", "jul", "ago", "set", "out", "nov", "dez",
+}
+
+def _abbreviation_guards() -> str:
+    """Lookbehinds rejecting a period after a known abbreviation (one per length, as they must be fixed-width)."""
+    by_length: Dict[int, List[str]] = {}
+    for abbreviation in PT_ABBREVIATIONS:
+        by_length.setdefault(len(abbreviation), []).append(re.escape(abbreviation))
+    return "".join(rf"(?<!\b(?:{'|'.join(sorted(group))})\.)" for _, group in sorted(by_length.items()))
+
+
+# Sentence boundaries, found in one pass: terminal punctuation (plus closing quotes)
+# followed by whitespace, or a blank line. A period is not a boundary after a known
+# abbreviation, a single letter (initials) or when the next sentence starts in lowercase.
+SENTENCE_BOUNDARY = re.compile(
+    r"[.!?…\n](?:"
+    rf"(?<=\.)(?<![.!?…]\.)(?<!\b\w\.)(?i:{_abbreviation_guards()})[.!?…]*[\"'»”)\]]*(?:\s+(?![\sa-zß-öø-ÿ])|\s*\Z)"
+    r"|(?<=[!?…])(?<![.!?…].)[.!?…]*[\"'»”)\]]*\s+"
+    r"|(?<=\n)\s*\n"
+    r")"
+)
 
 
-def chunk_text(text: str, chunk_size: int = None, overlap: int = None) -> List[str]:
+# Seconds before a failed tiktoken load is tried again
+ENCODING_RETRY_SECONDS = 300.0
+
+# Loaded tiktoken encoding, and when a failed load may be retried
+_encoding: Dict[str, Any] = {"encoding": None, "retry_at": 0.0}
+
+
+def get_encoding():
+    """
+    tiktoken encoding used to size chunks (None if it cannot be loaded).
+    
+    Only a successful load is cached. After a failure (e.g. offline with no
+    cached encoding file) tokens are estimated from length and the load is
+    retried after ENCODING_RETRY_SECONDS.
+    """
+    if _encoding["encoding"] is None and time.monotonic() >= _encoding["retry_at"]:
+        try:
+            import tiktoken
+            _encoding["encoding"] = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            _encoding["retry_at"] = time.monotonic() + ENCODING_RETRY_SECONDS
+            logger.warning("tiktoken unavailable, estimating tokens from length", error=str(e))
+    return _encoding["encoding"]
+
+
+def init_parser_worker(tokenizer: bool) -> None:
+    """Parser process initializer: never try to load tiktoken if the parent process could not."""
+    if not tokenizer:
+        _encoding["retry_at"] = float("inf")
+
+
+def sentence_ends(text: str) -> List[int]:
     """
-    Split text into chunks with overlap.
+    End offsets of the sentences of a text, found in a single regex pass.
+    
+    Each sentence keeps its trailing whitespace, so consecutive ends cover
+    the whole text. See SENTENCE_BOUNDARY for what ends a sentence.
+    """
+    ends = [match.end() for match in SENTENCE_BOUNDARY.finditer(text)]
+    if text and (not ends or ends[-1] < len(text)):
+        ends.append(len(text))
+    return ends
+
+
+def chunk_text(text: str, chunk_tokens: int = None, overlap_tokens: int = None) -> List[str]:
+    """
+    Split text into chunks of about `chunk_tokens` tokens on sentence boundaries.
+    
+    Runs in linear time: sentences are found in one regex pass and counted
+    once (in a single tiktoken batch), then chunk ends are found by bisecting
+    the running token totals and each chunk is sliced straight from the
+    text, so packed text is never split or counted again. Overlap is made of
+    whole trailing sentences and is always smaller than the previous chunk,
+    so every chunk adds new text. Sentences longer than a chunk are cut into
+    equal slices of at most `chunk_tokens` tokens.
     
     Args:
         text: The text to split
-        chunk_size: Maximum chunk size in characters
-        overlap: Number of characters to overlap between chunks
+        chunk_tokens: Target chunk size in tokens
+        overlap_tokens: Maximum tokens repeated from the previous chunk
     """
-    chunk_size = chunk_size or settings.chunk_size
-    overlap = overlap or settings.chunk_overlap
+    chunk_tokens = chunk_tokens or settings.chunk_tokens
+    overlap_tokens = min(overlap_tokens if overlap_tokens is not None else settings.chunk_overlap_tokens, chunk_tokens // 2)
+    encoding = get_encoding()
+    
+    ends = sentence_ends(text)
+    starts = [0, *ends[:-1]]
+    if encoding is None:
+        counts = [(end - start) // 4 or 1 for start, end in zip(starts, ends)]
+    else:
+        counts = [len(tokens) for tokens in encoding.encode_ordinary_batch([text[start:end] for start, end in zip(starts, ends)])]
     
-    if len(text) <= chunk_size:
-        return [text]
+    if counts and max(counts) > chunk_tokens:
+        long_ends, long_counts = [], []
+        for start, end, tokens in zip(starts, ends, counts):
+            pieces = -(-tokens // chunk_tokens)
+            size = -(-(end - start) // pieces)
+            cuts = [*range(start + size, end, size), end]
+            long_ends.extend(cuts)
+            long_counts.extend([-(-tokens // pieces)] * len(cuts))
+        ends, counts = long_ends, long_counts
     
+    # bounds[i] = text offset of sentence i, offsets[i] = tokens before it
+    bounds = [0, *ends]
+    offsets = [0, *accumulate(counts)]
     chunks = []
     start = 0
     
-    while start < len(text):
-        end = start + chunk_size
-        
-        # Try to break at sentence boundary
-        if end < len(text):
-            # Look for sentence ending
-            for sep in [". ", ".\n", "? ", "!\n"]:
-                last_sep = text[start:end].rfind(sep)
-                if last_sep > chunk_size * 0.5:  # At least halfway
-                    end = start + last_sep + len(sep)
-                    break
-        
-        chunk = text[start:end].strip()
+    while start < len(ends):
+        # As many whole sentences as fit (at least one)
+        end = max(start + 1, bisect_right(offsets, offsets[start] + chunk_tokens) - 1)
+        chunk = text[bounds[start]:bounds[end]].strip()
         if chunk:
             chunks.append(chunk)
-        
-        start = end - overlap
-        if start < 0:
-            start = 0
+        if end == len(ends):
+            break
+        # Keep whole trailing sentences as overlap, leaving room for the next
+        # sentence and always dropping at least one
+        start = max(
+            start + 1,
+            bisect_left(offsets, offsets[end] - overlap_tokens),
+            bisect_left(offsets, offsets[end + 1] - chunk_tokens)
+        )
     
     return chunks
 
 
-def process_documents(documents_dir: str, vectorstore: VectorStore, verbose: bool = False):
+def get_category(file_path: Path, documents_path: Path) -> str:
+    """Category of a document: its top-level subdirectory under documents_path."""
+    try:
+        parts = file_path.resolve().relative_to(documents_path.resolve()).parts
+    except ValueError:
+        return DEFAULT_CATEGORY
+    return parts[0].lower() if len(parts) > 1 else DEFAULT_CATEGORY
+
+
+def file_sha256(file_path: Path) -> str:
+    """Hash a file's contents without reading it all into memory."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def make_chunk_id(key: str, metadata: Dict[str, Any], text: str) -> str:
+    """Deterministic chunk ID from (source, page, chunk_index, content hash)."""
+    page = metadata.get("page", metadata.get("row", metadata.get("section", "")))
+    content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    raw = f"{key}|{page}|{metadata.get('chunk_index', 0)}|{content_hash}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def get_manifest_path(vectorstore: "VectorStore", version: str = None) -> str:
+    """Manifest of indexed files, stored next to the collection version it describes."""
+    return os.path.join(vectorstore.persist_dir, f"{version or vectorstore.physical_name}_manifest.json")
+
+
+def get_dedupe_path(vectorstore: "VectorStore", version: str = None) -> str:
+    """Near-duplicate signatures of a collection version, next to its manifest."""
+    return os.path.join(vectorstore.persist_dir, f"{version or vectorstore.physical_name}_minhash.db")
+
+
+def remove_version_files(vectorstore: "VectorStore", version: str) -> None:
+    """Delete the manifest and dedupe signatures of a dropped collection version."""
+    dedupe_path = get_dedupe_path(vectorstore, version)
+    for path in (get_manifest_path(vectorstore, version), dedupe_path, f"{dedupe_path}-wal", f"{dedupe_path}-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def load_manifest(vectorstore: "VectorStore") -> Dict[str, Dict[str, Any]]:
+    """Load the manifest mapping file keys to hash, mtime, size and chunk IDs."""
+    path = get_manifest_path(vectorstore)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(vectorstore: "VectorStore", manifest: Dict[str, Dict[str, Any]]) -> None:
+    """Write the manifest atomically."""
+    path = get_manifest_path(vectorstore)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+
+def get_file_key(file_path: Path, documents_path: Path) -> str:
+    """Stable manifest key for a file: its path relative to the documents directory."""
+    try:
+        return file_path.resolve().relative_to(documents_path.resolve()).as_posix()
+    except ValueError:
+        return file_path.resolve().as_posix()
+
+
+def iter_chunks(file_path: Path, key: str, category: str) -> Iterator[Tuple[str, Dict[str, Any], str]]:
+    """
+    Lazily load and chunk a document, assigning deterministic chunk IDs.
+    
+    Yields:
+        Tuples of (text, metadata, chunk_id)
+    """
+    for doc in load_document(str(file_path)):
+        for i, chunk in enumerate(chunk_text(doc["text"])):
+            metadata = doc["metadata"].copy()
+            metadata["chunk_index"] = i
+            metadata["category"] = category
+            metadata["path"] = key
+            yield chunk, metadata, make_chunk_id(key, metadata, chunk)
+
+
+def build_chunks(file_path: Path, key: str, category: str) -> List[Tuple[str, Dict[str, Any], str]]:
+    """Load and chunk a whole document (run in parser worker processes)."""
+    return list(iter_chunks(file_path, key, category))
+
+
+class MinHashDeduper:
+    """
+    Near-duplicate detection for chunks with MinHash and LSH banding.
+    
+    Each chunk is reduced to a MinHash signature of its word 3-grams. The
+    signature is split into bands; chunks sharing a band are candidates,
+    and a candidate is a duplicate when the estimated Jaccard similarity of
+    the two signatures reaches the threshold. The first chunk seen survives.
+    
+    Signatures and bands live in SQLite, keyed by chunk ID. With a path
+    (one file per collection version, next to its manifest) they persist,
+    so incremental runs and the watch mode dedupe against what is already
+    indexed; without one they only cover the current call.
+    """
+    
+    NUM_PERM = 64
+    BANDS = 16
+    SHINGLE_SIZE = 3
+    # Mersenne prime for the (a * x + b) mod p permutations
+    PRIME = (1 << 31) - 1
+    
+    def __init__(self, threshold: float, path: str = None):
+        """
+        Initialize the deduper.
+        
+        Args:
+            threshold: Jaccard similarity from which chunks are duplicates
+            path: SQLite file keeping signatures between runs (in memory if None)
+        """
+        self.threshold = threshold
+        self.rows = self.NUM_PERM // self.BANDS
+        rng = np.random.default_rng(1)
+        self.a = rng.integers(1, self.PRIME, self.NUM_PERM, dtype=np.uint64)[:, None]
+        self.b = rng.integers(0, self.PRIME, self.NUM_PERM, dtype=np.uint64)[:, None]
+        
+        self._conn = sqlite3.connect(path or ":memory:", timeout=30)
+        if path:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS signatures ("
+            " id INTEGER PRIMARY KEY, chunk_id TEXT NOT NULL UNIQUE, key TEXT NOT NULL, signature BLOB NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS signatures_key ON signatures (key)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS bands (hash INTEGER NOT NULL, id INTEGER NOT NULL,"
+            " PRIMARY KEY (hash, id)) WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS bands_id ON bands (id)")
+        self._conn.commit()
+    
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature of a text's word shingles."""
+        words = re.findall(r"\w+", text.lower())
+        n = self.SHINGLE_SIZE
+        shingles = {" ".join(words[i:i + n]) for i in range(max(len(words) - n + 1, 1))}
+        x = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+        return ((self.a * (x % self.PRIME) + self.b) % self.PRIME).min(axis=1).astype(np.uint32)
+    
+    def _bands(self, signature: np.ndarray) -> List[int]:
+        """One 64-bit hash per band (the band number is part of the hash)."""
+        return [
+            int.from_bytes(
+                hashlib.blake2b(
+                    bytes([band]) + signature[band * self.rows:(band + 1) * self.rows].tobytes(),
+                    digest_size=8
+                ).digest(),
+                "big",
+                signed=True
+            )
+            for band in range(self.BANDS)
+        ]
+    
+    def add(self, chunk_id: str, key: str, text: str) -> None:
+        """Index a chunk that is kept."""
+        self._index(self.signature(text), chunk_id, key)
+    
+    def _index(self, signature: np.ndarray, chunk_id: str, key: str) -> None:
+        self._remove("chunk_id = ?", [chunk_id])
+        cursor = self._conn.execute(
+            "INSERT INTO signatures (chunk_id, key, signature) VALUES (?, ?, ?)",
+            (chunk_id, key, signature.tobytes())
+        )
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO bands VALUES (?, ?)",
+            [(band, cursor.lastrowid) for band in self._bands(signature)]
+        )
+    
+    def check(self, chunk_id: str, key: str, text: str) -> Optional[Tuple[str, str]]:
+        """
+        Find the chunk a new chunk duplicates, indexing it if it is unique.
+        
+        Returns:
+            (chunk ID, file key) of the surviving chunk, or None if unique
+        """
+        signature = self.signature(text)
+        bands = self._bands(signature)
+        candidates = self._conn.execute(
+            "SELECT chunk_id, key, signature FROM signatures WHERE id IN"
+            f" (SELECT id FROM bands WHERE hash IN ({','.join('?' * len(bands))})) ORDER BY id",
+            bands
+        )
+        for survivor_id, survivor_key, blob in candidates:
+            if survivor_id != chunk_id and np.mean(np.frombuffer(blob, dtype=np.uint32) == signature) >= self.threshold:
+                return survivor_id, survivor_key
+        
+        self._index(signature, chunk_id, key)
+        return None
+    
+    def _remove(self, condition: str, params: List[str]) -> None:
+        ids = [row[0] for row in self._conn.execute(f"SELECT id FROM signatures WHERE {condition}", params)]
+        if ids:
+            self._conn.executemany("DELETE FROM bands WHERE id = ?", [(i,) for i in ids])
+            self._conn.executemany("DELETE FROM signatures WHERE id = ?", [(i,) for i in ids])
+    
+    def remove_chunks(self, chunk_ids: List[str]) -> None:
+        """Forget chunks that were not stored or were deleted."""
+        for chunk_id in chunk_ids:
+            self._remove("chunk_id = ?", [chunk_id])
+    
+    def remove_files(self, keys: List[str]) -> None:
+        """Forget every chunk of files that were replaced or deleted."""
+        for key in keys:
+            self._remove("key = ?", [key])
+    
+    def commit(self) -> None:
+        """Persist the changes made so far."""
+        self._conn.commit()
+    
+    def close(self) -> None:
+        """Commit and close the database."""
+        self._conn.commit()
+        self._conn.close()
+
+
+class IngestJob(NamedTuple):
+    """A file that needs (re)indexing."""
+    path: Path
+    key: str
+    category: str
+    sha256: str
+    mtime: float
+    size: int
+    entry: Optional[Dict[str, Any]]
+
+
+class IngestPipeline:
     """
-    Process all documents in directory and add to vectorstore.
+    Streams files through parse → chunk → embed → store with bounded memory.
+    
+    Files are parsed and chunked in a process pool, new chunks are grouped
+    into fixed-size batches that are embedded and written concurrently, and
+    each file is checkpointed in the manifest once all its chunks are stored,
+    so an interrupted run resumes where it stopped. Files above the stream
+    threshold are chunked lazily in this process instead, so peak memory
+    does not grow with file size.
+    """
+    
+    # Seconds between manifest checkpoints
+    CHECKPOINT_INTERVAL = 2.0
+    
+    def __init__(
+        self,
+        vectorstore: "VectorStore",
+        manifest: Dict[str, Dict[str, Any]],
+        stats: Dict[str, Any],
+        workers: int,
+        batch_size: int,
+        verbose: bool = False
+    ):
+        self.vectorstore = vectorstore
+        self.manifest = manifest
+        self.stats = stats
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.stream_threshold = settings.ingest_stream_threshold_mb * 1024 * 1024
+        self.verbose = verbose
+        
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.batch: List[tuple] = []
+        self.in_flight: Dict[Future, List[tuple]] = {}
+        self.last_checkpoint = time.monotonic()
+        
+        # Signatures of every indexed chunk; near-duplicates found in this run:
+        # survivor chunk ID -> duplicate file keys
+        self.deduper = (
+            MinHashDeduper(settings.dedupe_threshold, get_dedupe_path(vectorstore))
+            if settings.dedupe_threshold else None
+        )
+        self.duplicates: Dict[str, set] = {}
+    
+    def run(self, jobs: List[IngestJob]) -> None:
+        """Index the given files."""
+        large = [job for job in jobs if job.size > self.stream_threshold]
+        jobs = iter([job for job in jobs if job.size <= self.stream_threshold])
+        parsing: Dict[Future, IngestJob] = {}
+        # Load the encoding once here: workers skip it (and its download) if it failed
+        tokenizer = get_encoding() is not None
+        
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_parser_worker,
+            initargs=(tokenizer,)
+        ) as parsers, \
+                ThreadPoolExecutor(max_workers=self.workers) as writers:
+            self.writers = writers
+            
+            def submit_next() -> None:
+                job = next(jobs, None)
+                if job is not None:
+                    parsing[parsers.submit(build_chunks, job.path, job.key, job.category)] = job
+            
+            # Keep a bounded window of files being parsed
+            for _ in range(self.workers * 2):
+                submit_next()
+            
+            while parsing:
+                done, _ = wait(parsing, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = parsing.pop(future)
+                    submit_next()
+                    try:
+                        chunks = future.result()
+                    except Exception as e:
+                        # Not recorded in the manifest: retried on the next run
+                        logger.error("Failed to parse document", file=str(job.path), error=str(e))
+                        self.stats["files_failed"] += 1
+                        continue
+                    self._add_file(job, chunks)
+            
+            for job in large:
+                self._add_file(job, iter_chunks(job.path, job.key, job.category))
+            
+            self._flush()
+            self._drain(0)
+        
+        if self.duplicates:
+            self.vectorstore.add_duplicate_sources(self.duplicates)
+        if self.deduper:
+            self.deduper.close()
+        save_manifest(self.vectorstore, self.manifest)
+    
+    def _add_file(self, job: IngestJob, chunks) -> None:
+        """Queue a file's new chunks for embedding as they are produced."""
+        old_ids = set(job.entry["chunk_ids"]) if job.entry else set()
+        state = {"job": job, "ids": [], "pending": 0, "failed": set(), "parsed": False, "duplicate_of": set()}
+        self.files[job.key] = state
+        # The file's previous signatures go; its kept chunks are indexed again below
+        if self.deduper:
+            self.deduper.remove_files([job.key])
+        
+        try:
+            self._add_chunks(job, state, old_ids, chunks)
+        except Exception as e:
+            # A loader failed partway (large files are chunked lazily): keep
+            # what was stored and the old chunks, and retry the file next run
+            logger.error("Failed to parse document", file=str(job.path), error=str(e))
+            state["error"] = str(e)
+        
+        state["parsed"] = True
+        state["stale"] = set() if state.get("error") else old_ids - set(state["ids"])
+        
+        if self.verbose:
+            print(f"Processing: {job.path.name} → {len(state['ids'])} chunks")
+        
+        if state["pending"] == 0:
+            self._finish(job.key)
+    
+    def _add_chunks(self, job: IngestJob, state: Dict[str, Any], old_ids: set, chunks) -> None:
+        """Queue the new chunks of a file, deduplicating them as they arrive."""
+        for text, metadata, chunk_id in chunks:
+            if chunk_id in old_ids:
+                state["ids"].append(chunk_id)
+                if self.deduper:
+                    self.deduper.add(chunk_id, job.key, text)
+                continue
+            
+            # Near-duplicates are not stored; the survivor records where they came from
+            survivor = self.deduper.check(chunk_id, job.key, text) if self.deduper else None
+            if survivor:
+                survivor_id, survivor_key = survivor
+                self.duplicates.setdefault(survivor_id, set()).add(job.key)
+                if survivor_key != job.key:
+                    state["duplicate_of"].add(survivor_key)
+                self.stats["chunks_deduplicated"] += 1
+                continue
+            
+            state["ids"].append(chunk_id)
+            state["pending"] += 1
+            self.batch.append((text, metadata, chunk_id, job.key))
+            if len(self.batch) >= self.batch_size:
+                self._flush()
+    
+    def _flush(self) -> None:
+        """Send the current batch to a writer, waiting if too many are in flight."""
+        if not self.batch:
+            return
+        
+        batch, self.batch = self.batch, []
+        
+        # Chunks can already be stored (interrupted run, lost manifest); never embed them twice
+        existing = self.vectorstore.get_existing_ids([item[2] for item in batch])
+        if existing:
+            self._complete([item for item in batch if item[2] in existing], existing)
+            batch = [item for item in batch if item[2] not in existing]
+            if not batch:
+                return
+        
+        self._drain(self.workers - 1)
+        future = self.writers.submit(
+            self.vectorstore.add_documents,
+            [item[0] for item in batch],
+            [item[1] for item in batch],
+            [item[2] for item in batch]
+        )
+        self.in_flight[future] = batch
+    
+    def _drain(self, limit: int) -> None:
+        """Wait until at most `limit` batches are in flight."""
+        while len(self.in_flight) > limit:
+            done, _ = wait(self.in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch = self.in_flight.pop(future)
+                try:
+                    stored = set(future.result())
+                except Exception as e:
+                    logger.error("Failed to store batch", error=str(e), count=len(batch))
+                    stored = set()
+                
+                self.stats["chunks_embedded"] += len(stored)
+                self._complete(batch, stored)
+    
+    def _complete(self, batch: List[tuple], stored: set) -> None:
+        """Account for finished chunks and finish files with nothing pending."""
+        for _, _, chunk_id, key in batch:
+            state = self.files[key]
+            state["pending"] -= 1
+            if chunk_id not in stored:
+                state["failed"].add(chunk_id)
+            if state["pending"] == 0 and state["parsed"]:
+                self._finish(key)
+    
+    def _finish(self, key: str) -> None:
+        """All chunks of a file are stored: drop stale chunks and checkpoint it."""
+        state = self.files.pop(key)
+        job = state["job"]
+        
+        if state["stale"]:
+            self.vectorstore.delete_documents(list(state["stale"]))
+            self.stats["chunks_deleted"] += len(state["stale"])
+        
+        # Failed chunks stay out of the manifest so the next run retries them
+        failed = state["failed"]
+        self.stats["chunks_failed"] += len(failed)
+        if self.deduper and failed:
+            self.deduper.remove_chunks(list(failed))
+        chunk_ids = [c for c in state["ids"] if c not in failed]
+        if state.get("error"):
+            # Partially read: no hash, so the file is retried; old chunks stay tracked
+            self.stats["files_failed"] += 1
+            old_ids = job.entry["chunk_ids"] if job.entry else []
+            chunk_ids = list(dict.fromkeys(old_ids + chunk_ids))
+        self.manifest[key] = {
+            "sha256": None if failed or state.get("error") else job.sha256,
+            "mtime": job.mtime,
+            "size": job.size,
+            "chunk_ids": chunk_ids
+        }
+        # Files whose chunks this file relies on: re-processed if they change
+        if state["duplicate_of"]:
+            self.manifest[key]["duplicate_of"] = sorted(state["duplicate_of"])
+        
+        if time.monotonic() - self.last_checkpoint >= self.CHECKPOINT_INTERVAL:
+            if self.deduper:
+                self.deduper.commit()
+            save_manifest(self.vectorstore, self.manifest)
+            self.last_checkpoint = time.monotonic()
+
+
+def sync_files(
+    files: List[Path],
+    documents_path: Path,
+    vectorstore: "VectorStore",
+    manifest: Dict[str, Dict[str, Any]],
+    category: str = None,
+    remove_missing: bool = False,
+    verbose: bool = False,
+    workers: int = None,
+    batch_size: int = None,
+    remove: List[str] = None
+) -> Dict[str, Any]:
+    """
+    Bring the vectorstore in line with the given files.
+    
+    Unchanged files (same mtime and size, or same hash) are skipped. For
+    changed files only chunks with new IDs are embedded and upserted, and
+    chunks that no longer exist are deleted.
     
     Args:
-        documents_dir: Directory containing documents
+        files: Files to index
+        documents_path: Root documents directory (for keys and categories)
         vectorstore: VectorStore instance
+        manifest: Manifest to update in place
+        category: Category override for all files
+        remove_missing: Delete chunks of manifest files not in `files`
         verbose: Print detailed progress
+        workers: Parser processes and concurrent embedding batches
+        batch_size: Chunks per embedding/storage batch
+        remove: Manifest keys of files known to be deleted
+        
+    Returns:
+        Ingestion statistics
     """
-    documents_path = Path(documents_dir)
+    stats = {
+        "files_new": 0, "files_changed": 0, "files_unchanged": 0, "files_removed": 0, "files_failed": 0,
+        "chunks_embedded": 0, "chunks_deleted": 0, "chunks_failed": 0, "chunks_deduplicated": 0
+    }
+    started = time.perf_counter()
+    cache = vectorstore.embedding_cache
+    cache_start = (cache.hits, cache.lookups) if cache else (0, 0)
     
-    if not documents_path.exists():
-        logger.error("Documents directory not found", path=documents_dir)
-        return
+    jobs = []
+    seen = set()
+    
+    for file_path in files:
+        key = get_file_key(file_path, documents_path)
+        seen.add(key)
+        stat = file_path.stat()
+        entry = manifest.get(key)
+        
+        # Fast path: nothing touched the file since the last run
+        if entry and entry.get("sha256") and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+            stats["files_unchanged"] += 1
+            continue
+        
+        digest = file_sha256(file_path)
+        if entry and entry.get("sha256") == digest:
+            entry.update(mtime=stat.st_mtime, size=stat.st_size)
+            stats["files_unchanged"] += 1
+            continue
+        
+        stats["files_changed" if entry else "files_new"] += 1
+        jobs.append(IngestJob(
+            path=file_path,
+            key=key,
+            category=category or get_category(file_path, documents_path),
+            sha256=digest,
+            mtime=stat.st_mtime,
+            size=stat.st_size,
+            entry=entry
+        ))
+    
+    removed = [k for k in remove or () if k in manifest]
+    if remove_missing:
+        removed += [k for k in manifest if k not in seen and k not in removed]
+    
+    # Files whose chunks were dropped as duplicates of a changed or removed
+    # file are re-processed, so their content is never lost from the index
+    touched = {job.key for job in jobs} | set(removed)
+    for key, entry in manifest.items():
+        if key in touched or not touched.intersection(entry.get("duplicate_of", ())):
+            continue
+        file_path = documents_path / key
+        if not file_path.exists():
+            continue
+        stat = file_path.stat()
+        stats["files_changed"] += 1
+        jobs.append(IngestJob(
+            path=file_path,
+            key=key,
+            category=category or get_category(file_path, documents_path),
+            sha256=file_sha256(file_path),
+            mtime=stat.st_mtime,
+            size=stat.st_size,
+            entry=entry
+        ))
+    
+    if removed:
+        stats["files_removed"] = len(removed)
+        stats["chunks_deleted"] = remove_files(removed, vectorstore, manifest)
+    
+    # CSV sources also go to their lookup table (in this process: one SQLite writer)
+    for job in jobs:
+        if job.path.suffix.lower() == ".csv":
+            vectorstore.tables.load_csv(str(job.path), job.key)
+    
+    if jobs:
+        IngestPipeline(
+            vectorstore,
+            manifest,
+            stats,
+            workers=workers or settings.ingest_workers,
+            batch_size=batch_size or settings.ingest_batch_size,
+            verbose=verbose
+        ).run(jobs)
+    
+    stats["seconds"] = round(time.perf_counter() - started, 2)
+    stats["chunks_per_sec"] = round(stats["chunks_embedded"] / max(stats["seconds"], 1e-9), 1)
+    if cache:
+        stats["cache_hits"] = cache.hits - cache_start[0]
+        stats["cache_lookups"] = cache.lookups - cache_start[1]
+        stats["cache_hit_rate"] = round(stats["cache_hits"] / max(stats["cache_lookups"], 1), 3)
+    return stats
+
+
+def remove_files(keys: List[str], vectorstore: "VectorStore", manifest: Dict[str, Dict[str, Any]]) -> int:
+    """
+    Delete the chunks of files that no longer exist.
+    
+    Args:
+        keys: Manifest keys of the removed files
+        vectorstore: VectorStore instance
+        manifest: Manifest to update in place
+        
+    Returns:
+        Number of chunks deleted
+    """
+    stale = [chunk_id for k in keys if k in manifest for chunk_id in manifest.pop(k)["chunk_ids"]]
+    if stale:
+        vectorstore.delete_documents(stale)
+    for key in keys:
+        if key.lower().endswith(".csv"):
+            vectorstore.tables.drop(key)
+    if os.path.exists(get_dedupe_path(vectorstore)):
+        deduper = MinHashDeduper(settings.dedupe_threshold, get_dedupe_path(vectorstore))
+        deduper.remove_files(keys)
+        deduper.close()
+    return len(stale)
+
+
+class IndexingCancelled(Exception):
+    """Raised when the document being indexed was deleted; its stored chunks are removed."""
+
+
+def index_file(
+    file_path: Path,
+    vectorstore: "VectorStore",
+    category: str,
+    documents_path: Path,
+    batch_size: int = None,
+    progress: Callable[[float], None] = None,
+    extra_metadata: Dict[str, Any] = None,
+    cancelled: Callable[[], bool] = None
+) -> List[str]:
+    """
+    Index a single file in batches (used for uploads by the API).
     
-    # Find all supported files
+    Args:
+        file_path: File to index
+        vectorstore: VectorStore instance
+        category: Category of the document
+        documents_path: Root documents directory (for the chunk ID key)
+        batch_size: Chunks per embedding/storage batch
+        progress: Called with the fraction of chunks done after each batch
+        extra_metadata: Added to every chunk's metadata (e.g. doc_id)
+        cancelled: Checked before each batch and at the end; when it returns
+            True the chunks and table rows stored so far are deleted
+        
+    Returns:
+        Chunk IDs of the file
+        
+    Raises:
+        RuntimeError: If some chunks failed to embed
+        IndexingCancelled: If `cancelled` returned True
+    """
+    batch_size = batch_size or settings.ingest_batch_size
+    key = get_file_key(Path(file_path), Path(documents_path))
+    if Path(file_path).suffix.lower() == ".csv":
+        vectorstore.tables.load_csv(str(file_path), key)
+    chunks = build_chunks(Path(file_path), key, category)
+    if extra_metadata:
+        for _, metadata, _ in chunks:
+            metadata.update(extra_metadata)
+    
+    # Near-duplicates within the file are dropped (the survivor records them)
+    duplicates = {}
+    if settings.dedupe_threshold:
+        deduper = MinHashDeduper(settings.dedupe_threshold)
+        unique = []
+        for chunk in chunks:
+            survivor = deduper.check(chunk[2], key, chunk[0])
+            if survivor:
+                duplicates.setdefault(survivor[0], set()).add(key)
+            else:
+                unique.append(chunk)
+        chunks = unique
+    failed = 0
+    
+    def check_cancelled(stored: List[str]) -> None:
+        # Also after the last batch, so a batch in flight during a delete is undone
+        if cancelled and cancelled():
+            if stored:
+                vectorstore.delete_documents(stored)
+            if Path(file_path).suffix.lower() == ".csv":
+                vectorstore.tables.drop(key)
+            logger.info("Indexing cancelled, stored chunks removed", file=str(file_path), chunks=len(stored))
+            raise IndexingCancelled(str(file_path))
+    
+    for start in range(0, len(chunks), batch_size):
+        check_cancelled([chunk[2] for chunk in chunks[:start]])
+        batch = chunks[start:start + batch_size]
+        existing = vectorstore.get_existing_ids([chunk[2] for chunk in batch])
+        todo = [chunk for chunk in batch if chunk[2] not in existing]
+        if todo:
+            stored = vectorstore.add_documents(
+                [chunk[0] for chunk in todo],
+                [chunk[1] for chunk in todo],
+                [chunk[2] for chunk in todo]
+            )
+            failed += len(todo) - len(stored)
+        if progress:
+            progress((start + len(batch)) / len(chunks))
+    
+    check_cancelled([chunk[2] for chunk in chunks])
+    if duplicates:
+        vectorstore.add_duplicate_sources(duplicates)
+    if failed:
+        raise RuntimeError(f"{failed} of {len(chunks)} chunks failed to embed")
+    return [chunk[2] for chunk in chunks]
+
+
+def print_stats(stats: Dict[str, Any]) -> None:
+    """Print an ingestion summary."""
+    print(
+        f"📊 Files: {stats['files_new']} new, {stats['files_changed']} changed, "
+        f"{stats['files_unchanged']} unchanged, {stats['files_removed']} removed"
+    )
+    print(
+        f"⚡ Chunks: {stats['chunks_embedded']} embedded, {stats['chunks_deleted']} deleted "
+        f"in {stats['seconds']}s ({stats['chunks_per_sec']} chunks/sec)"
+    )
+    if stats.get("chunks_deduplicated"):
+        print(f"🧬 {stats['chunks_deduplicated']} near-duplicate chunks skipped")
+    if stats.get("cache_lookups"):
+        print(
+            f"💾 Embedding cache: {stats['cache_hits']}/{stats['cache_lookups']} hits "
+            f"({stats['cache_hit_rate']:.0%})"
+        )
+    if stats["chunks_failed"]:
+        print(f"⚠️  {stats['chunks_failed']} chunks failed to embed; re-run to retry them")
+    if stats.get("files_failed"):
+        print(f"⚠️  {stats['files_failed']} files could not be read; re-run to retry them")
+
+
+def find_documents(documents_path: Path) -> List[Path]:
+    """Find all supported files under a directory."""
     extensions = ["*.pdf", "*.docx", "*.txt", "*.md", "*.csv"]
     files = []
     for ext in extensions:
         files.extend(documents_path.rglob(ext))
+    return files
+
+
+def process_documents(
+    documents_dir: str,
+    vectorstore: "VectorStore",
+    verbose: bool = False,
+    workers: int = None,
+    batch_size: int = None
+) -> Dict[str, Any]:
+    """
+    Incrementally index all documents in a directory.
     
+    Args:
+        documents_dir: Directory containing documents
+        vectorstore: VectorStore instance
+        verbose: Print detailed progress
+        workers: Parser processes and concurrent embedding batches
+        batch_size: Chunks per embedding/storage batch
+        
+    Returns:
+        Ingestion statistics (empty if the directory does not exist)
+    """
+    documents_path = Path(documents_dir)
+    
+    if not documents_path.exists():
+        logger.error("Documents directory not found", path=documents_dir)
+        return {}
+    
+    vectorstore.refresh()
+    files = find_documents(documents_path)
     if not files:
         logger.warning("No documents found", path=documents_dir)
-        return
     
     logger.info("Found documents to process", count=len(files))
     
-    all_texts = []
-    all_metadatas = []
+    manifest = load_manifest(vectorstore)
+    stats = sync_files(
+        files, documents_path, vectorstore, manifest,
+        remove_missing=True, verbose=verbose, workers=workers, batch_size=batch_size
+    )
+    save_manifest(vectorstore, manifest)
     
-    for file_path in files:
-        if verbose:
-            print(f"Processing: {file_path.name}")
+    logger.info("Ingestion complete", **stats)
+    return stats
+
+
+def restore_bulk_records(
+    vectorstore: "VectorStore",
+    since: float = None,
+    batch_size: int = None
+) -> Tuple[int, int]:
+    """
+    Replay the collection's bulk records (POST /documents/bulk) into a version.
+    
+    Records sent with an embedding are stored as given; the others are
+    re-embedded, normally from the embedding cache.
+    
+    Args:
+        vectorstore: Version to write to
+        since: Only records stored at or after this time.time() value
+        batch_size: Records per batch
         
-        # Load document
-        doc_chunks = load_document(str(file_path))
+    Returns:
+        Tuple of (records restored, records that failed to embed)
+    """
+    restored = failed = 0
+    for batch in vectorstore.bulk.iter_batches(batch_size or settings.ingest_batch_size, since=since):
+        # Records stored before bulk chunks had a category
+        for record in batch:
+            record["metadata"].setdefault("category", DEFAULT_CATEGORY)
+        provided = [r for r in batch if r["embedding"] is not None]
+        missing = [r for r in batch if r["embedding"] is None]
+        if provided:
+            vectorstore.add_embeddings(
+                [r["text"] for r in provided],
+                [r["metadata"] for r in provided],
+                [r["id"] for r in provided],
+                [r["embedding"] for r in provided]
+            )
+        stored = vectorstore.add_documents(
+            [r["text"] for r in missing],
+            [r["metadata"] for r in missing],
+            [r["id"] for r in missing]
+        )
+        restored += len(provided) + len(stored)
+        failed += len(missing) - len(stored)
+    if restored or failed:
+        logger.info("Bulk records restored", version=vectorstore.physical_name, restored=restored, failed=failed)
+    return restored, failed
+
+
+# A new version smaller than this fraction of the live one is not promoted
+MIN_VERSION_RATIO = 0.5
+
+
+def validate_version(
+    version: "VectorStore",
+    live: "VectorStore",
+    stats: Dict[str, Any],
+    force: bool = False
+) -> List[str]:
+    """
+    Check a freshly built version before it goes live.
+    
+    Args:
+        version: The new version
+        live: The version currently serving
+        stats: Ingestion statistics of the build
+        force: Accept a version much smaller than the live one
         
-        for doc in doc_chunks:
-            # Split into smaller chunks
-            text_chunks = chunk_text(doc["text"])
-            
-            for i, chunk in enumerate(text_chunks):
-                all_texts.append(chunk)
-                metadata = doc["metadata"].copy()
-                metadata["chunk_index"] = i
-                all_metadatas.append(metadata)
+    Returns:
+        Problems found (empty if the version can be promoted)
+    """
+    problems = []
+    count = version.collection.count()
+    live_count = live.collection.count()
+    
+    if stats.get("chunks_failed"):
+        problems.append(f"{stats['chunks_failed']} chunks failed to embed")
+    if stats.get("files_failed"):
+        problems.append(f"{stats['files_failed']} files could not be read")
+    if not force and live_count and count < live_count * MIN_VERSION_RATIO:
+        problems.append(f"new version has {count} chunks, live version has {live_count} (use --force to accept)")
+    
+    missed = version.self_check() if count else []
+    if missed:
+        problems.append(f"smoke queries did not retrieve {len(missed)} sampled chunks: {', '.join(missed)}")
+    
+    return problems
+
+
+def rebuild_documents(
+    documents_dir: str,
+    vectorstore: "VectorStore",
+    verbose: bool = False,
+    workers: int = None,
+    batch_size: int = None,
+    force: bool = False
+) -> Optional[Dict[str, Any]]:
+    """
+    Re-index from scratch into a new collection version and switch to it.
+    
+    The live version keeps serving while the new one is built from the
+    documents directory and the stored bulk records. The new version is
+    validated (chunk counts and smoke queries) and the collection
+    alias is then switched atomically; running API processes follow it on
+    their next request. The previous version is kept for --rollback.
+    
+    Args:
+        documents_dir: Directory containing documents
+        vectorstore: Live VectorStore
+        verbose: Print detailed progress
+        workers: Parser processes and concurrent embedding batches
+        batch_size: Chunks per embedding/storage batch
+        force: Promote even if the new version is much smaller
         
-        if verbose:
-            print(f"  → {len(doc_chunks)} pages/sections, chunked")
+    Returns:
+        Ingestion statistics, or None if validation failed (the new version is dropped)
+    """
+    if not Path(documents_dir).exists():
+        print(f"❌ Documents directory not found: {documents_dir}")
+        return None
     
-    # Add to vectorstore
-    if all_texts:
-        logger.info("Adding chunks to vectorstore", count=len(all_texts))
-        vectorstore.add_documents(all_texts, all_metadatas)
-        logger.info("Ingestion complete", total_chunks=len(all_texts))
-    else:
-        logger.warning("No text extracted from documents")
+    version = vectorstore.create_version()
+    print(f"🔨 Building {version.physical_name} while {vectorstore.physical_name} keeps serving...")
+    
+    stats = process_documents(documents_dir, version, verbose=verbose, workers=workers, batch_size=batch_size)
+    # Catch up with files added while the build was running
+    catch_up = process_documents(documents_dir, version, verbose=verbose, workers=workers, batch_size=batch_size)
+    for key in ("files_new", "chunks_embedded", "chunks_failed"):
+        stats[key] = stats.get(key, 0) + catch_up.get(key, 0)
+    # Files that could not be read are retried by the catch-up run
+    stats["files_failed"] = catch_up.get("files_failed", 0)
+    
+    # Bulk records have no file: replay them from the bulk store
+    bulk_started = time.time()
+    stats["bulk_restored"], bulk_failed = restore_bulk_records(version, batch_size=batch_size)
+    stats["chunks_failed"] = stats.get("chunks_failed", 0) + bulk_failed
+    if stats["bulk_restored"]:
+        print(f"📦 {stats['bulk_restored']} bulk records restored")
+    
+    problems = validate_version(version, vectorstore, stats, force=force)
+    if problems:
+        for problem in problems:
+            print(f"❌ {problem}")
+        print(f"↩️  Keeping {vectorstore.physical_name}; dropping {version.physical_name}")
+        vectorstore.drop_version(version.physical_name)
+        remove_version_files(vectorstore, version.physical_name)
+        logger.error("New collection version failed validation", version=version.physical_name, problems=problems)
+        return None
+    
+    # Bulk records upserted into the live version during the build
+    restore_bulk_records(version, since=bulk_started, batch_size=batch_size)
+    
+    previous = vectorstore.physical_name
+    for dropped in vectorstore.promote(version.physical_name):
+        remove_version_files(vectorstore, dropped)
+    print(f"✅ {version.physical_name} is live ({version.collection.count()} chunks); {previous} kept for --rollback")
+    return stats
+
+
+def snapshot_documents(documents_path: Path) -> Dict[Path, Tuple[float, int]]:
+    """Modification time and size of every supported file under a directory."""
+    files = {}
+    for path in find_documents(documents_path):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        files[path] = (stat.st_mtime, stat.st_size)
+    return files
+
+
+def watch_documents(
+    documents_dir: str,
+    vectorstore: "VectorStore",
+    interval: float = None,
+    debounce: float = None,
+    verbose: bool = False,
+    workers: int = None,
+    batch_size: int = None
+) -> None:
+    """
+    Watch a directory and incrementally index files as they change.
+    
+    The directory is polled every `interval` seconds. A burst of changes
+    (e.g. copying many PDFs) is indexed once nothing has changed for
+    `debounce` seconds, and only the added, modified or deleted files are
+    synced. Runs until interrupted.
+    
+    Args:
+        documents_dir: Directory to watch
+        vectorstore: VectorStore instance
+        interval: Seconds between polls (defaults to WATCH_INTERVAL)
+        debounce: Quiet seconds before a burst is indexed (defaults to WATCH_DEBOUNCE)
+        verbose: Print detailed progress
+        workers: Parser processes and concurrent embedding batches
+        batch_size: Chunks per embedding/storage batch
+    """
+    interval = interval or settings.watch_interval
+    debounce = settings.watch_debounce if debounce is None else debounce
+    documents_path = Path(documents_dir)
+    documents_path.mkdir(parents=True, exist_ok=True)
+    
+    # Catch up with changes made while the watcher was not running
+    previous = snapshot_documents(documents_path)
+    stats = process_documents(documents_dir, vectorstore, verbose=verbose, workers=workers, batch_size=batch_size)
+    if stats:
+        print_stats(stats)
+    print(f"👀 Watching {documents_dir} (poll {interval}s, debounce {debounce}s). Ctrl+C to stop.")
+    
+    while True:
+        time.sleep(interval)
+        current = snapshot_documents(documents_path)
+        if current == previous:
+            continue
+        
+        # Debounce: wait until the directory has been quiet for a while
+        detected = time.perf_counter()
+        quiet_since = detected
+        while time.perf_counter() - quiet_since < debounce:
+            time.sleep(min(interval, debounce))
+            latest = snapshot_documents(documents_path)
+            if latest != current:
+                current = latest
+                quiet_since = time.perf_counter()
+        
+        changed = [path for path, signature in current.items() if previous.get(path) != signature]
+        removed = [get_file_key(path, documents_path) for path in previous if path not in current]
+        previous = current
+        
+        vectorstore.refresh()
+        manifest = load_manifest(vectorstore)
+        stats = sync_files(
+            changed, documents_path, vectorstore, manifest,
+            verbose=verbose, workers=workers, batch_size=batch_size, remove=removed
+        )
+        save_manifest(vectorstore, manifest)
+        
+        # Latency: from the first change seen to the index being up to date
+        latency = round(time.perf_counter() - detected, 2)
+        touched = stats["chunks_embedded"] + stats["chunks_deleted"]
+        print(
+            f"🔄 Cycle: {len(changed)} changed, {len(removed)} removed → "
+            f"{touched} chunks touched, latency {latency}s (indexing {stats['seconds']}s)"
+        )
+        if verbose:
+            print_stats(stats)
+        logger.info("Watch cycle complete", latency=latency, chunks_touched=touched, **stats)
 
 
 def main():
     """Main entry point for ingestion."""
     parser = argparse.ArgumentParser(description="AITI Assistant - Document Ingestion")
     parser.add_argument("--file", type=str, help="Process specific file instead of directory")
-    parser.add_argument("--reset", action="store_true", help="Clear vectorstore before ingestion")
+    parser.add_argument("--reset", action="store_true", help="Re-index from scratch into a new version, then switch to it")
+    parser.add_argument("--force", action="store_true", help="With --reset: switch even if the new version is much smaller")
+    parser.add_argument("--rollback", action="store_true", help="Switch back to the previous version")
+    parser.add_argument("--export", type=str, metavar="PATH", help="Write the collection to a snapshot (.npz) and exit")
+    parser.add_argument("--import", dest="import_path", type=str, metavar="PATH", help="Load a snapshot into a new version and switch to it")
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32", help="Embedding precision for --export")
     parser.add_argument("--verbose", "-v", action="store_true", help="Verbose output")
     parser.add_argument("--dir", type=str, default="data/documents", help="Documents directory")
+    parser.add_argument("--tenant", type=str, help="Tenant ID from TENANTS_FILE to ingest into")
+    parser.add_argument("--category", type=str, help="Category for --file (default: its subdirectory under --dir)")
+    parser.add_argument("--workers", type=int, help=f"Parser processes and concurrent batches (default: {settings.ingest_workers})")
+    parser.add_argument("--batch-size", type=int, help=f"Chunks per embedding batch (default: {settings.ingest_batch_size})")
+    parser.add_argument("--watch", action="store_true", help="Keep running and index changes in --dir as they happen")
     
     args = parser.parse_args()
     
@@ -252,38 +1651,77 @@ def main():
     print("🤖 AITI Assistant - Document Ingestion")
     print("=" * 50)
     
-    # Initialize vectorstore
-    vectorstore = VectorStore()
+    # Initialize vectorstore (tenant collection if requested)
+    collection_name = None
+    if args.tenant:
+        tenants = load_tenants()
+        if args.tenant not in tenants:
+            print(f"❌ Unknown tenant: {args.tenant}")
+            sys.exit(1)
+        collection_name = tenants[args.tenant].collection
+        print(f"🏢 Tenant: {args.tenant} (collection: {collection_name})")
     
-    # Reset if requested
-    if args.reset:
-        print("🗑️  Clearing existing vectorstore...")
-        vectorstore.clear()
+    from app.rag.vectorstore import VectorStore
+    vectorstore = VectorStore(collection_name=collection_name)
+    
+    # Snapshots: no documents are parsed and no embeddings are computed
+    if args.export or args.import_path:
+        from app.snapshot import export_snapshot, import_snapshot
+        try:
+            if args.export:
+                info = export_snapshot(vectorstore, args.export, dtype=args.dtype)
+                size_mb = os.path.getsize(args.export) / 1024 / 1024
+                print(f"📦 Exported {info['count']} chunks ({info['dtype']}, {size_mb:.1f} MB) to {args.export}")
+            else:
+                info = import_snapshot(vectorstore, args.import_path)
+                print(f"📥 Imported {info['count']} chunks from {args.import_path} in {info['seconds']}s")
+        except (OSError, ValueError, KeyError) as e:
+            print(f"❌ Snapshot failed: {e}")
+            sys.exit(1)
+        return
+    
+    # Rollback or blue/green rebuild if requested
+    if args.rollback:
+        try:
+            print(f"↩️  {vectorstore.rollback()} is live again")
+        except ValueError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+    elif args.reset:
+        stats = rebuild_documents(
+            args.dir, vectorstore, verbose=args.verbose,
+            workers=args.workers, batch_size=args.batch_size, force=args.force
+        )
+        if stats is None:
+            sys.exit(1)
+        print_stats(stats)
     
     # Process documents
-    if args.file:
+    if args.watch:
+        try:
+            watch_documents(args.dir, vectorstore, verbose=args.verbose, workers=args.workers, batch_size=args.batch_size)
+        except KeyboardInterrupt:
+            print("\n👋 Watcher stopped")
+    elif args.rollback or args.reset:
+        pass
+    elif args.file:
         print(f"📄 Processing single file: {args.file}")
-        doc_chunks = load_document(args.file)
-        
-        all_texts = []
-        all_metadatas = []
-        
-        for doc in doc_chunks:
-            text_chunks = chunk_text(doc["text"])
-            for i, chunk in enumerate(text_chunks):
-                all_texts.append(chunk)
-                metadata = doc["metadata"].copy()
-                metadata["chunk_index"] = i
-                all_metadatas.append(metadata)
-        
-        if all_texts:
-            vectorstore.add_documents(all_texts, all_metadatas)
-            print(f"✅ Added {len(all_texts)} chunks")
-        else:
-            print("⚠️  No text extracted from file")
+        manifest = load_manifest(vectorstore)
+        stats = sync_files(
+            [Path(args.file)], Path(args.dir), vectorstore, manifest,
+            category=args.category, verbose=args.verbose,
+            workers=args.workers, batch_size=args.batch_size
+        )
+        save_manifest(vectorstore, manifest)
+        print_stats(stats)
     else:
         print(f"📁 Processing directory: {args.dir}")
-        process_documents(args.dir, vectorstore, verbose=args.verbose)
+        stats = process_documents(
+            args.dir, vectorstore, verbose=args.verbose,
+            workers=args.workers, batch_size=args.batch_size
+        )
+        if stats:
+            print_stats(stats)
     
     # Print stats
     stats = vectorstore.get_stats()
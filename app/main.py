@@ -3,6 +3,7 @@ AITI Assistant - Main FastAPI Application
 """
 
 import os
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -13,6 +14,10 @@ import structlog
 from app.config import settings
 from app.api import chat, documents, health
 from app.api import direct_chat
+from app.api import telegram as telegram_api
+from app.tenants import TenantRegistry
+from app.indexing import IndexingQueue
+from app.registry import DocumentRegistry
 
 try:
     from app.rag.vectorstore import VectorStore
@@ -56,9 +61,50 @@ async def lifespan(app: FastAPI):
         logger.info("VectorStore not available, using direct Gemini chat")
         app.state.vectorstore = None
     
+    # Cold start from a snapshot: searches are answered from the memory-mapped
+    # snapshot right away, and from Chroma once the import is live
+    if app.state.vectorstore is not None and settings.snapshot_path and os.path.exists(settings.snapshot_path) \
+            and app.state.vectorstore.collection.count() == 0:
+        from app.snapshot import import_snapshot
+        app.state.snapshot_import = asyncio.create_task(
+            asyncio.to_thread(import_snapshot, app.state.vectorstore, settings.snapshot_path, serve=True)
+        )
+        logger.info("Importing index snapshot in the background", path=settings.snapshot_path)
+    
+    # Tenant registry (tenant vector stores are loaded on first request)
+    app.state.tenants = TenantRegistry(default_vectorstore=app.state.vectorstore)
+    
+    # Persistent registry of uploaded documents and their chunks
+    app.state.documents = DocumentRegistry()
+    
+    # Background indexing of uploads
+    app.state.indexer = IndexingQueue(
+        app.state.vectorstore,
+        app.state.documents,
+        documents.DOCUMENTS_DIR
+    )
+    await app.state.indexer.start()
+    
+    # Telegram webhook mode: the bot shares this process's warmed RAG components
+    app.state.telegram = None
+    if settings.telegram_bot_token and settings.telegram_webhook_url:
+        if not settings.telegram_webhook_secret:
+            logger.error("TELEGRAM_WEBHOOK_SECRET is required for webhook mode, Telegram bot not started")
+        elif app.state.vectorstore is None:
+            logger.error("Vector store not available, Telegram bot not started")
+        else:
+            try:
+                from app.rag.chain import RAGChain
+                app.state.telegram = await telegram_api.start_webhook_bot(RAGChain(app.state.vectorstore))
+            except Exception as e:
+                logger.error("Telegram webhook mode failed to start", error=str(e))
+    
     yield
     
     # Shutdown
+    if app.state.telegram is not None:
+        await telegram_api.stop_webhook_bot(app.state.telegram)
+    await app.state.indexer.stop()
     logger.info("Shutting down AITI Assistant")
 
 
@@ -86,6 +132,7 @@ app.include_router(direct_chat.router, prefix="/api/v2", tags=["Direct Chat"])
 app.include_router(chat.router, prefix="/api", tags=["Chat (RAG)"])
 app.include_router(documents.router, prefix="/api", tags=["Documents"])
 app.include_router(health.router, prefix="/api", tags=["Health"])
+app.include_router(telegram_api.router, prefix="/api", tags=["Telegram"])
 
 # Serve static files (widget)
 widget_path = os.path.join(os.path.dirname(__file__), "..", "widget")
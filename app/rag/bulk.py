@@ -0,0 +1,112 @@
+"""
+AITI Assistant - Bulk Records
+Durable copy of the chunks upserted through POST /documents/bulk, so new collection versions can be rebuilt with them.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+import numpy as np
+import structlog
+
+logger = structlog.get_logger()
+
+
+class BulkStore:
+    """
+    Bulk records of one logical collection, kept in a local SQLite file.
+
+    Bulk chunks have no file in the documents directory, so this store is
+    their source of truth: a blue/green re-index or a snapshot import
+    replays it into the new version. Embeddings sent by the client are kept
+    as float32 blobs; records the server embedded are stored without one
+    and re-embedded (through the embedding cache) on replay.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open (or create) the store.
+
+        Args:
+            path: SQLite file
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        # Written by the bulk executor threads, read by re-index and snapshot import
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS bulk_records ("
+            " id TEXT PRIMARY KEY, text TEXT NOT NULL, metadata TEXT NOT NULL,"
+            " embedding BLOB, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS bulk_records_updated ON bulk_records (updated_at)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def put_many(self, records: Iterable[Dict[str, Any]], replace: bool = True) -> None:
+        """
+        Store records ({"id", "text", "metadata", "embedding"}).
+
+        Args:
+            records: Records to store (embedding None when the server embedded it)
+            replace: Replace records with the same ID (otherwise keep the stored one)
+        """
+        now = time.time()
+        rows = [
+            (
+                record["id"],
+                record["text"],
+                json.dumps(record["metadata"], ensure_ascii=False),
+                None if record.get("embedding") is None else np.asarray(record["embedding"], dtype=np.float32).tobytes(),
+                now
+            )
+            for record in records
+        ]
+        if not rows:
+            return
+        verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+        with self._lock, self._conn:
+            self._conn.executemany(f"{verb} INTO bulk_records VALUES (?, ?, ?, ?, ?)", rows)
+
+    def iter_batches(self, batch_size: int, since: Optional[float] = None) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Yield stored records in batches, in ID order.
+
+        Args:
+            batch_size: Records per batch
+            since: Only records stored at or after this time.time() value
+        """
+        last_id = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, text, metadata, embedding FROM bulk_records"
+                    " WHERE id > ? AND updated_at >= ? ORDER BY id LIMIT ?",
+                    (last_id, since or 0.0, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield [
+                {
+                    "id": chunk_id,
+                    "text": text,
+                    "metadata": json.loads(metadata),
+                    "embedding": None if blob is None else np.frombuffer(blob, dtype=np.float32).tolist()
+                }
+                for chunk_id, text, metadata, blob in rows
+            ]
+            last_id = rows[-1][0]
+
+    def ids(self) -> List[str]:
+        """IDs of all stored records."""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT id FROM bulk_records ORDER BY id")]
+
+    def count(self) -> int:
+        """Number of stored records."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM bulk_records").fetchone()[0]
@@ -3,7 +3,7 @@ AITI Assistant - RAG Chain
 Main RAG pipeline that combines retrieval and generation.
 """
 
-from typing import List, Dict, Any, Optional
+from typing import Callable, List, Dict, Any, Optional
 import openai
 import anthropic
 import structlog
@@ -16,21 +16,30 @@ except ImportError:
 
 from app.config import settings
 from app.rag.vectorstore import VectorStore
+from app.tenants import TenantConfig, default_tenant
 
 logger = structlog.get_logger()
 
+# Reply used when retrieval confidence is too low to justify an LLM call
+ESCALATION_MESSAGE = (
+    "Não encontrei esta informação nos nossos documentos. "
+    "Vou encaminhar a sua questão para um colega que poderá ajudar melhor."
+)
+
 
 class RAGChain:
     """RAG pipeline combining retrieval and generation."""
     
-    def __init__(self, vectorstore: VectorStore):
+    def __init__(self, vectorstore: VectorStore, tenant: Optional[TenantConfig] = None):
         """
         Initialize the RAG chain.
         
         Args:
             vectorstore: The vector store for document retrieval
+            tenant: Tenant whose prompt and retrieval settings to use
         """
         self.vectorstore = vectorstore
+        self.tenant = tenant or default_tenant()
         self.provider = settings.get_llm_provider()
         
         # Initialize LLM client
@@ -46,7 +55,8 @@ class RAGChain:
         self,
         query: str,
         mode: str = "standard",
-        conversation_history: Optional[List[Dict[str, str]]] = None
+        conversation_history: Optional[List[Dict[str, str]]] = None,
+        on_text: Optional[Callable[[str], None]] = None
     ) -> Dict[str, Any]:
         """
         Process a query through the RAG pipeline.
@@ -55,12 +65,13 @@ class RAGChain:
             query: The user's question
             mode: "standard" or "strict" (strict only uses retrieved context)
             conversation_history: Optional list of previous messages
+            on_text: Optional callback streamed the response generated so far
             
         Returns:
             Dictionary with response, sources, confidence, etc.
         """
-        # 1. Retrieve relevant documents
-        retrieved_docs = self.vectorstore.search(query)
+        # 1. Retrieve relevant documents, led by exact CSV row matches
+        retrieved_docs = self._lookup_rows(query) + self.vectorstore.search(query, top_k=self.tenant.top_k_results)
         
         logger.info(
             "Documents retrieved",
@@ -69,33 +80,64 @@ class RAGChain:
             top_score=retrieved_docs[0]["score"] if retrieved_docs else 0
         )
         
-        # 2. Build context from retrieved documents
-        context = self._build_context(retrieved_docs)
+        # 2. Calculate confidence and check for escalation before generating
+        confidence = self._calculate_confidence(retrieved_docs)
+        low_confidence = confidence < self.tenant.confidence_threshold
+        
+        # 3. Format sources
+        sources = self._format_sources(retrieved_docs)
+        
+        # 4. Skip the LLM when the answer would be escalated anyway
+        if low_confidence and (mode == "strict" or self.tenant.confidence_precheck):
+            logger.info(
+                "Low confidence, skipping generation",
+                confidence=confidence,
+                threshold=self.tenant.confidence_threshold,
+                mode=mode
+            )
+            return {
+                "response": ESCALATION_MESSAGE,
+                "confidence": confidence,
+                "sources": sources,
+                "escalate": True,
+                "mode": mode,
+                "retrieved_count": len(retrieved_docs)
+            }
         
-        # 3. Generate response
+        # 5. Build context and generate response
+        context = self._build_context(retrieved_docs)
         response_text = self._generate_response(
             query=query,
             context=context,
             mode=mode,
-            conversation_history=conversation_history
+            conversation_history=conversation_history,
+            on_text=on_text
         )
         
-        # 4. Calculate confidence and check for escalation
-        confidence = self._calculate_confidence(retrieved_docs)
-        escalate = confidence < settings.confidence_threshold and mode == "strict"
-        
-        # 5. Format sources
-        sources = self._format_sources(retrieved_docs)
-        
         return {
             "response": response_text,
             "confidence": confidence,
             "sources": sources,
-            "escalate": escalate,
+            "escalate": False,
             "mode": mode,
             "retrieved_count": len(retrieved_docs)
         }
     
+    def _lookup_rows(self, query: str) -> List[Dict[str, Any]]:
+        """CSV rows whose key value the question mentions, as exact-match results."""
+        rows = self.vectorstore.tables.lookup(query)
+        if rows:
+            logger.info("Table rows matched", query=query[:50], count=len(rows))
+        return [
+            {
+                "id": f"{row['source']}:{row['row']}",
+                "text": row["text"],
+                "metadata": {"source": row["source"], "row": row["row"], "type": "table"},
+                "score": 1.0
+            }
+            for row in rows
+        ]
+    
     def _build_context(self, docs: List[Dict[str, Any]]) -> str:
         """Build context string from retrieved documents."""
         if not docs:
@@ -106,6 +148,8 @@ class RAGChain:
             source = doc["metadata"].get("source", "Documento")
             page = doc["metadata"].get("page", "")
             page_str = f", página {page}" if page else ""
+            if doc["metadata"].get("type") == "table":
+                page_str = f", linha {doc['metadata']['row']}"
             
             context_parts.append(
                 f"[Fonte {i}: {source}{page_str}]\n{doc['text']}"
@@ -118,18 +162,17 @@ class RAGChain:
         query: str,
         context: str,
         mode: str,
-        conversation_history: Optional[List[Dict[str, str]]] = None
+        conversation_history: Optional[List[Dict[str, str]]] = None,
+        on_text: Optional[Callable[[str], None]] = None
     ) -> str:
-        """Generate response using the LLM."""
+        """Generate response using the LLM, streaming it to on_text when given."""
         # Build system prompt
-        system_prompt = settings.formatted_system_prompt
+        system_prompt = self.tenant.formatted_system_prompt
         
         if mode == "strict":
             system_prompt += (
                 "\n\nIMPORTANTE: Responde APENAS com base nos documentos fornecidos. "
-                "Se a informação não estiver nos documentos, diz: "
-                "'Não encontrei esta informação nos nossos documentos. "
-                "Vou encaminhar a sua questão para um colega que poderá ajudar melhor.'"
+                f"Se a informação não estiver nos documentos, diz: '{ESCALATION_MESSAGE}'"
             )
         
         # Build user message with context
@@ -155,34 +198,58 @@ RESPOSTA:"""
         
         # Generate with appropriate provider
         if self.provider == "openai":
-            response = self.client.chat.completions.create(
-                model=settings.llm_model,
-                messages=[
+            request = {
+                "model": settings.llm_model,
+                "messages": [
                     {"role": "system", "content": system_prompt},
                     *messages
                 ],
-                temperature=0.7,
-                max_tokens=1000
-            )
+                "temperature": 0.7,
+                "max_tokens": 1000
+            }
+            if on_text:
+                stream = self.client.chat.completions.create(**request, stream=True)
+                return self._stream_text(
+                    (chunk.choices[0].delta.content for chunk in stream if chunk.choices),
+                    on_text
+                )
+            response = self.client.chat.completions.create(**request)
             return response.choices[0].message.content.strip()
         
         elif self.provider == "anthropic":
-            response = self.client.messages.create(
-                model="claude-3-haiku-20240307",  # or settings.llm_model
-                max_tokens=1000,
-                system=system_prompt,
-                messages=messages
-            )
+            request = {
+                "model": "claude-3-haiku-20240307",  # or settings.llm_model
+                "max_tokens": 1000,
+                "system": system_prompt,
+                "messages": messages
+            }
+            if on_text:
+                with self.client.messages.stream(**request) as stream:
+                    return self._stream_text(stream.text_stream, on_text)
+            response = self.client.messages.create(**request)
             return response.content[0].text.strip()
         
         elif self.provider == "gemini":
             # Build full prompt for Gemini
             full_prompt = f"{system_prompt}\n\n{user_message}"
+            if on_text:
+                stream = self.client.generate_content(full_prompt, stream=True)
+                return self._stream_text((chunk.text for chunk in stream), on_text)
             response = self.client.generate_content(full_prompt)
             return response.text.strip()
         
         raise ValueError(f"Unknown provider: {self.provider}")
     
+    @staticmethod
+    def _stream_text(deltas, on_text: Callable[[str], None]) -> str:
+        """Accumulate streamed text deltas, passing the text so far to on_text."""
+        text = ""
+        for delta in deltas:
+            if delta:
+                text += delta
+                on_text(text)
+        return text.strip()
+    
     def _calculate_confidence(self, docs: List[Dict[str, Any]]) -> float:
         """Calculate confidence score based on retrieval results."""
         if not docs:
@@ -0,0 +1,126 @@
+"""
+AITI Assistant - Embedding Cache
+Persistent content-addressed cache of embeddings, keyed by (provider, model, sha256(text)).
+"""
+
+import os
+import sqlite3
+import hashlib
+import threading
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+import structlog
+
+from app.config import settings
+
+logger = structlog.get_logger()
+
+# Keys per SELECT ... IN (...) (below SQLite's variable limit)
+LOOKUP_BATCH_SIZE = 500
+
+
+def text_hash(text: str) -> str:
+    """Content key of a text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Embeddings stored as packed float32 blobs in a local SQLite file.
+
+    Shared by every collection and tenant: the same text embedded with the
+    same provider and model is only ever paid for once.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open (or create) the cache.
+
+        Args:
+            path: SQLite file
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        # Ingestion writes from several batch threads
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " provider TEXT NOT NULL, model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL,"
+            " PRIMARY KEY (provider, model, hash)) WITHOUT ROWID"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.lookups = 0
+
+    def get_many(self, provider: str, model: str, hashes: Iterable[str]) -> Dict[str, List[float]]:
+        """
+        Look up embeddings.
+
+        Args:
+            provider: Embedding provider
+            model: Embedding model
+            hashes: Text hashes (see text_hash)
+
+        Returns:
+            Dictionary of hash to embedding for the hashes found
+        """
+        hashes = list(hashes)
+        found = {}
+        with self._lock:
+            for start in range(0, len(hashes), LOOKUP_BATCH_SIZE):
+                batch = hashes[start:start + LOOKUP_BATCH_SIZE]
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE provider = ? AND model = ? "
+                    f"AND hash IN ({','.join('?' * len(batch))})",
+                    [provider, model, *batch]
+                )
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+            self.lookups += len(hashes)
+            self.hits += len(found)
+        return found
+
+    def put_many(self, provider: str, model: str, items: Iterable[Tuple[str, List[float]]]) -> None:
+        """
+        Store embeddings.
+
+        Args:
+            provider: Embedding provider
+            model: Embedding model
+            items: (hash, embedding) pairs
+        """
+        rows = [
+            (provider, model, key, np.asarray(embedding, dtype=np.float32).tobytes())
+            for key, embedding in items
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def get_stats(self) -> Dict[str, object]:
+        """Lookups and hits since the cache was opened."""
+        return {
+            "path": self.path,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else 0.0
+        }
+
+
+@lru_cache(maxsize=None)
+def _open_cache(path: str) -> EmbeddingCache:
+    logger.info("Embedding cache opened", path=path)
+    return EmbeddingCache(path)
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Process-wide cache at EMBEDDING_CACHE_PATH (None when disabled)."""
+    if not settings.embedding_cache_path:
+        return None
+    return _open_cache(settings.embedding_cache_path)
@@ -3,8 +3,10 @@ AITI Assistant - Embedding Service
 Handles text embedding generation using OpenAI, Gemini, or local models.
 """
 
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
 import openai
+import tiktoken
 import structlog
 
 try:
@@ -14,9 +16,30 @@ except ImportError:
     GEMINI_AVAILABLE = False
 
 from app.config import settings
+from app.rag.ratelimit import retry_with_backoff
+from app.rag.scheduler import BACKGROUND, INTERACTIVE, estimate_tokens, get_provider_scheduler
 
 logger = structlog.get_logger()
 
+GEMINI_EMBEDDING_MODEL = "models/gemini-embedding-001"
+
+# OpenAI per-input token limit for embedding models
+OPENAI_MAX_INPUT_TOKENS = 8191
+
+
+class EmbeddingBatchError(Exception):
+    """Raised when some sub-batches failed after retries.
+    
+    Attributes:
+        embeddings: Embeddings in input order, None where the sub-batch failed
+        failed_indices: Input positions that have no embedding
+    """
+    
+    def __init__(self, embeddings: List[Optional[List[float]]], failed_indices: List[int]):
+        super().__init__(f"{len(failed_indices)} of {len(embeddings)} texts failed to embed")
+        self.embeddings = embeddings
+        self.failed_indices = failed_indices
+
 
 class EmbeddingService:
     """Service for generating text embeddings."""
@@ -31,22 +54,37 @@ class EmbeddingService:
         if settings.openai_api_key and settings.openai_api_key.startswith("sk-"):
             self.provider = "openai"
             self.client = openai.OpenAI(api_key=settings.openai_api_key)
+            self.encoding = None  # tiktoken encoding, loaded on first batch
         elif settings.gemini_api_key and GEMINI_AVAILABLE:
             self.provider = "gemini"
             genai.configure(api_key=settings.gemini_api_key)
         
+        # Shared with every other service of this provider in the process
+        self.scheduler = get_provider_scheduler(self.provider)
+        
         logger.info(f"Embedding service initialized with provider: {self.provider}")
     
-    def embed_text(self, text: str) -> List[float]:
+    @property
+    def model_name(self) -> str:
+        """Model actually used for embeddings by the active provider."""
+        if self.provider == "gemini":
+            return GEMINI_EMBEDDING_MODEL
+        return self.model
+    
+    def embed_text(self, text: str, priority: str = INTERACTIVE) -> List[float]:
         """
         Generate embedding for a single text.
         
         Args:
             text: The text to embed
+            priority: Scheduler class (queries are interactive by default)
             
         Returns:
             List of floats representing the embedding vector
         """
+        if self.provider in ("openai", "gemini"):
+            self.scheduler.acquire(estimate_tokens([text]), priority)
+        
         if self.provider == "openai":
             try:
                 response = self.client.embeddings.create(
@@ -61,7 +99,7 @@ class EmbeddingService:
         elif self.provider == "gemini":
             try:
                 result = genai.embed_content(
-                    model="models/gemini-embedding-001",
+                    model=GEMINI_EMBEDDING_MODEL,
                     content=text
                 )
                 return result['embedding']
@@ -71,12 +109,13 @@ class EmbeddingService:
         
         raise ValueError(f"No embedding provider configured. Set OPENAI_API_KEY or GEMINI_API_KEY.")
     
-    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+    def embed_texts(self, texts: List[str], priority: str = BACKGROUND) -> List[List[float]]:
         """
         Generate embeddings for multiple texts.
         
         Args:
             texts: List of texts to embed
+            priority: Scheduler class (batches are background work by default)
             
         Returns:
             List of embedding vectors
@@ -86,37 +125,116 @@ class EmbeddingService:
         
         if self.provider == "openai":
             try:
-                response = self.client.embeddings.create(
-                    model=self.model,
-                    input=texts
-                )
-                sorted_data = sorted(response.data, key=lambda x: x.index)
-                return [item.embedding for item in sorted_data]
+                return self._run_batches(self._openai_batches(texts), self._embed_openai_batch, priority)
             except Exception as e:
                 logger.error("OpenAI batch embedding failed", error=str(e), count=len(texts))
                 raise
         
         elif self.provider == "gemini":
             try:
-                # Gemini batch embedding
-                embeddings = []
-                for text in texts:
-                    result = genai.embed_content(
-                        model="models/gemini-embedding-001",
-                        content=text
-                    )
-                    embeddings.append(result['embedding'])
-                return embeddings
+                size = settings.gemini_embed_batch_size
+                batches = [texts[i:i + size] for i in range(0, len(texts), size)]
+                return self._run_batches(batches, self._embed_gemini_batch, priority)
             except Exception as e:
                 logger.error("Gemini batch embedding failed", error=str(e), count=len(texts))
                 raise
         
         raise ValueError(f"No embedding provider configured. Set OPENAI_API_KEY or GEMINI_API_KEY.")
     
+    def _run_batches(
+        self,
+        batches: List[List[str]],
+        embed_batch: Callable[[List[str], str], List[List[float]]],
+        priority: str
+    ) -> List[List[float]]:
+        """
+        Embed sub-batches concurrently, retrying each one on its own.
+        
+        Results are returned in input order. If any sub-batch still fails
+        after retries, EmbeddingBatchError carries the successful ones.
+        """
+        workers = max(1, min(settings.embedding_workers, len(batches)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(
+                    retry_with_backoff,
+                    embed_batch,
+                    batch,
+                    priority,
+                    max_retries=settings.embedding_max_retries
+                )
+                for batch in batches
+            ]
+        
+        embeddings: List[Optional[List[float]]] = []
+        failed: List[int] = []
+        for batch, future in zip(batches, futures):
+            try:
+                embeddings.extend(future.result())
+            except Exception as e:
+                logger.error("Embedding sub-batch failed", error=str(e), count=len(batch))
+                failed.extend(range(len(embeddings), len(embeddings) + len(batch)))
+                embeddings.extend([None] * len(batch))
+        
+        if failed:
+            raise EmbeddingBatchError(embeddings, failed)
+        return embeddings
+    
+    def _openai_batches(self, texts: List[str]) -> List[List[str]]:
+        """Split texts into sub-batches within the per-request input and token limits."""
+        if self.encoding is None:
+            try:
+                self.encoding = tiktoken.encoding_for_model(self.model)
+            except KeyError:
+                self.encoding = tiktoken.get_encoding("cl100k_base")
+        
+        batches: List[List[str]] = []
+        current: List[str] = []
+        current_tokens = 0
+        
+        for text, tokens in zip(texts, self.encoding.encode_ordinary_batch(texts)):
+            if len(tokens) > OPENAI_MAX_INPUT_TOKENS:
+                logger.warning("Truncating text over the embedding token limit", tokens=len(tokens))
+                tokens = tokens[:OPENAI_MAX_INPUT_TOKENS]
+                text = self.encoding.decode(tokens)
+            
+            if current and (
+                len(current) >= settings.openai_embed_max_inputs
+                or current_tokens + len(tokens) > settings.openai_embed_max_tokens
+            ):
+                batches.append(current)
+                current, current_tokens = [], 0
+            
+            current.append(text)
+            current_tokens += len(tokens)
+        
+        if current:
+            batches.append(current)
+        return batches
+    
+    def _embed_openai_batch(self, batch: List[str], priority: str) -> List[List[float]]:
+        """Embed one sub-batch with a single scheduled OpenAI request."""
+        self.scheduler.acquire(estimate_tokens(batch), priority)
+        response = self.client.embeddings.create(
+            model=self.model,
+            input=batch
+        )
+        sorted_data = sorted(response.data, key=lambda x: x.index)
+        return [item.embedding for item in sorted_data]
+    
+    def _embed_gemini_batch(self, batch: List[str], priority: str) -> List[List[float]]:
+        """Embed one batch with a single scheduled Gemini request."""
+        self.scheduler.acquire(estimate_tokens(batch), priority)
+        result = genai.embed_content(
+            model=GEMINI_EMBEDDING_MODEL,
+            content=batch
+        )
+        return result['embedding']
+    
     def get_embedding_dimension(self) -> int:
         """Get the dimension of embeddings from the current model."""
         if self.provider == "gemini":
-            return 768  # Gemini text-embedding-004 dimension
+            return 3072  # gemini-embedding-001 default output dimension
         
         # OpenAI embedding dimensions
         dimensions = {
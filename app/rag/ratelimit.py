@@ -0,0 +1,148 @@
+"""
+AITI Assistant - Rate Limiting
+Token-bucket limiter and retry helper for embedding provider calls.
+"""
+
+import random
+import threading
+import time
+from typing import Callable, TypeVar
+import structlog
+
+logger = structlog.get_logger()
+
+T = TypeVar("T")
+
+# Provider exceptions worth retrying (rate limits, timeouts, server errors)
+TRANSIENT_ERRORS = {
+    "ResourceExhausted",
+    "ServiceUnavailable",
+    "DeadlineExceeded",
+    "InternalServerError",
+    "TooManyRequests",
+    "RateLimitError",
+    "APITimeoutError",
+    "APIConnectionError",
+}
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at a constant rate."""
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        """
+        Initialize the bucket.
+
+        Args:
+            rate_per_minute: Tokens added per minute (0 disables limiting)
+            capacity: Maximum burst size (defaults to one second of tokens, at least 1)
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or max(self.rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, tokens: float = 1.0, reserve: float = 0.0) -> float:
+        """
+        Seconds until the requested tokens are available (0.0 if they are now).
+
+        Args:
+            tokens: Number of tokens wanted
+            reserve: Fraction of the capacity that must stay in the bucket
+        """
+        if self.rate <= 0:
+            return 0.0
+
+        needed = min(min(tokens, self.capacity) + reserve * self.capacity, self.capacity)
+        with self._lock:
+            self._refill()
+            return max(0.0, (needed - self.tokens) / self.rate)
+
+    def take(self, tokens: float = 1.0) -> None:
+        """
+        Take tokens without waiting (check wait_time first).
+
+        The full amount is debited, so a request larger than the bucket leaves
+        it negative and later requests wait until the debt is refilled.
+        """
+        if self.rate <= 0:
+            return
+        with self._lock:
+            self._refill()
+            self.tokens -= tokens
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """
+        Block until the requested tokens are available.
+
+        Args:
+            tokens: Number of tokens to take
+
+        Returns:
+            Seconds spent waiting
+        """
+        if self.rate <= 0:
+            return 0.0
+
+        # Requests larger than the bucket are allowed once it is full, and
+        # debited in full (the bucket goes negative)
+        needed = min(tokens, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= needed:
+                    self.tokens -= tokens
+                    return waited
+                wait = (needed - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+def is_transient(error: Exception) -> bool:
+    """Whether an error is a rate limit, timeout or server error."""
+    if type(error).__name__ in TRANSIENT_ERRORS:
+        return True
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    return status == 429 or (isinstance(status, int) and status >= 500)
+
+
+def retry_with_backoff(
+    func: Callable[..., T],
+    *args,
+    max_retries: int = 5,
+    base_delay: float = 1.0,
+    max_delay: float = 30.0,
+    **kwargs
+) -> T:
+    """
+    Call a function, retrying transient failures with full-jitter backoff.
+
+    Args:
+        func: Function to call
+        max_retries: Retries before the last error is raised
+        base_delay: Initial backoff in seconds
+        max_delay: Backoff ceiling in seconds
+    """
+    attempt = 0
+    while True:
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if attempt >= max_retries or not is_transient(e):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            logger.warning(
+                "Transient provider error, retrying",
+                error=str(e),
+                attempt=attempt + 1,
+                delay=round(delay, 2)
+            )
+            time.sleep(delay)
+            attempt += 1
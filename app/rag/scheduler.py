@@ -0,0 +1,150 @@
+"""
+AITI Assistant - Provider Call Scheduler
+Shared requests/min and tokens/min budget for embedding provider calls, with priority classes.
+"""
+
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Any, Dict, List
+import structlog
+
+from app.config import settings
+from app.rag.ratelimit import TokenBucket
+
+logger = structlog.get_logger()
+
+# Priority classes, highest first
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+PRIORITIES = (INTERACTIVE, BACKGROUND)
+
+# Share of each bucket background calls leave untouched while chat is active
+INTERACTIVE_RESERVE = 0.2
+
+# Seconds after an interactive call during which the reserve is kept
+INTERACTIVE_WINDOW = 30.0
+
+# Longest sleep before a waiting call checks the buckets again
+MAX_POLL_SECONDS = 1.0
+
+# Queueing delays kept per class for percentiles
+DELAY_SAMPLES = 1000
+
+
+def estimate_tokens(texts: List[str]) -> int:
+    """Rough token count of provider input (about 4 characters per token)."""
+    return sum(len(text) for text in texts) // 4 + 1
+
+
+class ProviderScheduler:
+    """
+    Admission control for calls to one embedding provider.
+
+    Every call takes one request from the RPM bucket and its estimated input
+    tokens from the TPM bucket. A call waits while a higher class has calls
+    waiting, and background calls leave INTERACTIVE_RESERVE of each bucket
+    for chat while interactive calls keep arriving. Calls already sent to the
+    provider are never interrupted: background work is slowed at admission.
+    """
+
+    def __init__(self, rpm: int = 0, tpm: int = 0):
+        """
+        Initialize the scheduler.
+
+        Args:
+            rpm: Requests per minute (0 = unlimited)
+            tpm: Input tokens per minute (0 = unlimited)
+        """
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = TokenBucket(rpm)
+        # Large enough for the biggest sub-batch, so every call is debited in full
+        self.tokens = TokenBucket(tpm, capacity=max(tpm / 60.0, settings.openai_embed_max_tokens))
+        self._cond = threading.Condition()
+        self._waiting = {priority: 0 for priority in PRIORITIES}
+        self._last_interactive = float("-inf")
+        self._calls = {priority: 0 for priority in PRIORITIES}
+        self._total_delay = {priority: 0.0 for priority in PRIORITIES}
+        self._delays = {priority: deque(maxlen=DELAY_SAMPLES) for priority in PRIORITIES}
+
+    def acquire(self, tokens: int = 1, priority: str = BACKGROUND) -> float:
+        """
+        Block until a call may be sent to the provider.
+
+        Args:
+            tokens: Estimated input tokens of the call
+            priority: INTERACTIVE or BACKGROUND
+
+        Returns:
+            Seconds spent queueing
+        """
+        started = time.monotonic()
+        with self._cond:
+            self._waiting[priority] += 1
+            if priority == INTERACTIVE:
+                self._last_interactive = started
+            try:
+                while True:
+                    wait = self._try_take(tokens, priority)
+                    if wait <= 0:
+                        break
+                    self._cond.wait(timeout=min(wait, MAX_POLL_SECONDS))
+            finally:
+                self._waiting[priority] -= 1
+                self._cond.notify_all()
+
+            delay = time.monotonic() - started
+            self._calls[priority] += 1
+            self._total_delay[priority] += delay
+            self._delays[priority].append(delay)
+        return delay
+
+    def _try_take(self, tokens: int, priority: str) -> float:
+        """Take the call's budget, or return how long to wait (lock held)."""
+        if any(self._waiting[higher] for higher in PRIORITIES[:PRIORITIES.index(priority)]):
+            return MAX_POLL_SECONDS
+
+        reserve = 0.0
+        if priority != INTERACTIVE and time.monotonic() - self._last_interactive < INTERACTIVE_WINDOW:
+            reserve = INTERACTIVE_RESERVE
+
+        wait = max(self.requests.wait_time(1, reserve), self.tokens.wait_time(tokens, reserve))
+        if wait > 0:
+            return wait
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        return 0.0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Limits, and calls, waiting calls and queueing delay per class."""
+        with self._cond:
+            classes = {}
+            for priority in PRIORITIES:
+                delays = sorted(self._delays[priority])
+                calls = self._calls[priority]
+                classes[priority] = {
+                    "calls": calls,
+                    "waiting": self._waiting[priority],
+                    "avg_delay_ms": round(self._total_delay[priority] / calls * 1000, 1) if calls else 0.0,
+                    "p95_delay_ms": round(delays[int(len(delays) * 0.95)] * 1000, 1) if delays else 0.0,
+                    "max_delay_ms": round(delays[-1] * 1000, 1) if delays else 0.0
+                }
+        return {"rpm": self.rpm, "tpm": self.tpm, "classes": classes}
+
+
+@lru_cache(maxsize=None)
+def get_provider_scheduler(provider: str) -> ProviderScheduler:
+    """
+    Process-wide scheduler of an embedding provider (EMBEDDING_RPM / EMBEDDING_TPM).
+
+    The budget is per process: `python -m app.ingest` (and --watch) running
+    next to the API spend their own full budget, so give them a lower
+    EMBEDDING_RPM / EMBEDDING_TPM or use the API's indexing endpoints.
+    """
+    rpm = settings.embedding_rpm
+    if rpm is None:
+        rpm = settings.gemini_embed_rpm if provider == "gemini" else 0
+    logger.info("Provider scheduler created", provider=provider, rpm=rpm, tpm=settings.embedding_tpm)
+    return ProviderScheduler(rpm, settings.embedding_tpm)
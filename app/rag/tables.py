@@ -0,0 +1,265 @@
+"""
+AITI Assistant - Structured Tables
+CSV sources loaded into typed, indexed SQLite tables for exact key lookups.
+"""
+
+import os
+import re
+import csv
+import json
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+import structlog
+
+logger = structlog.get_logger()
+
+INTEGER_PATTERN = re.compile(r"^-?(0|[1-9]\d*)$")
+REAL_PATTERN = re.compile(r"^-?\d+([.,]\d+)?$")
+
+# Zero-padded codes (SKUs, NIFs, postcodes) are text: "00123" must stay "00123"
+LEADING_ZERO_PATTERN = re.compile(r"^-?0\d")
+
+# Key values shorter than this are never matched (avoids "1", "de", ...)
+MIN_KEY_LENGTH = 3
+
+# Columns with longer values (descriptions, notes) are not key columns
+MAX_KEY_LENGTH = 64
+
+# Longest key value, in words, looked for in a question
+MAX_KEY_WORDS = 5
+
+# Rows returned by a lookup
+MAX_LOOKUP_ROWS = 5
+
+
+def _convert(value: str, column_type: str) -> Any:
+    """Convert a CSV value to its column type (None when empty)."""
+    value = value.strip()
+    if not value:
+        return None
+    if column_type == "INTEGER":
+        return int(value)
+    if column_type == "REAL":
+        return float(value.replace(",", "."))
+    return value
+
+
+def _quote(name: str) -> str:
+    """Quote an SQL identifier."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def row_text(row: Dict[str, Any]) -> str:
+    """Text form of a row, as used for CSV chunks."""
+    return " | ".join(f"{k}: {v}" for k, v in row.items() if v not in (None, ""))
+
+
+class TableStore:
+    """
+    One SQLite table per CSV source, with typed columns.
+
+    Column types (INTEGER, REAL or TEXT) are inferred from the data; values
+    with a leading zero make a column TEXT, so codes keep their padding. Columns
+    whose values are all distinct are key columns: they get a case-insensitive
+    index and are matched against the words of a question.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open (or create) the table store.
+
+        Args:
+            path: SQLite file
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        # Loaded by ingestion, queried from API threads
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS csv_sources ("
+            " source_key TEXT PRIMARY KEY, table_name TEXT NOT NULL, source TEXT NOT NULL,"
+            " columns TEXT NOT NULL, key_columns TEXT NOT NULL, row_count INTEGER NOT NULL, updated_at TEXT NOT NULL)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _read_rows(file_path: str) -> Iterator[Dict[str, str]]:
+        with open(file_path, "r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                yield {k.strip(): (v or "") for k, v in row.items() if k}
+
+    def _infer_columns(self, file_path: str) -> tuple:
+        """Column types and key columns, from one pass over the file."""
+        types: Dict[str, str] = {}
+        distinct: Dict[str, Optional[set]] = {}
+        for row in self._read_rows(file_path):
+            for column, value in row.items():
+                value = value.strip()
+                column_type = types.setdefault(column, "INTEGER")
+                seen = distinct.setdefault(column, set())
+                if not value:
+                    continue
+                if LEADING_ZERO_PATTERN.match(value):
+                    column_type = "TEXT"
+                if column_type == "INTEGER" and not INTEGER_PATTERN.match(value):
+                    column_type = "REAL"
+                if column_type == "REAL" and not REAL_PATTERN.match(value):
+                    column_type = "TEXT"
+                types[column] = column_type
+                if seen is not None:
+                    if value.lower() in seen:
+                        distinct[column] = None
+                    else:
+                        seen.add(value.lower())
+
+        keys = [
+            column for column, seen in distinct.items()
+            if seen and types[column] != "REAL" and MIN_KEY_LENGTH <= max(len(v) for v in seen) <= MAX_KEY_LENGTH
+        ]
+        return types, keys
+
+    def load_csv(self, file_path: str, source_key: str) -> int:
+        """
+        Load (or replace) the table of a CSV source.
+
+        Args:
+            file_path: CSV file
+            source_key: Stable key of the file (its manifest key)
+
+        Returns:
+            Number of rows loaded
+        """
+        types, keys = self._infer_columns(file_path)
+        if not types:
+            self.drop(source_key)
+            return 0
+
+        table = f"csv_{hashlib.sha256(source_key.encode('utf-8')).hexdigest()[:16]}"
+        columns = ", ".join(f"{_quote(c)} {t}" for c, t in types.items())
+        placeholders = ", ".join("?" * (len(types) + 1))
+        rows = (
+            [row_num] + [_convert(row.get(c, ""), t) for c, t in types.items()]
+            for row_num, row in enumerate(self._read_rows(file_path), 1)
+        )
+
+        # One transaction: readers see the old table or the complete new one
+        with self._lock, self._conn:
+            self._conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+            self._conn.execute(f'CREATE TABLE "{table}" (_row INTEGER PRIMARY KEY, {columns})')
+            cursor = self._conn.executemany(f'INSERT INTO "{table}" VALUES ({placeholders})', rows)
+            count = cursor.rowcount
+            for i, column in enumerate(keys):
+                self._conn.execute(f'CREATE INDEX "{table}_k{i}" ON "{table}" ({_quote(column)} COLLATE NOCASE)')
+            self._conn.execute(
+                "INSERT OR REPLACE INTO csv_sources VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (source_key, table, os.path.basename(file_path), json.dumps(types), json.dumps(keys),
+                 count, datetime.utcnow().isoformat())
+            )
+
+        logger.info("CSV table loaded", source=source_key, rows=count, key_columns=keys)
+        return count
+
+    def copy_to(self, target: "TableStore", keep: Optional[set] = None) -> None:
+        """
+        Copy every table into another (empty) store.
+
+        Args:
+            target: Store to overwrite
+            keep: Source keys to keep in the copy (all when None)
+        """
+        with self._lock, target._lock:
+            self._conn.backup(target._conn)
+        if keep is not None:
+            for source_key in set(target.get_stats()) - keep:
+                target.drop(source_key)
+
+    def dump(self) -> bytes:
+        """Serialize every table (for snapshots)."""
+        with self._lock:
+            data = bytearray(self._conn.serialize())
+        # Header bytes 18-19 mark WAL mode, which a deserialized database cannot open
+        if data[18:20] == b"\x02\x02":
+            data[18:20] = b"\x01\x01"
+        return bytes(data)
+
+    def restore(self, data: bytes) -> None:
+        """
+        Replace every table with a dump() of another store.
+
+        Args:
+            data: Serialized database
+        """
+        source = sqlite3.connect(":memory:")
+        try:
+            source.deserialize(data)
+            with self._lock:
+                source.backup(self._conn)
+        finally:
+            source.close()
+
+    def drop(self, source_key: str) -> None:
+        """Remove the table of a CSV source."""
+        with self._lock, self._conn:
+            found = self._conn.execute(
+                "SELECT table_name FROM csv_sources WHERE source_key = ?", (source_key,)
+            ).fetchone()
+            if found:
+                self._conn.execute(f'DROP TABLE IF EXISTS "{found[0]}"')
+                self._conn.execute("DELETE FROM csv_sources WHERE source_key = ?", (source_key,))
+
+    def lookup(self, question: str, limit: int = MAX_LOOKUP_ROWS) -> List[Dict[str, Any]]:
+        """
+        Find rows whose key value is mentioned in a question.
+
+        Args:
+            question: User question
+            limit: Maximum rows returned
+
+        Returns:
+            Rows as {"text", "source", "row", "column", "value"}
+        """
+        words = [w.rstrip(".-/") for w in re.findall(r"\w[\w\-./]*", question.lower())]
+        candidates = {
+            " ".join(words[i:i + n])
+            for n in range(1, MAX_KEY_WORDS + 1)
+            for i in range(len(words) - n + 1)
+        }
+        candidates = [c for c in candidates if len(c) >= MIN_KEY_LENGTH]
+        if not candidates:
+            return []
+
+        results = []
+        with self._lock:
+            sources = self._conn.execute("SELECT table_name, source, key_columns FROM csv_sources").fetchall()
+            for table, source, key_columns in sources:
+                for column in json.loads(key_columns):
+                    cursor = self._conn.execute(
+                        f'SELECT * FROM "{table}" WHERE {_quote(column)} COLLATE NOCASE '
+                        f'IN ({",".join("?" * len(candidates))}) LIMIT ?',
+                        [*candidates, limit]
+                    )
+                    names = [d[0] for d in cursor.description]
+                    for values in cursor.fetchall():
+                        row = dict(zip(names, values))
+                        row_num = row.pop("_row")
+                        results.append({
+                            "text": row_text(row),
+                            "source": source,
+                            "row": row_num,
+                            "column": column,
+                            "value": row[column]
+                        })
+                    if len(results) >= limit:
+                        return results[:limit]
+        return results
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Loaded CSV sources and their row counts."""
+        with self._lock:
+            rows = self._conn.execute("SELECT source_key, row_count, key_columns FROM csv_sources").fetchall()
+        return {key: {"rows": count, "key_columns": json.loads(keys)} for key, count, keys in rows}
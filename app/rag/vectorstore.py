@@ -4,53 +4,260 @@ ChromaDB-based vector storage for document chunks.
 """
 
 import os
-from typing import List, Dict, Any, Optional
+import re
+import json
+import threading
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
 import chromadb
 from chromadb.config import Settings as ChromaSettings
 import structlog
 
 from app.config import settings
-from app.rag.embeddings import EmbeddingService
+from app.rag.embeddings import EmbeddingService, EmbeddingBatchError
+from app.rag.embedding_cache import get_embedding_cache, text_hash
+from app.rag.tables import TableStore
+from app.rag.bulk import BulkStore
 
 logger = structlog.get_logger()
 
+# Maps each logical collection to its live version (blue/green reindexing)
+ALIASES_FILE = "collection_aliases.json"
+
+
+def load_aliases(persist_dir: str) -> Dict[str, Dict[str, str]]:
+    """Load collection aliases ({name: {"current": ..., "previous": ...}})."""
+    path = os.path.join(persist_dir, ALIASES_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_aliases(persist_dir: str, aliases: Dict[str, Dict[str, str]]) -> None:
+    """Atomically write collection aliases (readers see the old or the new file)."""
+    path = os.path.join(persist_dir, ALIASES_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(aliases, f, indent=2)
+    os.replace(tmp_path, path)
+
 
 class VectorStore:
     """Vector store for document retrieval using ChromaDB."""
     
-    def __init__(self, persist_directory: Optional[str] = None):
+    def __init__(
+        self,
+        persist_directory: Optional[str] = None,
+        collection_name: Optional[str] = None,
+        version: Optional[str] = None
+    ):
         """
         Initialize the vector store.
         
         Args:
             persist_directory: Directory to persist the database
+            collection_name: Collection to use (defaults to "aiti_documents")
+            version: Pin a physical collection version instead of following
+                the collection alias (used to build a new version)
         """
         self.persist_dir = persist_directory or settings.chroma_persist_dir
+        self.collection_name = collection_name or "aiti_documents"
+        self.pinned = version is not None
+        self._alias_mtime = None
         
         # Ensure directory exists
         os.makedirs(self.persist_dir, exist_ok=True)
         
-        # Initialize ChromaDB
+        # Initialize ChromaDB (bound the segment cache when a memory budget is set;
+        # clients on the same directory share it, so it bounds every tenant together)
+        chroma_settings = ChromaSettings(anonymized_telemetry=False)
+        if settings.tenant_memory_budget_mb:
+            chroma_settings = ChromaSettings(
+                anonymized_telemetry=False,
+                chroma_segment_cache_policy="LRU",
+                chroma_memory_limit_bytes=settings.tenant_memory_budget_mb * 1024 * 1024
+            )
         self.client = chromadb.PersistentClient(
             path=self.persist_dir,
-            settings=ChromaSettings(anonymized_telemetry=False)
+            settings=chroma_settings
         )
         
-        # Get or create the main collection
-        self.collection = self.client.get_or_create_collection(
-            name="aiti_documents",
-            metadata={"hnsw:space": "cosine"}
-        )
+        # Open the live version of the collection (or the pinned one)
+        self._centroid_lock = threading.Lock()
+        self._open(version or self._resolve_alias())
         
-        # Initialize embedding service
+        # Initialize embedding service and the shared embedding cache
         self.embedding_service = EmbeddingService()
+        self.embedding_cache = get_embedding_cache()
+        
+        # Chunks from POST /documents/bulk, replayed into new versions
+        self.bulk = BulkStore(os.path.join(self.persist_dir, f"{self.collection_name}_bulk.db"))
+        
+        # Memory-mapped snapshot searched instead of the collection while an import fills it
+        self.fallback = None
         
         logger.info(
             "Vector store initialized",
             persist_dir=self.persist_dir,
+            collection=self.collection_name,
+            version=self.physical_name,
             document_count=self.collection.count()
         )
     
+    def _tables_path(self, physical_name: str) -> str:
+        """Tables database of a collection version."""
+        return os.path.join(self.persist_dir, f"{physical_name}_tables.db")
+    
+    def _centroid_stamp_path(self, physical_name: str) -> str:
+        """File touched whenever the centroids of a collection version change."""
+        return os.path.join(self.persist_dir, f"{physical_name}_centroids.stamp")
+    
+    def _centroid_stamp(self) -> Optional[int]:
+        """Last centroid change of the current version, by any process."""
+        path = self._centroid_stamp_path(self.physical_name)
+        return os.stat(path).st_mtime_ns if os.path.exists(path) else None
+    
+    def _open(self, physical_name: str) -> None:
+        """Bind to a physical collection, its centroid sidecar and its CSV tables."""
+        collection = self.client.get_or_create_collection(
+            name=physical_name,
+            metadata={"hnsw:space": "cosine"}
+        )
+        # Per-category embedding centroids used for query routing
+        centroid_collection = self.client.get_or_create_collection(
+            name=f"{physical_name}_centroids",
+            metadata={"hnsw:space": "cosine"}
+        )
+        # CSV sources as typed tables, for exact lookups by key value (one
+        # database per version, so a re-index never touches the live tables)
+        tables = TableStore(self._tables_path(physical_name))
+        with self._centroid_lock:
+            self.tables = tables
+            self.physical_name = physical_name
+            self.collection = collection
+            self.centroid_collection = centroid_collection
+            self._centroids: Optional[Dict[str, Tuple[np.ndarray, int]]] = None
+            self._centroids_loaded: Optional[int] = None
+    
+    def _resolve_alias(self) -> str:
+        """Physical collection the alias points to (the name itself if unaliased)."""
+        path = os.path.join(self.persist_dir, ALIASES_FILE)
+        self._alias_mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        alias = load_aliases(self.persist_dir).get(self.collection_name, {})
+        return alias.get("current", self.collection_name)
+    
+    def refresh(self) -> None:
+        """Follow an alias switch made by another process (cheap when unchanged)."""
+        if self.pinned:
+            return
+        path = os.path.join(self.persist_dir, ALIASES_FILE)
+        mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        if mtime != self._alias_mtime:
+            physical_name = self._resolve_alias()
+            if physical_name != self.physical_name:
+                previous = self.physical_name
+                self._open(physical_name)
+                logger.info("Collection alias switched", collection=self.collection_name, version=physical_name, previous=previous)
+                return
+        # Centroids moved by another process (e.g. an incremental CLI ingest)
+        if self._centroids is not None and self._centroid_stamp() != self._centroids_loaded:
+            with self._centroid_lock:
+                self._centroids = None
+    
+    def list_versions(self) -> List[str]:
+        """Physical versions of this collection, oldest first."""
+        pattern = re.compile(rf"^{re.escape(self.collection_name)}(_v(\d+))?$")
+        versions = []
+        for collection in self.client.list_collections():
+            match = pattern.match(getattr(collection, "name", collection))
+            if match:
+                versions.append((int(match.group(2) or 0), match.group(0)))
+        return [name for _, name in sorted(versions)]
+    
+    def create_version(self) -> "VectorStore":
+        """Create an empty new version, pinned, for building a re-index."""
+        numbers = [int(name.rsplit("_v", 1)[1]) for name in self.list_versions() if name != self.collection_name]
+        version = f"{self.collection_name}_v{max(numbers, default=0) + 1}"
+        logger.info("Collection version created", collection=self.collection_name, version=version)
+        return VectorStore(self.persist_dir, self.collection_name, version=version)
+    
+    def promote(self, version: str) -> List[str]:
+        """
+        Atomically point the alias at a version, keeping the live one for rollback.
+        
+        Versions older than the previous one are dropped.
+        
+        Args:
+            version: Physical collection to make live
+            
+        Returns:
+            Names of the dropped versions
+        """
+        aliases = load_aliases(self.persist_dir)
+        previous = aliases.get(self.collection_name, {}).get("current", self.collection_name)
+        aliases[self.collection_name] = {"current": version, "previous": previous}
+        save_aliases(self.persist_dir, aliases)
+        self.refresh()
+        logger.info("Collection version promoted", collection=self.collection_name, version=version, previous=previous)
+        
+        dropped = [name for name in self.list_versions() if name not in (version, previous)]
+        for name in dropped:
+            self.drop_version(name)
+        return dropped
+    
+    def rollback(self) -> str:
+        """
+        Switch the alias back to the previous version.
+        
+        Returns:
+            The version now live
+            
+        Raises:
+            ValueError: If there is no previous version
+        """
+        aliases = load_aliases(self.persist_dir)
+        alias = aliases.get(self.collection_name, {})
+        if not alias.get("previous"):
+            raise ValueError(f"No previous version of {self.collection_name} to roll back to")
+        aliases[self.collection_name] = {"current": alias["previous"], "previous": alias["current"]}
+        save_aliases(self.persist_dir, aliases)
+        self.refresh()
+        logger.info("Collection rolled back", collection=self.collection_name, version=alias["previous"])
+        return alias["previous"]
+    
+    def drop_version(self, version: str) -> None:
+        """Delete a physical version, its centroids and its CSV tables."""
+        for name in (version, f"{version}_centroids"):
+            try:
+                self.client.delete_collection(name)
+            except Exception as e:
+                logger.warning("Could not delete collection", name=name, error=str(e))
+        if os.path.exists(self._centroid_stamp_path(version)):
+            os.remove(self._centroid_stamp_path(version))
+        for suffix in ("", "-wal", "-shm"):
+            path = self._tables_path(version) + suffix
+            if version != self.physical_name and os.path.exists(path):
+                os.remove(path)
+        logger.info("Collection version dropped", version=version)
+    
+    def self_check(self, samples: int = 5) -> List[str]:
+        """
+        Smoke-test retrieval: sampled chunks must find themselves by their text.
+        
+        Args:
+            samples: Number of chunks to query
+            
+        Returns:
+            IDs of the sampled chunks that were not retrieved
+        """
+        sample = self.collection.get(limit=samples, include=["documents"])
+        return [
+            chunk_id
+            for chunk_id, text in zip(sample["ids"], sample["documents"])
+            if chunk_id not in [hit["id"] for hit in self.search(text)]
+        ]
+    
     def add_documents(
         self,
         texts: List[str],
@@ -66,29 +273,203 @@ class VectorStore:
             ids: Optional list of document IDs
             
         Returns:
-            List of document IDs
+            List of IDs of the documents stored (failed embeddings are skipped)
         """
         if not texts:
             return []
+        self.refresh()
         
         # Generate IDs if not provided
         if not ids:
             import uuid
             ids = [str(uuid.uuid4()) for _ in texts]
         
-        # Generate embeddings
-        embeddings = self.embedding_service.embed_texts(texts)
+        # Generate embeddings (keep what succeeded if some sub-batches failed)
+        embeddings = self._embed_documents(texts)
+        keep = [i for i, embedding in enumerate(embeddings) if embedding is not None]
+        if len(keep) < len(texts):
+            logger.error(
+                "Some embedding batches failed, storing the rest",
+                failed=len(texts) - len(keep),
+                stored=len(keep)
+            )
+            texts = [texts[i] for i in keep]
+            metadatas = [metadatas[i] for i in keep]
+            ids = [ids[i] for i in keep]
+            embeddings = [embeddings[i] for i in keep]
+            if not texts:
+                return []
+        
+        self.add_embeddings(texts, metadatas, ids, embeddings)
+        logger.info("Documents added to vector store", count=len(texts))
+        return ids
+    
+    def add_embeddings(
+        self,
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        ids: List[str],
+        embeddings: List[List[float]]
+    ) -> None:
+        """
+        Store chunks whose embeddings are already computed (no provider call).
         
-        # Add to collection
-        self.collection.add(
+        Args:
+            texts: Chunk texts
+            metadatas: Chunk metadata
+            ids: Chunk IDs
+            embeddings: Embedding vectors
+        """
+        # Upsert so re-adding a deterministic ID replaces the old chunk
+        replaced = self._stored_vectors(ids=ids)
+        self.collection.upsert(
             documents=texts,
             embeddings=embeddings,
             metadatas=metadatas,
             ids=ids
         )
+        self._update_centroids(embeddings, metadatas, *replaced)
+    
+    def _embed_documents(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Embed texts, reusing cached embeddings and embedding duplicates once.
         
-        logger.info("Documents added to vector store", count=len(texts))
-        return ids
+        Returns:
+            Embeddings in input order, None where embedding failed
+        """
+        hashes = [text_hash(text) for text in texts]
+        unique = dict(zip(hashes, texts))
+        provider = self.embedding_service.provider
+        model = self.embedding_service.model_name
+        
+        found = self.embedding_cache.get_many(provider, model, unique) if self.embedding_cache else {}
+        missing = [key for key in unique if key not in found]
+        
+        if missing:
+            try:
+                embedded = self.embedding_service.embed_texts([unique[key] for key in missing])
+            except EmbeddingBatchError as e:
+                embedded = e.embeddings
+            new = [(key, embedding) for key, embedding in zip(missing, embedded) if embedding is not None]
+            found.update(new)
+            if self.embedding_cache:
+                self.embedding_cache.put_many(provider, model, new)
+        
+        return [found.get(key) for key in hashes]
+    
+    def _get_centroids(self) -> Dict[str, Tuple[np.ndarray, int]]:
+        """Category centroids (mean embedding and chunk count), loaded on first use."""
+        if self._centroids is None:
+            self._centroids_loaded = self._centroid_stamp()
+            result = self.centroid_collection.get(include=["embeddings", "metadatas"])
+            self._centroids = {}
+            for i, category in enumerate(result["ids"]):
+                self._centroids[category] = (
+                    np.asarray(result["embeddings"][i], dtype=np.float32),
+                    int(result["metadatas"][i].get("count", 0))
+                )
+        return self._centroids
+    
+    def _stored_vectors(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[List[float]], List[Dict[str, Any]]]:
+        """Embeddings and metadata of stored chunks, by ID or by metadata filter."""
+        embeddings, metadatas = [], []
+        batches = [ids[i:i + 5000] for i in range(0, len(ids), 5000)] if ids is not None else [None]
+        for batch in batches:
+            result = self.collection.get(ids=batch, where=where, include=["embeddings", "metadatas"])
+            if result["ids"]:
+                embeddings.extend(result["embeddings"])
+                metadatas.extend(result["metadatas"])
+        return embeddings, metadatas
+    
+    def _update_centroids(
+        self,
+        embeddings: List[List[float]],
+        metadatas: List[Dict[str, Any]],
+        removed_embeddings: Optional[List[List[float]]] = None,
+        removed_metadatas: Optional[List[Dict[str, Any]]] = None
+    ) -> None:
+        """
+        Fold added embeddings into the per-category means and take removed ones out.
+        
+        Args:
+            embeddings: Embeddings of the chunks stored
+            metadatas: Metadata of the chunks stored
+            removed_embeddings: Embeddings of the chunks deleted or replaced
+            removed_metadatas: Metadata of the chunks deleted or replaced
+        """
+        # category -> (sum of added minus removed vectors, net chunk count)
+        deltas: Dict[str, Tuple[np.ndarray, int]] = {}
+        for vectors, metas, sign in (
+            (embeddings, metadatas, 1),
+            (removed_embeddings or [], removed_metadatas or [], -1)
+        ):
+            for embedding, metadata in zip(vectors, metas):
+                category = (metadata or {}).get("category")
+                if category:
+                    total, count = deltas.get(category, (0.0, 0))
+                    deltas[category] = (total + sign * np.asarray(embedding, dtype=np.float64), count + sign)
+        
+        if not deltas:
+            return
+        
+        # Batches may be added concurrently
+        with self._centroid_lock:
+            if self._centroid_stamp() != self._centroids_loaded:
+                # Start from what another process last wrote
+                self._centroids = None
+            centroids = self._get_centroids()
+            changed, emptied = [], []
+            for category, (delta, delta_count) in deltas.items():
+                mean, count = centroids.get(category, (0.0, 0))
+                new_count = count + delta_count
+                if new_count <= 0:
+                    if category in centroids:
+                        del centroids[category]
+                        emptied.append(category)
+                    continue
+                centroids[category] = (((mean * count + delta) / new_count).astype(np.float32), new_count)
+                changed.append(category)
+            
+            if changed:
+                self.centroid_collection.upsert(
+                    ids=changed,
+                    embeddings=[centroids[c][0].tolist() for c in changed],
+                    metadatas=[{"count": centroids[c][1]} for c in changed]
+                )
+            if emptied:
+                self.centroid_collection.delete(ids=emptied)
+            if changed or emptied:
+                stamp = self._centroid_stamp_path(self.physical_name)
+                with open(stamp, "a"):
+                    os.utime(stamp, None)
+                self._centroids_loaded = self._centroid_stamp()
+    
+    def route_query(self, query_embedding: List[float]) -> List[str]:
+        """
+        Pick the categories most likely to contain the answer.
+        
+        Args:
+            query_embedding: Embedding of the search query
+            
+        Returns:
+            Category names to search, or an empty list to search everything
+        """
+        centroids = self._get_centroids()
+        top_n = settings.routing_top_categories
+        if len(centroids) <= top_n:
+            return []
+        
+        names = list(centroids)
+        matrix = np.stack([centroids[name][0] for name in names])
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query_vector)
+        scores = matrix @ query_vector / np.maximum(norms, 1e-12)
+        
+        return [names[i] for i in np.argsort(-scores)[:top_n]]
     
     def search(
         self,
@@ -108,11 +489,33 @@ class VectorStore:
             List of results with document, metadata, and score
         """
         top_k = top_k or settings.top_k_results
+        self.refresh()
         
         # Generate query embedding
         query_embedding = self.embedding_service.embed_text(query)
         
-        # Search
+        fallback = self.fallback
+        if fallback is not None and filter_metadata is None:
+            return fallback.search(query_embedding, top_k)
+        
+        # Route to the most likely categories, falling back to a global search
+        if filter_metadata is None and settings.category_routing:
+            categories = self.route_query(query_embedding)
+            if categories:
+                routed = self._query(query_embedding, top_k, {"category": {"$in": categories}})
+                if routed and routed[0]["score"] >= settings.routing_min_score:
+                    return routed
+                logger.info("Routed search scored low, searching all categories", categories=categories)
+        
+        return self._query(query_embedding, top_k, filter_metadata)
+    
+    def _query(
+        self,
+        query_embedding: List[float],
+        top_k: int,
+        filter_metadata: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Run a nearest-neighbour query and format the results."""
         results = self.collection.query(
             query_embeddings=[query_embedding],
             n_results=top_k,
@@ -132,6 +535,31 @@ class VectorStore:
         
         return formatted
     
+    def get_existing_ids(self, ids: List[str]) -> set:
+        """Return which of the given IDs are already stored."""
+        existing = set()
+        for i in range(0, len(ids), 5000):
+            existing.update(self.collection.get(ids=ids[i:i + 5000], include=[])["ids"])
+        return existing
+    
+    def add_duplicate_sources(self, duplicates: Dict[str, set]) -> None:
+        """
+        Record on surviving chunks the files whose near-duplicates were dropped.
+        
+        Args:
+            duplicates: Surviving chunk ID -> file keys of its duplicates
+        """
+        ids = list(duplicates)
+        for i in range(0, len(ids), 5000):
+            result = self.collection.get(ids=ids[i:i + 5000], include=["metadatas"])
+            metadatas = []
+            for chunk_id, metadata in zip(result["ids"], result["metadatas"]):
+                sources = set(filter(None, (metadata.get("duplicate_sources") or "").split("; ")))
+                metadatas.append({**metadata, "duplicate_sources": "; ".join(sorted(sources | duplicates[chunk_id]))})
+            if metadatas:
+                self.collection.update(ids=result["ids"], metadatas=metadatas)
+        logger.info("Duplicate sources recorded", survivors=len(ids))
+    
     def delete_documents(self, ids: List[str]) -> None:
         """
         Delete documents by ID.
@@ -139,22 +567,37 @@ class VectorStore:
         Args:
             ids: List of document IDs to delete
         """
+        removed = self._stored_vectors(ids=ids)
         self.collection.delete(ids=ids)
+        self._update_centroids([], [], *removed)
         logger.info("Documents deleted from vector store", count=len(ids))
     
-    def clear(self) -> None:
-        """Clear all documents from the vector store."""
-        # Delete and recreate collection
-        self.client.delete_collection("aiti_documents")
-        self.collection = self.client.create_collection(
-            name="aiti_documents",
-            metadata={"hnsw:space": "cosine"}
-        )
-        logger.info("Vector store cleared")
+    def delete_by_doc_id(self, doc_id: str) -> None:
+        """
+        Delete all chunks of an uploaded document in one call.
+        
+        Args:
+            doc_id: Document ID stored in the chunk metadata
+        """
+        removed = self._stored_vectors(where={"doc_id": doc_id})
+        self.collection.delete(where={"doc_id": doc_id})
+        self._update_centroids([], [], *removed)
+        logger.info("Document chunks deleted from vector store", doc_id=doc_id)
+    
+    def get_dimension(self) -> Optional[int]:
+        """Dimension of the stored embeddings (None while the collection is empty)."""
+        sample = self.collection.get(limit=1, include=["embeddings"])
+        if sample["ids"]:
+            return len(sample["embeddings"][0])
+        return None
     
     def get_stats(self) -> Dict[str, Any]:
         """Get statistics about the vector store."""
+        self.refresh()
         return {
             "document_count": self.collection.count(),
+            "collection": self.collection_name,
+            "version": self.physical_name,
+            "categories": {name: count for name, (_, count) in self._get_centroids().items()},
             "persist_directory": self.persist_dir
         }
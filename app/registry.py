@@ -0,0 +1,168 @@
+"""
+AITI Assistant - Document Registry
+Persistent record of uploaded documents and their chunk IDs (SQL via DATABASE_URL).
+"""
+
+import os
+from typing import Any, Dict, List, Optional
+from sqlalchemy import (
+    Column, Float, ForeignKey, Integer, MetaData, String, Table, Text,
+    create_engine, delete, func, insert, select, update
+)
+import structlog
+
+from app.config import settings
+
+logger = structlog.get_logger()
+
+metadata = MetaData()
+
+documents_table = Table(
+    "documents",
+    metadata,
+    Column("id", String(36), primary_key=True),
+    Column("filename", String(255), nullable=False),
+    Column("file_type", String(16), nullable=False, index=True),
+    Column("size_bytes", Integer, nullable=False),
+    Column("sha256", String(64), index=True),
+    Column("file_path", Text, nullable=False),
+    Column("category", String(64)),
+    Column("status", String(32), nullable=False, index=True),
+    Column("progress", Float, nullable=False, default=0.0),
+    Column("chunks_count", Integer, nullable=False, default=0),
+    Column("job_id", String(36)),
+    Column("error", Text),
+    Column("created_at", String(32), nullable=False, index=True),
+)
+
+document_chunks_table = Table(
+    "document_chunks",
+    metadata,
+    Column("chunk_id", String(64), primary_key=True),
+    Column("doc_id", String(36), ForeignKey("documents.id", ondelete="CASCADE"), nullable=False, index=True),
+)
+
+
+class DocumentRegistry:
+    """Documents and their chunk IDs, stored in the application database."""
+
+    def __init__(self, database_url: Optional[str] = None):
+        """
+        Initialize the registry and create its tables if needed.
+
+        Args:
+            database_url: SQLAlchemy URL (defaults to DATABASE_URL)
+        """
+        url = database_url or settings.database_url
+        connect_args = {}
+        if url.startswith("sqlite"):
+            # Progress is written from indexing threads
+            connect_args["check_same_thread"] = False
+            path = url.split("///", 1)[-1]
+            if path and path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self.engine = create_engine(url, connect_args=connect_args)
+        metadata.create_all(self.engine)
+        logger.info("Document registry initialized", url=url)
+
+    def add(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        """Register a new document."""
+        columns = {k: v for k, v in doc.items() if k in documents_table.c}
+        with self.engine.begin() as conn:
+            conn.execute(insert(documents_table).values(**columns))
+        return self.get(doc["id"])
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """Get a document by ID."""
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                select(documents_table).where(documents_table.c.id == doc_id)
+            ).mappings().first()
+        return dict(row) if row else None
+
+    def update(self, doc_id: str, **fields) -> None:
+        """Update document fields (unknown fields are ignored)."""
+        values = {k: v for k, v in fields.items() if k in documents_table.c}
+        if not values:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(update(documents_table).where(documents_table.c.id == doc_id).values(**values))
+
+    def mark_deleted(self, doc_id: str) -> None:
+        """Flag a document as being deleted, so its indexing job stops."""
+        self.update(doc_id, status="deleted")
+
+    def is_deleted(self, doc_id: str) -> bool:
+        """Whether a document was deleted or is being deleted."""
+        with self.engine.connect() as conn:
+            status = conn.execute(
+                select(documents_table.c.status).where(documents_table.c.id == doc_id)
+            ).scalar()
+        return status is None or status == "deleted"
+
+    def delete(self, doc_id: str) -> None:
+        """Remove a document and its chunk mapping."""
+        with self.engine.begin() as conn:
+            conn.execute(delete(document_chunks_table).where(document_chunks_table.c.doc_id == doc_id))
+            conn.execute(delete(documents_table).where(documents_table.c.id == doc_id))
+
+    def list(self) -> List[Dict[str, Any]]:
+        """All documents, oldest first."""
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(documents_table).order_by(documents_table.c.created_at)
+            ).mappings().all()
+        return [dict(row) for row in rows]
+
+    def find_by_sha256(self, sha256: str) -> Optional[Dict[str, Any]]:
+        """Find a document with the same content that is indexed or on its way."""
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                select(documents_table)
+                .where(documents_table.c.sha256 == sha256, documents_table.c.status != "error")
+                .limit(1)
+            ).mappings().first()
+        return dict(row) if row else None
+
+    def set_chunks(self, doc_id: str, chunk_ids: List[str]) -> None:
+        """Replace the chunk IDs of a document and update its chunk count (no-op once deleted)."""
+        with self.engine.begin() as conn:
+            exists = conn.execute(
+                select(documents_table.c.id).where(documents_table.c.id == doc_id)
+            ).first()
+            if not exists:
+                return
+            conn.execute(delete(document_chunks_table).where(document_chunks_table.c.doc_id == doc_id))
+            if chunk_ids:
+                conn.execute(
+                    insert(document_chunks_table).prefix_with("OR REPLACE", dialect="sqlite"),
+                    [{"chunk_id": chunk_id, "doc_id": doc_id} for chunk_id in chunk_ids]
+                )
+            conn.execute(
+                update(documents_table)
+                .where(documents_table.c.id == doc_id)
+                .values(chunks_count=len(chunk_ids))
+            )
+
+    def get_chunk_ids(self, doc_id: str) -> List[str]:
+        """Chunk IDs of a document."""
+        with self.engine.connect() as conn:
+            return list(conn.execute(
+                select(document_chunks_table.c.chunk_id).where(document_chunks_table.c.doc_id == doc_id)
+            ).scalars())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Uploaded documents, their chunks, and documents per file type."""
+        with self.engine.connect() as conn:
+            total_documents, upload_chunks = conn.execute(
+                select(func.count(), func.coalesce(func.sum(documents_table.c.chunks_count), 0))
+            ).one()
+            file_types = dict(conn.execute(
+                select(documents_table.c.file_type, func.count()).group_by(documents_table.c.file_type)
+            ).all())
+        return {
+            "total_documents": total_documents,
+            "upload_chunks": upload_chunks,
+            "file_types": file_types
+        }
@@ -0,0 +1,325 @@
+"""
+AITI Assistant - Index Snapshots
+Compact, versioned export/import of a collection for fast cold starts.
+
+A snapshot is an uncompressed .npz archive:
+    info            JSON header (format version, provider, model, dtype, count, manifest, bulk IDs)
+    ids             chunk IDs
+    embeddings      N x D matrix (float32 or float16), memory-mapped on import
+    text_data       UTF-8 chunk texts, concatenated
+    text_offsets    N + 1 offsets into text_data
+    meta_data       JSON chunk metadata, concatenated
+    meta_offsets    N + 1 offsets into meta_data
+    tables          SQLite database of the CSV tables (format 2)
+"""
+
+import os
+import json
+import time
+import struct
+import zipfile
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Dict, List
+import numpy as np
+import structlog
+
+from app.config import settings
+
+# Imported lazily so the CLI stays light
+if TYPE_CHECKING:
+    from app.rag.vectorstore import VectorStore
+
+logger = structlog.get_logger()
+
+SNAPSHOT_FORMAT_VERSION = 2
+
+# Chunks read from / written to the collection per call
+SNAPSHOT_BATCH_SIZE = 1000
+
+# Embedding rows scored per block when searching a snapshot directly
+SNAPSHOT_SEARCH_BLOCK = 65536
+
+
+def _pack(values: List[bytes]) -> tuple:
+    """Concatenate byte strings into a blob plus offsets."""
+    offsets = np.zeros(len(values) + 1, dtype=np.uint64)
+    offsets[1:] = np.cumsum([len(v) for v in values], dtype=np.uint64)
+    return np.frombuffer(b"".join(values), dtype=np.uint8), offsets
+
+
+def _unpack(blob: np.ndarray, offsets: np.ndarray, start: int, end: int) -> List[str]:
+    """Decode entries [start, end) of a packed blob."""
+    return [
+        bytes(blob[offsets[i]:offsets[i + 1]]).decode("utf-8")
+        for i in range(start, end)
+    ]
+
+
+def _load_member(path: str, name: str) -> np.ndarray:
+    """
+    Load an array from an .npz, memory-mapping it when stored uncompressed.
+
+    np.load ignores mmap_mode for .npz archives, so the array data offset is
+    located in the zip and mapped directly.
+    """
+    with zipfile.ZipFile(path) as archive:
+        info = archive.getinfo(f"{name}.npy")
+    if info.compress_type != zipfile.ZIP_STORED:
+        with np.load(path) as data:
+            return data[name]
+
+    with open(path, "rb") as f:
+        f.seek(info.header_offset)
+        name_length, extra_length = struct.unpack("<HH", f.read(30)[26:30])
+        f.seek(info.header_offset + 30 + name_length + extra_length)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+
+    if not shape or 0 in shape:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape, order="F" if fortran_order else "C")
+
+
+class SnapshotReader:
+    """
+    Memory-mapped view of a snapshot that can answer searches by itself.
+
+    Used while an import is still writing the vectors to Chroma: a query
+    scores every embedding (exact cosine, one block at a time) and decodes
+    only the texts and metadata of the hits.
+    """
+
+    def __init__(self, path: str):
+        """
+        Map a snapshot's arrays.
+
+        Args:
+            path: Snapshot .npz path
+        """
+        self.path = path
+        self.info = read_snapshot_info(path)
+        self.ids = _load_member(path, "ids")
+        self.embeddings = _load_member(path, "embeddings")
+        self.text_data, self.text_offsets = _load_member(path, "text_data"), _load_member(path, "text_offsets")
+        self.meta_data, self.meta_offsets = _load_member(path, "meta_data"), _load_member(path, "meta_offsets")
+
+    def search(self, query_embedding: List[float], top_k: int) -> List[Dict[str, Any]]:
+        """
+        Nearest chunks by cosine similarity, formatted like VectorStore.search().
+
+        Args:
+            query_embedding: Embedding of the query
+            top_k: Number of results
+        """
+        if not len(self.ids):
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        best_scores, best_rows = np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+
+        for start in range(0, len(self.ids), SNAPSHOT_SEARCH_BLOCK):
+            block = np.asarray(self.embeddings[start:start + SNAPSHOT_SEARCH_BLOCK], dtype=np.float32)
+            scores = block @ query / np.maximum(np.linalg.norm(block, axis=1), 1e-12)
+            best_scores = np.concatenate([best_scores, scores])
+            best_rows = np.concatenate([best_rows, np.arange(start, start + len(block))])
+            if len(best_scores) > top_k:
+                keep = np.argpartition(-best_scores, top_k)[:top_k]
+                best_scores, best_rows = best_scores[keep], best_rows[keep]
+
+        results = []
+        for i in np.argsort(-best_scores):
+            row = int(best_rows[i])
+            results.append({
+                "id": str(self.ids[row]),
+                "text": _unpack(self.text_data, self.text_offsets, row, row + 1)[0],
+                "metadata": json.loads(_unpack(self.meta_data, self.meta_offsets, row, row + 1)[0]),
+                "score": float(best_scores[i])
+            })
+        return results
+
+
+def export_snapshot(vectorstore: "VectorStore", path: str, dtype: str = "float32") -> Dict[str, Any]:
+    """
+    Write the live collection to a snapshot file.
+
+    Args:
+        vectorstore: VectorStore to export
+        path: Output .npz path
+        dtype: Embedding precision ("float32" or "float16")
+
+    Returns:
+        Snapshot info header
+    """
+    from app.ingest import load_manifest
+
+    vectorstore.refresh()
+    count = vectorstore.collection.count()
+    ids, embeddings, texts, metadatas = [], [], [], []
+
+    for offset in range(0, count, SNAPSHOT_BATCH_SIZE):
+        batch = vectorstore.collection.get(
+            limit=SNAPSHOT_BATCH_SIZE,
+            offset=offset,
+            include=["embeddings", "documents", "metadatas"]
+        )
+        ids.extend(batch["ids"])
+        embeddings.append(np.asarray(batch["embeddings"], dtype=dtype))
+        texts.extend(text.encode("utf-8") for text in batch["documents"])
+        metadatas.extend(json.dumps(m or {}, ensure_ascii=False).encode("utf-8") for m in batch["metadatas"])
+
+    matrix = np.concatenate(embeddings) if embeddings else np.zeros((0, 0), dtype=dtype)
+    info = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "created_at": datetime.utcnow().isoformat(),
+        "collection": vectorstore.collection_name,
+        "version": vectorstore.physical_name,
+        "provider": vectorstore.embedding_service.provider,
+        "model": vectorstore.embedding_service.model_name,
+        "dtype": dtype,
+        "count": len(ids),
+        "dimension": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+        "manifest": load_manifest(vectorstore),
+        "bulk_ids": vectorstore.bulk.ids()
+    }
+    text_data, text_offsets = _pack(texts)
+    meta_data, meta_offsets = _pack(metadatas)
+
+    # Uncompressed, so the embedding matrix can be memory-mapped on import
+    tmp_path = f"{path}.tmp.npz"
+    np.savez(
+        tmp_path,
+        info=np.frombuffer(json.dumps(info).encode("utf-8"), dtype=np.uint8),
+        ids=np.array(ids, dtype=str),
+        embeddings=matrix,
+        text_data=text_data,
+        text_offsets=text_offsets,
+        meta_data=meta_data,
+        meta_offsets=meta_offsets,
+        tables=np.frombuffer(vectorstore.tables.dump(), dtype=np.uint8)
+    )
+    os.replace(tmp_path, path)
+
+    logger.info("Snapshot exported", path=path, count=len(ids), dtype=dtype, bytes=os.path.getsize(path))
+    return {k: v for k, v in info.items() if k not in ("manifest", "bulk_ids")}
+
+
+def read_snapshot_info(path: str) -> Dict[str, Any]:
+    """Read a snapshot's info header."""
+    return json.loads(bytes(_load_member(path, "info")).decode("utf-8"))
+
+
+def import_snapshot(vectorstore: "VectorStore", path: str, serve: bool = False) -> Dict[str, Any]:
+    """
+    Load a snapshot into a new collection version and make it live.
+
+    Embeddings are taken from the snapshot (memory-mapped, converted to
+    float32 one batch at a time), so the embedding provider is never called.
+    float32 snapshots also seed the embedding cache for later re-indexes.
+    Bulk records of the snapshot are added to the bulk store, and the bulk
+    store is then replayed, so bulk records newer than the snapshot are kept.
+
+    Args:
+        vectorstore: Live VectorStore of the target collection
+        path: Snapshot .npz path
+        serve: Answer `vectorstore.search()` from the memory-mapped snapshot
+            until the imported version is live (API cold start)
+
+    Returns:
+        Snapshot info header plus import timing
+
+    Raises:
+        ValueError: If the snapshot format or embedding model is incompatible
+    """
+    started = time.perf_counter()
+    info = read_snapshot_info(path)
+    if info["format_version"] > SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"Snapshot format {info['format_version']} is newer than supported ({SNAPSHOT_FORMAT_VERSION})")
+
+    service = vectorstore.embedding_service
+    if (info["provider"], info["model"]) != (service.provider, service.model_name):
+        raise ValueError(
+            f"Snapshot embeddings are {info['provider']}/{info['model']}, "
+            f"but this instance uses {service.provider}/{service.model_name}"
+        )
+
+    reader = SnapshotReader(path)
+    if serve:
+        vectorstore.fallback = reader
+        logger.info("Serving searches from the snapshot while it is imported", count=len(reader.ids))
+    try:
+        version = _import_version(vectorstore, path, info, reader)
+    finally:
+        vectorstore.fallback = None
+
+    result = {k: v for k, v in info.items() if k not in ("manifest", "bulk_ids")}
+    result["seconds"] = round(time.perf_counter() - started, 2)
+    logger.info("Snapshot imported", path=path, version=version.physical_name, count=len(reader.ids), seconds=result["seconds"])
+    return result
+
+
+def _import_version(vectorstore: "VectorStore", path: str, info: Dict[str, Any], reader: SnapshotReader) -> "VectorStore":
+    """Write a snapshot into a new collection version and promote it; returns the version."""
+    from app.ingest import MinHashDeduper, get_dedupe_path, remove_version_files, restore_bulk_records, save_manifest
+    from app.rag.embedding_cache import text_hash
+
+    ids, embeddings = reader.ids, reader.embeddings
+    text_data, text_offsets = reader.text_data, reader.text_offsets
+    meta_data, meta_offsets = reader.meta_data, reader.meta_offsets
+
+    bulk_ids = set(info.get("bulk_ids") or ())
+    version = vectorstore.create_version()
+    # Imported chunks seed the near-duplicate signatures of later incremental runs
+    deduper = MinHashDeduper(settings.dedupe_threshold, get_dedupe_path(version)) if settings.dedupe_threshold else None
+    for start in range(0, len(ids), SNAPSHOT_BATCH_SIZE):
+        end = min(start + SNAPSHOT_BATCH_SIZE, len(ids))
+        texts = _unpack(text_data, text_offsets, start, end)
+        metadatas = [json.loads(m) for m in _unpack(meta_data, meta_offsets, start, end)]
+        chunk_ids = ids[start:end].tolist()
+        vectors = np.asarray(embeddings[start:end], dtype=np.float32).tolist()
+        version.add_embeddings(texts, metadatas, chunk_ids, vectors)
+        if deduper:
+            for chunk_id, text, metadata in zip(chunk_ids, texts, metadatas):
+                if metadata.get("path"):
+                    deduper.add(chunk_id, metadata["path"], text)
+            deduper.commit()
+        # Bulk records already stored here are newer than the snapshot's
+        if bulk_ids:
+            version.bulk.put_many(
+                (
+                    {"id": chunk_id, "text": text, "metadata": metadata, "embedding": vector}
+                    for chunk_id, text, metadata, vector in zip(chunk_ids, texts, metadatas, vectors)
+                    if chunk_id in bulk_ids
+                ),
+                replace=False
+            )
+        # float16 snapshots are rounded: only exact vectors go to the cache
+        if vectorstore.embedding_cache and info["dtype"] == "float32":
+            vectorstore.embedding_cache.put_many(
+                info["provider"], info["model"], zip([text_hash(t) for t in texts], vectors)
+            )
+
+    if deduper:
+        deduper.close()
+    restore_bulk_records(version)
+    manifest = info.get("manifest") or {}
+    with zipfile.ZipFile(path) as archive:
+        has_tables = "tables.npy" in archive.namelist()
+    if has_tables:
+        version.tables.restore(bytes(_load_member(path, "tables")))
+    else:
+        # Format 1 snapshots have no tables: keep the local ones for its CSV sources
+        vectorstore.tables.copy_to(version.tables, keep=set(manifest))
+    # CSV sources without a table are left out of the manifest, so the next ingest reloads them
+    loaded = version.tables.get_stats()
+    missing = [key for key in manifest if key.lower().endswith(".csv") and key not in loaded]
+    if missing:
+        logger.warning("Snapshot CSV sources have no table, left for the next ingest", files=len(missing))
+        manifest = {key: entry for key, entry in manifest.items() if key not in missing}
+    save_manifest(version, manifest)
+    for dropped in vectorstore.promote(version.physical_name):
+        remove_version_files(vectorstore, dropped)
+    return version
@@ -0,0 +1,155 @@
+"""
+AITI Assistant - Multi-Tenant Support
+Per-tenant configuration and lazily loaded vector stores.
+"""
+
+import json
+import threading
+from typing import Dict, Optional
+from pydantic import BaseModel, Field
+import structlog
+
+from app.config import settings
+
+logger = structlog.get_logger()
+
+DEFAULT_TENANT_ID = "default"
+DEFAULT_COLLECTION = "aiti_documents"
+
+
+class TenantConfig(BaseModel):
+    """Configuration for a single tenant (client company)."""
+    id: str
+    api_key: Optional[str] = None
+    company_name: str = Field(default_factory=lambda: settings.company_name)
+    system_prompt: str = Field(default_factory=lambda: settings.system_prompt)
+    collection: str = DEFAULT_COLLECTION
+    top_k_results: int = Field(default_factory=lambda: settings.top_k_results)
+    confidence_threshold: float = Field(default_factory=lambda: settings.confidence_threshold)
+    confidence_precheck: bool = Field(default_factory=lambda: settings.confidence_precheck)
+
+    @property
+    def formatted_system_prompt(self) -> str:
+        """Get system prompt with company name inserted."""
+        return self.system_prompt.replace("{company}", self.company_name)
+
+
+def default_tenant() -> TenantConfig:
+    """Tenant built from the global settings (single-tenant mode)."""
+    return TenantConfig(id=DEFAULT_TENANT_ID)
+
+
+def load_tenants(path: Optional[str] = None) -> Dict[str, TenantConfig]:
+    """
+    Load tenant configurations from a JSON file.
+
+    The file maps tenant IDs to their settings, e.g.
+    {"acme": {"api_key": "...", "company_name": "ACME", "collection": "acme_documents"}}
+    Missing fields fall back to the global settings.
+
+    Args:
+        path: Path to the tenants file (defaults to TENANTS_FILE)
+
+    Returns:
+        Dictionary of tenant ID to TenantConfig
+    """
+    path = path or settings.tenants_file
+    if not path:
+        return {}
+
+    with open(path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+
+    tenants = {}
+    for tenant_id, values in raw.items():
+        values = dict(values)
+        values.setdefault("collection", f"{tenant_id}_documents")
+        tenants[tenant_id] = TenantConfig(id=tenant_id, **values)
+
+    logger.info("Tenants loaded", path=path, count=len(tenants))
+    return tenants
+
+
+class TenantRegistry:
+    """
+    Resolves tenants and lazily opens their vector stores.
+
+    Vector stores are only opened when a tenant receives traffic and then
+    kept: every store shares the process's single Chroma system (one per
+    persist directory), so dropping a store would free almost nothing and
+    closing its client would stop the other tenants' as well. Index memory is
+    bounded by Chroma's LRU segment cache instead, sized by
+    TENANT_MEMORY_BUDGET_MB (see VectorStore).
+
+    Only the chat endpoints resolve tenants; documents, bulk upserts and
+    the Telegram bot use the default collection, so tenant collections are
+    filled with `python -m app.ingest --tenant`.
+    """
+
+    def __init__(
+        self,
+        tenants: Optional[Dict[str, TenantConfig]] = None,
+        default_vectorstore=None
+    ):
+        """
+        Initialize the registry.
+
+        Args:
+            tenants: Tenant configurations (defaults to load_tenants())
+            default_vectorstore: Shared vector store for the default tenant
+        """
+        self.tenants = tenants if tenants is not None else load_tenants()
+        self.default = default_tenant()
+        self.default_vectorstore = default_vectorstore
+
+        self._by_api_key = {t.api_key: t for t in self.tenants.values() if t.api_key}
+        self._stores: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def resolve(
+        self,
+        tenant_id: Optional[str] = None,
+        api_key: Optional[str] = None
+    ) -> TenantConfig:
+        """
+        Select the tenant for a request.
+
+        An API key matching a tenant wins. Otherwise the tenant ID header is
+        used, which is only accepted for tenants without an API key.
+
+        Raises:
+            KeyError: If the tenant ID is unknown
+            PermissionError: If the tenant requires an API key
+        """
+        if api_key and api_key in self._by_api_key:
+            return self._by_api_key[api_key]
+
+        if not tenant_id or tenant_id == DEFAULT_TENANT_ID:
+            return self.default
+
+        tenant = self.tenants.get(tenant_id)
+        if tenant is None:
+            raise KeyError(tenant_id)
+        if tenant.api_key:
+            raise PermissionError(tenant_id)
+        return tenant
+
+    def get_vectorstore(self, tenant: TenantConfig):
+        """Get the vector store for a tenant, loading it on first use."""
+        if tenant.id == DEFAULT_TENANT_ID and self.default_vectorstore is not None:
+            return self.default_vectorstore
+
+        with self._lock:
+            if tenant.id not in self._stores:
+                from app.rag.vectorstore import VectorStore
+                self._stores[tenant.id] = VectorStore(collection_name=tenant.collection)
+                logger.info("Tenant vector store loaded", tenant=tenant.id, collection=tenant.collection)
+            return self._stores[tenant.id]
+
+    def get_stats(self) -> Dict[str, object]:
+        """Get statistics about configured and loaded tenants."""
+        return {
+            "configured": len(self.tenants),
+            "loaded": list(self._stores.keys()),
+            "segment_cache_limit_bytes": settings.tenant_memory_budget_mb * 1024 * 1024
+        }
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark do chunker: implementação actual vs. a anterior (por caracteres).
+Executa: python3 bench_chunker.py --size-mb 4
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+from typing import List
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.ingest import chunk_text, get_encoding
+
+
+def legacy_chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]:
+    """Chunker anterior: janelas de caracteres com rfind de separadores."""
+    if len(text) <= chunk_size:
+        return [text]
+
+    chunks = []
+    start = 0
+
+    while start < len(text):
+        end = start + chunk_size
+
+        if end < len(text):
+            for sep in [". ", ".\n", "? ", "!\n"]:
+                last_sep = text[start:end].rfind(sep)
+                if last_sep > chunk_size * 0.5:
+                    end = start + last_sep + len(sep)
+                    break
+
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+
+        start = end - overlap
+        if start < 0:
+            start = 0
+
+    return chunks
+
+
+def build_corpus(size_mb: float) -> str:
+    """Gerar texto em português com abreviaturas, números e parágrafos."""
+    sample_dir = Path(__file__).parent / "data" / "demo"
+    seed = "\n\n".join(p.read_text(encoding="utf-8") for p in sorted(sample_dir.glob("*.txt")))
+    seed += (
+        "\n\nO Sr. Silva e a Dra. Costa confirmaram o art. 5.º do contrato. "
+        "O preço é de 29.90 € por unidade, conforme a pág. 3 do catálogo. "
+        "Pode contactar-nos pelo tel. 210 000 000, etc. Obrigado!\n"
+    )
+    target = int(size_mb * 1024 * 1024)
+    return (seed * (target // len(seed) + 1))[:target]
+
+
+def bench(name: str, func, text: str, repeat: int) -> None:
+    """Executar e mostrar tempo, throughput e chunks gerados."""
+    best = float("inf")
+    chunks = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        chunks = func(text)
+        best = min(best, time.perf_counter() - started)
+
+    mb = len(text.encode("utf-8")) / 1024 / 1024
+    # Texto total nos chunks / texto original (overlap e repetições)
+    expansion = sum(len(chunk) for chunk in chunks) / max(len(text), 1)
+    print(
+        f"   {name:<10} {best * 1000:9.1f} ms   {mb / best:7.2f} MB/s   "
+        f"{len(chunks):7d} chunks   expansão {expansion:.2f}x"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do chunker")
+    parser.add_argument("--size-mb", type=float, nargs="+", default=[1, 4], help="Tamanhos do texto em MB")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetições (conta a melhor)")
+    args = parser.parse_args()
+
+    print("\n" + "=" * 60)
+    print("⏱️  AITI Assistant - Benchmark do Chunker")
+    print("=" * 60)
+    tokens = "tiktoken" if get_encoding() is not None else "estimativa (tiktoken indisponível)"
+    print(f"   Contagem de tokens: {tokens}")
+
+    for size_mb in args.size_mb:
+        text = build_corpus(size_mb)
+        print(f"\n📄 {size_mb} MB")
+        bench("anterior", legacy_chunk_text, text, args.repeat)
+        bench("actual", chunk_text, text, args.repeat)
+
+    print("\n" + "=" * 60 + "\n")
+
+
+if __name__ == "__main__":
+    main()
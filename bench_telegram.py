@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Harness local do bot Telegram: modo webhook vs. polling, contra uma Bot API falsa.
+Executa: python3 bench_telegram.py --users 20 --messages 10 --latency-ms 300
+
+Cada utilizador simulado envia uma mensagem, espera pela resposta final e
+envia a seguinte. No modo webhook os updates são enviados por POST para a
+rota /api/telegram/webhook (com o secret token); no modo polling são
+entregues pelo getUpdates da Bot API falsa.
+"""
+
+import os
+import sys
+import time
+import json
+import socket
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Dict, List
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, str(Path(__file__).parent))
+
+FAKE_TOKEN = "123456:HARNESS"
+SECRET = "harness-secret"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Webhook vs. polling do bot Telegram")
+    parser.add_argument("--users", type=int, default=20, help="Utilizadores simultâneos")
+    parser.add_argument("--messages", type=int, default=10, help="Mensagens por utilizador")
+    parser.add_argument("--latency-ms", type=int, default=300, help="Duração simulada de cada resposta do LLM")
+    parser.add_argument("--rag", action="store_true", help="Usar o RAGChain real (requer chaves e índice)")
+    parser.add_argument("--mode", choices=["webhook", "polling", "both"], default="both")
+    return parser.parse_args()
+
+
+args = parse_args()
+API_PORT, WEBHOOK_PORT = free_port(), free_port()
+os.environ.update({
+    "TELEGRAM_BOT_TOKEN": FAKE_TOKEN,
+    "TELEGRAM_API_URL": f"http://127.0.0.1:{API_PORT}/bot",
+    "TELEGRAM_WEBHOOK_URL": f"http://127.0.0.1:{WEBHOOK_PORT}/api/telegram/webhook",
+    "TELEGRAM_WEBHOOK_SECRET": SECRET,
+    "TELEGRAM_STATE_PATH": os.path.join(tempfile.mkdtemp(), "telegram_state.db"),
+})
+
+import logging
+import httpx
+import uvicorn
+import structlog
+from fastapi import FastAPI, Request
+from telegram import Update
+
+from app.api import telegram as telegram_api
+from app.bot.telegram import PLACEHOLDER_TEXT, STREAM_CURSOR, build_application
+
+# Só avisos e erros: os logs por mensagem distorcem a medição
+structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+
+
+class SimulatedChain:
+    """Resposta em streaming com a latência de um LLM, sem chamadas externas."""
+
+    def __init__(self, latency_ms: int):
+        self.latency = latency_ms / 1000
+
+    def query(self, query, mode="standard", conversation_history=None, on_text=None):
+        words = f"Resposta simulada à pergunta '{query}', com algumas frases de texto.".split()
+        text = ""
+        for word in words:
+            time.sleep(self.latency / len(words))
+            text += word + " "
+            if on_text:
+                on_text(text)
+        return {"response": text.strip(), "confidence": 0.9, "escalate": False, "sources": []}
+
+
+class FakeBotAPI:
+    """Bot API mínima: getUpdates, sendMessage, editMessageText e afins."""
+
+    def __init__(self):
+        self.app = FastAPI()
+        self.pending: List[dict] = []
+        self.new_update = asyncio.Event()
+        self.waiters: Dict[int, asyncio.Future] = {}
+        self.message_id = 0
+        self.app.add_api_route("/bot{token}/{method}", self.handle, methods=["POST"])
+
+    def deliver(self, update: dict) -> None:
+        """Queue an update for getUpdates."""
+        self.pending.append(update)
+        self.new_update.set()
+
+    def wait_answer(self, chat_id: int) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[chat_id] = future
+        return future
+
+    def _message(self, chat_id: int, text: str, message_id: int = None) -> dict:
+        if message_id is None:
+            self.message_id += 1
+            message_id = self.message_id
+        return {"message_id": message_id, "date": int(time.time()), "chat": {"id": chat_id, "type": "private"}, "text": text}
+
+    def _answered(self, chat_id: int, text: str) -> None:
+        if text == PLACEHOLDER_TEXT or text.endswith(STREAM_CURSOR):
+            return
+        future = self.waiters.pop(chat_id, None)
+        if future and not future.done():
+            future.set_result(time.perf_counter())
+
+    async def handle(self, token: str, method: str, request: Request):
+        form = await request.form()
+        params = {}
+        for key, value in form.items():
+            try:
+                params[key] = json.loads(value)
+            except (TypeError, ValueError):
+                params[key] = value
+
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Harness", "username": "harness_bot"}
+        elif method == "getUpdates":
+            offset = int(params.get("offset") or 0)
+            self.pending = [u for u in self.pending if u["update_id"] >= offset]
+            if not self.pending:
+                self.new_update.clear()
+                try:
+                    await asyncio.wait_for(self.new_update.wait(), timeout=float(params.get("timeout") or 0))
+                except asyncio.TimeoutError:
+                    pass
+            result = list(self.pending)
+        elif method == "sendMessage":
+            chat_id = int(params["chat_id"])
+            result = self._message(chat_id, params["text"])
+            self._answered(chat_id, params["text"])
+        elif method == "editMessageText":
+            chat_id = int(params["chat_id"])
+            result = self._message(chat_id, params["text"], int(params["message_id"]))
+            self._answered(chat_id, params["text"])
+        else:
+            result = True
+        return {"ok": True, "result": result}
+
+
+def make_update(update_id: int, user_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+            "text": text
+        }
+    }
+
+
+async def serve(app: FastAPI, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    server.install_signal_handlers = lambda: None
+    server.task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server
+
+
+async def shutdown(server: uvicorn.Server) -> None:
+    server.should_exit = True
+    await server.task
+
+
+async def run_users(fake: FakeBotAPI, send) -> Dict[str, float]:
+    """Closed loop: each user waits for the answer before the next message."""
+    latencies: List[float] = []
+    counter = iter(range(1, 10 ** 9))
+
+    async def user(user_id: int) -> None:
+        for k in range(args.messages):
+            answer = fake.wait_answer(user_id)
+            sent = time.perf_counter()
+            await send(make_update(next(counter), user_id, f"Pergunta {k + 1}"))
+            latencies.append(await asyncio.wait_for(answer, timeout=120) - sent)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(1000 + i) for i in range(args.users)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "answers": len(latencies),
+        "seconds": round(elapsed, 2),
+        "answers_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000)
+    }
+
+
+def make_chain():
+    if args.rag:
+        from app.rag.chain import RAGChain
+        from app.rag.vectorstore import VectorStore
+        return RAGChain(VectorStore())
+    return SimulatedChain(args.latency_ms)
+
+
+async def bench_webhook(fake: FakeBotAPI) -> Dict[str, float]:
+    application = await telegram_api.start_webhook_bot(make_chain())
+    web = FastAPI()
+    web.include_router(telegram_api.router, prefix="/api")
+    web.state.telegram = application
+    server = await serve(web, WEBHOOK_PORT)
+    url = os.environ["TELEGRAM_WEBHOOK_URL"]
+
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=100)) as client:
+        rejected = await client.post(url, json=make_update(0, 1, "x"), headers={telegram_api.SECRET_TOKEN_HEADER: "wrong"})
+        print(f"   Secret token inválido: HTTP {rejected.status_code}")
+
+        async def send(update: dict) -> None:
+            response = await client.post(url, json=update, headers={telegram_api.SECRET_TOKEN_HEADER: SECRET})
+            response.raise_for_status()
+
+        result = await run_users(fake, send)
+
+    await shutdown(server)
+    await telegram_api.stop_webhook_bot(application)
+    return result
+
+
+async def bench_polling(fake: FakeBotAPI) -> Dict[str, float]:
+    application = build_application(make_chain())
+    await application.initialize()
+    await application.start()
+    await application.updater.start_polling(poll_interval=0.0, timeout=10, allowed_updates=Update.ALL_TYPES)
+
+    async def send(update: dict) -> None:
+        fake.deliver(update)
+
+    result = await run_users(fake, send)
+    await application.updater.stop()
+    await telegram_api.stop_webhook_bot(application)
+    return result
+
+
+async def main():
+    print("\n" + "=" * 60)
+    print("🤖 Bot Telegram - webhook vs. polling")
+    print(f"   {args.users} utilizadores x {args.messages} mensagens, "
+          f"{'RAG real' if args.rag else f'LLM simulado ({args.latency_ms}ms)'}")
+    print("=" * 60)
+
+    fake = FakeBotAPI()
+    api_server = await serve(fake.app, API_PORT)
+    results = {}
+    for mode in (["webhook", "polling"] if args.mode == "both" else [args.mode]):
+        print(f"\n▶️  {mode}")
+        results[mode] = await (bench_webhook(fake) if mode == "webhook" else bench_polling(fake))
+        print("   " + "  ".join(f"{k}={v}" for k, v in results[mode].items()))
+    # Acordar getUpdates pendentes antes de parar a Bot API falsa
+    fake.new_update.set()
+    await shutdown(api_server)
+
+    if len(results) == 2:
+        w, p = results["webhook"], results["polling"]
+        print(f"\n📊 Webhook: {w['answers_per_second'] / p['answers_per_second']:.2f}x o débito do polling, "
+              f"p50 {w['p50_ms']}ms vs {p['p50_ms']}ms")
+    print("\nNota: a Bot API falsa é local; em produção o polling soma a latência de rede de cada getUpdates.\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())